@@ -0,0 +1,214 @@
+"""
+bench_api.py
+
+bot_api的压测: 启动go-cqhttp模拟服务器, 在不同并发数下调用主要的发送和查询API,
+统计吞吐量、延迟分位数和每次调用的内存分配, 结果写入JSON文件; 提供基准文件时与之比较, 退化超过容差时返回1
+
+    python benchmark/bench_api.py --output bench.json
+    python benchmark/bench_api.py --output new.json --baseline bench.json --tolerance 0.2
+
+模拟服务器默认与压测在同一进程中运行, 二者共享GIL, 高并发下的吞吐量偏低;
+可以先单独启动mock_gocqhttp.py, 再用--server指定其地址。
+在机器人目录(有config.json)下运行时使用其中的配置, 否则在临时目录中生成最小配置;
+压测期间数据库不可用, 发送类API不会写入数据库
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+CWD = os.getcwd()
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if not os.path.exists('config.json'):
+    os.chdir(tempfile.mkdtemp(prefix='bench_api_'))
+    with open('config.json', 'w') as file:
+        json.dump({
+            'go-cqhttp': {'server': {'host': '127.0.0.1', 'port': 5700}},
+            'database': {'available': False, 'host': '', 'user': '', 'password': ''}
+        }, file)
+
+from mock_gocqhttp import MockGoCqHttp  # noqa: E402
+import bot_api  # noqa: E402
+from bot_config import config  # noqa: E402
+from bot_transport import HttpTransport, Transport  # noqa: E402
+
+# 压测的用例: 名称 -> 发起一次调用的函数, 参数为调用序号
+CASES = {
+    'SendGroupMsg': lambda i: bot_api.SendGroupMsg(100000 + i % 50, f'benchmark message {i}'),
+    'SendPrivateMsg': lambda i: bot_api.SendPrivateMsg(10000 + i % 50, f'benchmark message {i}'),
+    'GetGroupInfo': lambda i: bot_api.GetGroupInfo(100000 + i % 50, True),
+    'GetGroupInfo(cached)': lambda i: bot_api.GetGroupInfo(100000 + i % 50),
+    'GetGroupMemberInfo': lambda i: bot_api.GetGroupMemberInfo(100000 + i % 50, 10000 + i % 500, True),
+    'GetGroupMemberList': lambda i: bot_api.GetGroupMemberList(100000 + i % 50, True),
+    'SetGroupBan': lambda i: bot_api.SetGroupBan(100000 + i % 50, 10000 + i % 500, 60),
+}
+
+
+def percentile(values: list[float], q: float) -> float:
+    """
+    计算分位数, 取最近的秩
+    :param values: 已排序的数据
+    :param q: 0到1之间的分位
+    :return: 分位数
+    """
+    return values[min(len(values) - 1, int(q * len(values)))] if values else 0.0
+
+
+def measure_allocations(call, calls: int) -> dict:
+    """
+    单线程调用calls次, 用tracemalloc统计每次调用的内存分配
+    :param call: 用例函数
+    :param calls: 调用次数
+    :return: 每次调用的峰值分配字节数和调用结束后仍保留的字节数
+    """
+    call(0)
+    tracemalloc.start()
+    peak = 0
+    start, _ = tracemalloc.get_traced_memory()
+    for i in range(calls):
+        tracemalloc.reset_peak()
+        before, _ = tracemalloc.get_traced_memory()
+        call(i)
+        _, high = tracemalloc.get_traced_memory()
+        peak += high - before
+    end, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {'alloc_peak_bytes': peak / calls, 'retained_bytes': (end - start) / calls}
+
+
+def run_case(call, calls: int, concurrency: int) -> dict:
+    """
+    以指定并发数调用calls次
+    :param call: 用例函数
+    :param calls: 调用次数
+    :param concurrency: 并发线程数
+    :return: 吞吐量、延迟分位数和错误数
+    """
+    def timed(i: int) -> tuple[float, bool]:
+        start = time.perf_counter()
+        try:
+            error = call(i).json.get('retcode') != 0
+        except Exception:
+            error = True
+        return time.perf_counter() - start, error
+
+    for i in range(concurrency):
+        call(i)
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        start = time.perf_counter()
+        results = list(executor.map(timed, range(calls)))
+        elapsed = time.perf_counter() - start
+    latencies = sorted(latency for latency, _ in results)
+    return {
+        'calls': calls,
+        'errors': sum(error for _, error in results),
+        'throughput': calls / elapsed,
+        'p50_ms': percentile(latencies, 0.5) * 1000,
+        'p95_ms': percentile(latencies, 0.95) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'max_ms': latencies[-1] * 1000,
+    }
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    """
+    与基准结果比较
+    :param results: 本次结果
+    :param baseline: 基准结果
+    :param tolerance: 容差, 如0.2表示吞吐量下降或p95延迟上升超过20%视为退化
+    :return: 退化的描述
+    """
+    rev = []
+    for key, current in results['results'].items():
+        previous = baseline.get('results', {}).get(key)
+        if previous is None:
+            continue
+        if current['throughput'] < previous['throughput'] * (1 - tolerance):
+            rev.append(f'{key}: 吞吐量 {previous["throughput"]:.0f} -> {current["throughput"]:.0f}/s')
+        if current['p95_ms'] > previous['p95_ms'] * (1 + tolerance):
+            rev.append(f'{key}: p95 {previous["p95_ms"]:.2f} -> {current["p95_ms"]:.2f}ms')
+    return rev
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='bot_api压测')
+    parser.add_argument('--calls', type=int, default=2000, help='每个用例每个并发数的调用次数')
+    parser.add_argument('--concurrency', default='1,4,16,64', help='逗号分隔的并发数')
+    parser.add_argument('--cases', default=','.join(CASES), help='逗号分隔的用例')
+    parser.add_argument('--server', help='已启动的模拟服务器地址, 如127.0.0.1:5700, 默认在本进程中启动')
+    parser.add_argument('--latency', type=float, default=0, help='模拟服务器每个请求的延迟秒数')
+    parser.add_argument('--jitter', type=float, default=0, help='模拟服务器随机增加的最大延迟秒数')
+    parser.add_argument('--error-rate', type=float, default=0, help='模拟服务器返回失败响应的概率')
+    parser.add_argument('--payload', type=int, default=256, help='模拟服务器查询类响应的填充字节数')
+    parser.add_argument('--backlog', type=int, default=512, help='模拟服务器的监听队列长度')
+    parser.add_argument('--alloc-calls', type=int, default=200, help='统计内存分配时的调用次数')
+    parser.add_argument('--output', default='bench_api.json', help='结果文件')
+    parser.add_argument('--baseline', help='用于比较的基准结果文件')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='比较时允许的退化比例')
+    args = parser.parse_args()
+
+    levels = [int(level) for level in args.concurrency.split(',')]
+    config['database']['available'] = False
+    server = None
+    if args.server:
+        host, port = args.server.rsplit(':', 1)
+    else:
+        server = MockGoCqHttp(
+            latency=args.latency, jitter=args.jitter, error_rate=args.error_rate, payload=args.payload,
+            backlog=args.backlog
+        ).start()
+        host, port = server.address
+    Transport.set_instance(HttpTransport(host, port, pool_size=max(levels)))
+
+    results = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'time': int(time.time()),
+        'server': f'{host}:{port}',
+        'mock': None if server is None else {
+            'latency': args.latency, 'jitter': args.jitter, 'error_rate': args.error_rate, 'payload': args.payload,
+            'backlog': args.backlog
+        },
+        'results': {},
+        'allocations': {},
+    }
+    for name in args.cases.split(','):
+        call = CASES[name]
+        bot_api.cache.clear()
+        results['allocations'][name] = measure_allocations(call, args.alloc_calls)
+        for level in levels:
+            result = run_case(call, args.calls, level)
+            results['results'][f'{name}@{level}'] = result
+            print('{:<24} c={:<3} {:>8.0f}/s  p50 {:>7.2f}ms  p95 {:>7.2f}ms  p99 {:>7.2f}ms  errors {}'.format(
+                name, level, result['throughput'], result['p50_ms'], result['p95_ms'], result['p99_ms'],
+                result['errors']
+            ))
+        allocations = results['allocations'][name]
+        print('{:<24} 每次调用分配峰值 {:.0f}B, 保留 {:.0f}B'.format(
+            name, allocations['alloc_peak_bytes'], allocations['retained_bytes']
+        ))
+    if server is not None:
+        server.stop()
+    Transport.set_instance(None)
+
+    output = os.path.join(CWD, args.output)
+    with open(output, 'w') as file:
+        json.dump(results, file, indent=2, ensure_ascii=False)
+    print(f'结果已写入 {output}')
+
+    if args.baseline:
+        with open(os.path.join(CWD, args.baseline)) as file:
+            regressions = compare(results, json.load(file), args.tolerance)
+        for regression in regressions:
+            print('退化: ' + regression)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
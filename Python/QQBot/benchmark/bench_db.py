@@ -0,0 +1,188 @@
+"""
+bench_db.py
+
+bot_db的压测: 在权限管理和消息记录两条路径上统计每次操作与数据库服务器的往返次数、显式提交次数和耗时,
+每个用例先按改动前的方式(每条语句后提交、先查询再插入或更新、消息逐批转义插入并提交)执行一次作为对照
+
+    python benchmark/bench_db.py --calls 500
+
+需要在机器人目录(有config.json且数据库可用)下运行, database.backend为sqlite时不需要数据库服务器。
+权限管理使用从--user-base开始的QQ号并在结束时删除; 消息记录写入临时创建的bench_message表, 结束时删除该表
+"""
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bot_db  # noqa: E402
+from bot_right import Right  # noqa: E402
+from bot_metrics import metrics  # noqa: E402
+from bot_config import config  # noqa: E402
+
+
+class LegacyDataBase(object):
+    """
+    改动前的语句执行方式, 作为对照: 每条语句借出连接执行后立即提交, SELECT也不例外
+    :param db: 提供存储后端的bot_db.DataBase
+    """
+
+    def __init__(self, db: bot_db.DataBase):
+        self.pool = db.pool
+
+    def execute(self, sql: str, params=None) -> tuple[tuple[..., ...], ...]:
+        """
+        执行语句并提交
+        :param sql: 语句, 参数用%s或%(name)s占位
+        :param params: 参数的元组或字典
+        :return: 语句执行结果
+        """
+        def run(cursor) -> tuple[tuple[..., ...], ...]:
+            if params is None:
+                cursor.execute(sql)
+            else:
+                cursor.execute(self.pool.translate(sql), params)
+            return tuple(cursor.fetchall())
+
+        return self.__commit(run)
+
+    def executemany(self, sql: str, rows: list) -> None:
+        """
+        用多组参数执行同一条语句并提交
+        :param sql: 语句, 参数用%s占位
+        :param rows: 参数的列表
+        """
+        self.__commit(lambda cursor: cursor.executemany(self.pool.translate(sql), rows))
+
+    def __commit(self, run):
+        """
+        借出连接, 在游标上执行run后立即提交
+        :param run: 参数为游标的函数
+        :return: run的返回值
+        """
+        connection = self.pool.acquire()
+        broken = False
+        try:
+            cursor = connection.cursor()
+            try:
+                rows = run(cursor)
+            finally:
+                cursor.close()
+            connection.commit()
+            metrics.increment('db_round_trips_total', 1, '与数据库服务器的往返次数')
+            metrics.increment('db_commits_total', 1, '提交的事务数')
+            return rows
+        except self.pool.Error as err:
+            broken = self.pool.is_broken(err)
+            raise
+        finally:
+            self.pool.release(connection, broken)
+
+    def set_right(self, right: int, user_id: int) -> None:
+        """
+        改动前的Right.set_right: 先查询是否存在, 存在则更新, 不存在则插入
+        """
+        if len(self.execute('SELECT * FROM `right` WHERE user_id=%s', (user_id,))) == 0:
+            self.execute('INSERT INTO `right` VALUES (%s, null, %s)', (user_id, right))
+        else:
+            self.execute('UPDATE `right` SET `right`=%s WHERE user_id=%s', (right, user_id))
+
+    def insert_messages(self, table: str, columns: tuple[str, ...], rows: list, max_rows: int) -> None:
+        """
+        改动前BatchWriter的写入方式: 每max_rows行执行并提交一次, MySQL转义为多行INSERT语句,
+        SQLite不能使用MySQL的转义规则, 改为参数化的executemany
+        """
+        for i in range(0, len(rows), max_rows):
+            if self.pool.literal_insert:
+                for statement in bot_db.insert_statements(table, columns, rows[i:i + max_rows]):
+                    self.execute(statement)
+            else:
+                placeholders = ', '.join(['%s'] * len(columns))
+                self.executemany(
+                    f'insert into {table} ({", ".join(columns)}) VALUES ({placeholders})', rows[i:i + max_rows]
+                )
+
+
+def counters() -> tuple[float, float]:
+    """
+    :return: 目前为止的往返次数和提交次数
+    """
+    values = metrics.to_dict()['counters']
+    return values.get('db_round_trips_total', 0), values.get('db_commits_total', 0)
+
+
+def run(name: str, call, calls: int) -> None:
+    """
+    调用calls次并输出平均每次的往返次数、提交次数和耗时
+    :param name: 用例名称
+    :param call: 用例函数, 参数为调用序号
+    :param calls: 调用次数
+    """
+    round_trips, commits = counters()
+    start = time.perf_counter()
+    for i in range(calls):
+        call(i)
+    elapsed = time.perf_counter() - start
+    round_trips, commits = (after - before for after, before in zip(counters(), (round_trips, commits)))
+    print('{:<28} 往返 {:>6.2f}  提交 {:>6.2f}  耗时 {:>7.3f}ms'.format(
+        name, round_trips / calls, commits / calls, elapsed / calls * 1000
+    ))
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='bot_db压测')
+    parser.add_argument('--calls', type=int, default=500, help='每个用例的调用次数')
+    parser.add_argument('--messages', type=int, default=20000, help='消息记录用例写入的消息数')
+    parser.add_argument('--user-base', type=int, default=9000000000, help='权限管理用例使用的起始QQ号')
+    args = parser.parse_args()
+    if not config['database']['available']:
+        print('config.json中的数据库不可用')
+        return 1
+
+    right = Right()
+    db = right.db
+    legacy = LegacyDataBase(db)
+    users = range(args.user_base, args.user_base + args.calls)
+
+    def clear_users() -> None:
+        db.update('DELETE FROM `right` WHERE user_id BETWEEN %s AND %s', (users[0], users[-1]))
+
+    try:
+        clear_users()
+        run('get_right(改动前)', lambda i: legacy.execute(
+            'SELECT `right` FROM `right` WHERE user_id=%s', (users[i],)
+        ), args.calls)
+        run('get_right', lambda i: right.get_right(users[i]), args.calls)
+        run('set_right(新用户, 改动前)', lambda i: legacy.set_right(right.user, users[i]), args.calls)
+        clear_users()
+        run('set_right(新用户)', lambda i: right.set_right(right.user, users[i]), args.calls)
+        run('set_right(已有用户, 改动前)', lambda i: legacy.set_right(right.test, users[i]), args.calls)
+        run('set_right(已有用户)', lambda i: right.set_right(right.test, users[i]), args.calls)
+    finally:
+        clear_users()
+
+    columns = ('message_id', 'user_id', 'group_id', 'message')
+    messages = [(i, 10000 + i % 300, 100000, f'benchmark message {i}') for i in range(args.messages)]
+    db.update('CREATE TABLE IF NOT EXISTS bench_message AS SELECT * FROM message WHERE 1=0')
+    try:
+        writer = bot_db.BatchWriter('bench_message', columns)
+        name = f'消息记录({args.messages}条'
+        run(name + ', 改动前)', lambda _: legacy.insert_messages('bench_message', columns, messages, writer.max_rows), 1)
+        db.update('DELETE FROM bench_message')
+
+        def log_messages(_) -> None:
+            for message in messages:
+                writer.put(*message)
+            writer.close()
+
+        run(name + ')', log_messages, 1)
+        written = db.execute('SELECT COUNT(*) FROM bench_message')
+        print(f'bench_message中的行数: {written[0][0] if written else 0}')
+    finally:
+        db.update('DROP TABLE IF EXISTS bench_message')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
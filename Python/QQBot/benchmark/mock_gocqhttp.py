@@ -0,0 +1,149 @@
+"""
+mock_gocqhttp.py
+
+用于压测的go-cqhttp模拟服务器, 只实现HTTP API, 延迟、错误率和响应大小可以配置
+
+    python mock_gocqhttp.py --port 5700 --latency 0.005 --error-rate 0.01 --payload 1024
+"""
+import json
+import time
+import socket
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class MockGoCqHttp(object):
+    """
+    go-cqhttp模拟服务器, 在后台线程中运行
+
+    send_开头的终结点返回递增的message_id, 其它终结点返回带有payload字节填充内容的data;
+    按error_rate的概率返回retcode为100的失败响应
+    :param host: 监听地址
+    :param port: 监听端口, 0为随机端口
+    :param latency: 每个请求的处理延迟秒数
+    :param jitter: 在latency上随机增加的最大秒数
+    :param error_rate: 返回失败响应的概率
+    :param payload: 查询类响应中填充内容的字节数
+    :param backlog: 监听队列长度, socketserver默认的5在高并发建连时会丢弃SYN, 使客户端等待1秒后重传
+    """
+
+    def __init__(
+            self, host: str = '127.0.0.1', port: int = 0, latency: float = 0, jitter: float = 0,
+            error_rate: float = 0, payload: int = 256, backlog: int = 512
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.payload = payload
+        self.requests = 0
+        self.__message_id = 0
+        self.__lock = threading.Lock()
+        self.__server = ThreadingHTTPServer((host, port), self.__handler(), bind_and_activate=False)
+        self.__server.daemon_threads = True
+        self.__server.request_queue_size = backlog
+        try:
+            self.__server.server_bind()
+            self.__server.server_activate()
+        except OSError:
+            self.__server.server_close()
+            raise
+        self.__thread: threading.Thread | None = None
+
+    @property
+    def address(self) -> tuple[str, int]:
+        """
+        实际监听的地址和端口
+        """
+        return self.__server.server_address[:2]
+
+    def response(self, action: str, params: dict) -> dict:
+        """
+        生成终结点的响应数据
+        :param action: 终结点名称
+        :param params: 请求参数
+        :return: 响应数据
+        """
+        with self.__lock:
+            self.requests += 1
+            self.__message_id += 1
+            message_id = self.__message_id
+        if self.error_rate and random.random() < self.error_rate:
+            return {'status': 'failed', 'retcode': 100, 'msg': 'MOCK_ERROR', 'wording': '模拟的错误', 'data': None}
+        if action.startswith('send_'):
+            data = {'message_id': message_id}
+        elif action == 'get_group_member_list':
+            data = [
+                {'group_id': params.get('group_id'), 'user_id': 10000 + i, 'nickname': f'member{i}', 'card': '',
+                 'role': 'member', 'join_time': 0}
+                for i in range(max(1, self.payload // 100))
+            ]
+        else:
+            data = dict(params, padding='x' * self.payload)
+        return {'status': 'ok', 'retcode': 0, 'data': data}
+
+    def __handler(self) -> type[BaseHTTPRequestHandler]:
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def setup(self):
+                super().setup()
+                self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                params = json.loads(self.rfile.read(length) or b'{}')
+                delay = mock.latency + (random.uniform(0, mock.jitter) if mock.jitter else 0)
+                if delay:
+                    time.sleep(delay)
+                body = json.dumps(mock.response(self.path.strip('/'), params)).encode()
+                # 响应头和响应体一次写出, 避免Nagle算法和延迟确认造成的停顿
+                self.wfile.write(
+                    b'HTTP/1.1 200 OK\r\nContent-Type: application/json\r\nContent-Length: %d\r\n\r\n' % len(body)
+                    + body
+                )
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def start(self) -> 'MockGoCqHttp':
+        """
+        在后台线程中开始服务
+        :return: 自身
+        """
+        self.__thread = threading.Thread(target=self.__server.serve_forever, name='mock-gocqhttp', daemon=True)
+        self.__thread.start()
+        return self
+
+    def stop(self) -> None:
+        """
+        停止服务
+        """
+        self.__server.shutdown()
+        self.__server.server_close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='go-cqhttp模拟服务器')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5700)
+    parser.add_argument('--latency', type=float, default=0, help='每个请求的延迟秒数')
+    parser.add_argument('--jitter', type=float, default=0, help='随机增加的最大延迟秒数')
+    parser.add_argument('--error-rate', type=float, default=0, help='返回失败响应的概率')
+    parser.add_argument('--payload', type=int, default=256, help='查询类响应的填充字节数')
+    parser.add_argument('--backlog', type=int, default=512, help='监听队列长度')
+    args = parser.parse_args()
+    server = MockGoCqHttp(
+        args.host, args.port, args.latency, args.jitter, args.error_rate, args.payload, args.backlog
+    ).start()
+    print('go-cqhttp模拟服务器运行于 http://{}:{}/'.format(*server.address))
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
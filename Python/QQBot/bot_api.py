@@ -2,67 +2,243 @@
 GOCQHTTP的大部分API
 https://docs.go-cqhttp.org/api/#api
 """
-import requests
+import time
+import threading
 import bot_db
 from re import sub
-from pymysql.converters import escape_string
+from collections import OrderedDict
+from bot_metrics import metrics
+from bot_transport import Transport
 from bot_config import config
 
 
+class ResponseCache(object):
+    """
+    只读查询的响应缓存, 过期时间由各API类的cache_ttl决定, 超出容量时淘汰最久未使用的条目
+
+    缓存键为类名加除no_cache以外的全部参数, 传入no_cache=True时不读取缓存, 但会用新的响应更新缓存。
+    返回的响应数据是共享的, 不要修改
+    :param max_size: 最多缓存的响应数
+    """
+
+    def __init__(self, max_size: int = 1024):
+        self.max_size = max_size
+        self.__entries: OrderedDict[tuple, tuple[float, dict]] = OrderedDict()
+        self.__hits: dict[str, int] = {}
+        self.__misses: dict[str, int] = {}
+        self.__lock = threading.Lock()
+
+    @staticmethod
+    def __key(name: str, data: dict) -> tuple:
+        return name, tuple(item for item in data.items() if item[0] != 'no_cache')
+
+    def lookup(self, api_cls: type['API'], data: dict) -> dict | None:
+        """
+        查询缓存
+        :param api_cls: API类
+        :param data: 请求参数
+        :return: 未过期的响应数据, 不可缓存或未命中时返回None
+        """
+        if not api_cls.cache_ttl or data.get('no_cache'):
+            return None
+        name = api_cls.__name__
+        key = self.__key(name, data)
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self.__entries.move_to_end(key)
+                self.__hits[name] = self.__hits.get(name, 0) + 1
+                return entry[1]
+            if entry is not None:
+                del self.__entries[key]
+            self.__misses[name] = self.__misses.get(name, 0) + 1
+        return None
+
+    def update(self, api_cls: type['API'], data: dict, response: dict) -> None:
+        """
+        请求成功后更新缓存: 缓存可缓存的响应, 并使该操作影响到的缓存失效
+        :param api_cls: API类
+        :param data: 请求参数
+        :param response: 响应数据
+        """
+        if response.get('retcode') != 0:
+            return
+        if api_cls.cache_ttl:
+            key = self.__key(api_cls.__name__, data)
+            with self.__lock:
+                self.__entries[key] = (time.monotonic() + api_cls.cache_ttl, response)
+                self.__entries.move_to_end(key)
+                while len(self.__entries) > self.max_size:
+                    self.__entries.popitem(last=False)
+        for target, names in api_cls.invalidates:
+            self.invalidate(target, **{name: data[name] for name in names})
+
+    def invalidate(self, api_cls: type['API'], **params) -> int:
+        """
+        使某个API类中参数与params一致的缓存失效, 不提供params时使该类的全部缓存失效
+        :param api_cls: API类
+        :param params: 需要匹配的参数
+        :return: 失效的条目数
+        """
+        name = api_cls.__name__
+        with self.__lock:
+            keys = [
+                key for key in self.__entries
+                if key[0] == name and all(item in key[1] for item in params.items())
+            ]
+            for key in keys:
+                del self.__entries[key]
+        return len(keys)
+
+    def clear(self) -> None:
+        """
+        清空缓存和计数
+        """
+        with self.__lock:
+            self.__entries.clear()
+            self.__hits.clear()
+            self.__misses.clear()
+
+    def stats(self) -> dict:
+        """
+        获取缓存统计
+        :return: 一个字典, 包含总命中数hits、总未命中数misses、当前条目数size, 以及endpoints中每个类的(命中数, 未命中数)
+        """
+        with self.__lock:
+            return {
+                'hits': sum(self.__hits.values()),
+                'misses': sum(self.__misses.values()),
+                'size': len(self.__entries),
+                'endpoints': {
+                    name: (self.__hits.get(name, 0), self.__misses.get(name, 0))
+                    for name in self.__hits.keys() | self.__misses.keys()
+                }
+            }
+
+
+cache = ResponseCache(config['go-cqhttp'].get('cache_size', 1024))
+
+
 class API(object):
     """
     GOCQHTTP的大部分API
     https://docs.go-cqhttp.org/api/#api
+
+    action: 该类对应的终结点名称, 子类没有指定时在定义时由类名生成
+
+    cache_ttl: 响应缓存的秒数, 0表示不缓存, 只应在只读查询上设置
+
+    invalidates: 请求成功后需要失效的缓存, 每项为(API类, 用于匹配的参数名元组)
+
+    idempotent: 重复请求是否安全, 只有幂等的终结点会在连接失败或超时后重试; 子类没有指定时,
+    get_、can_、check_开头的查询视为幂等
     """
-    count: int
+    action: str = ''
+    cache_ttl: float = 0
+    idempotent: bool = False
+    invalidates: tuple[tuple[type['API'], tuple[str, ...]], ...] = ()
+    endpoints: dict[str, str] = {}  # 类名 -> 终结点名称
+    actions: dict[str, type['API']] = {}  # 终结点名称 -> 类
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if 'action' not in cls.__dict__:
+            cls.action = API.to_action(cls.__name__)
+        if 'idempotent' not in cls.__dict__:
+            cls.idempotent = cls.action.lstrip('._').startswith(('get_', 'can_', 'check_'))
+        API.endpoints[cls.__name__] = cls.action
+        API.actions[cls.action] = cls
 
     def __init__(self, api: str, data: dict):
-        data.pop('self')
-        data.pop('__class__')
+        del data['self'], data['__class__']
         self.api = api
         self.data = data
-        self.response = requests.post(
-            url='http://{}:{}/{}'.format(
-                config["go-cqhttp"]["server"]["host"],
-                config["go-cqhttp"]["server"]["port"],
-                sub(r"(?P<key>[A-Z])", r"_\g<key>", api).lower()[1:]  # 把大驼峰命名的类名转化为小写字母加下划线分隔
-            ).encode(),
-            json=data
-        )
-        self.json = self.response.json()
+        self.json = API.call(API.endpoints[api], **data)
+        if self.json.get('retcode') == 0:
+            self._on_response()
+
+    @staticmethod
+    def call(action: str, **params) -> dict:
+        """
+        调用任意终结点并返回响应数据, 不创建API实例, 所有API类最终都通过这里发送请求
+
+        action对应某个API类时同样会使用该类的缓存和重试设置
+        :param action: 终结点名称, 如send_group_msg
+        :param params: 请求参数
+        :return: go-cqhttp的响应数据
+        :raise TransportError: 与go-cqhttp通信失败, 或熔断器处于打开状态
+        """
+        api_cls = API.actions.get(action, API)
+        response = cache.lookup(api_cls, params)
+        if response is None:
+            start = time.perf_counter()
+            try:
+                response = Transport.instance().request(action, params, api_cls.idempotent)
+            except Exception:
+                metrics.observe(action, time.perf_counter() - start, True)
+                raise
+            metrics.observe(action, time.perf_counter() - start, response.get('retcode') != 0)
+            cache.update(api_cls, params, response)
+        return response
+
+    @staticmethod
+    def to_action(api: str) -> str:
+        """
+        把大驼峰命名的类名转化为小写字母加下划线分隔的终结点名称
+        :param api: 类名
+        :return: 终结点名称
+        """
+        return sub(r"(?P<key>[A-Z])", r"_\g<key>", api).lower()[1:]
+
+    def _on_response(self) -> None:
+        """
+        收到成功的响应后的处理, 由需要的子类重写, 只能使用self.data和self.json;
+        bot_async_api在事件循环中直接调用, 不能阻塞
+        """
 
     @classmethod
-    def get_count_dict(cls):
+    def walk(cls):
         """
-        获取每个子类的count计数，返回键值对
-        :return: 一个字典，键为子类名，值为count计数
+        遍历全部子类, 包括子类的子类
+        :return: 子类的生成器, 先父类后子类
         """
-        count_dict = {}
         for sub_cls in cls.__subclasses__():
-            count_dict.update({sub_cls.__name__: sub_cls.count})
-        return count_dict
+            yield sub_cls
+            yield from sub_cls.walk()
+
+    @classmethod
+    def get_count(cls) -> int:
+        """
+        获取该类及其全部子类向go-cqhttp发出的请求数, 命中缓存的调用不计入
+        :return: 请求数
+        """
+        return sum(metrics.calls(action) for action in {sub_cls.action for sub_cls in (cls, *cls.walk())})
+
+    @classmethod
+    def get_count_dict(cls):
+        """
+        获取全部子类的请求数, 分类的请求数为其下所有API的请求数之和
+        :return: 一个字典，键为子类名，值为请求数
+        """
+        return {sub_cls.__name__: sub_cls.get_count() for sub_cls in cls.walk()}
 
     @classmethod
     def get_total_count(cls):
         """
-        获取所有子类的count计数总和
-        :return: 计数总和
+        获取所有子类的请求数总和
+        :return: 请求数总和
         """
-        total = 0
-        for sub_cls in cls.__subclasses__():
-            total += sub_cls.count
-        return total
+        return sum(metrics.calls(action) for action in {sub_cls.action for sub_cls in cls.walk()})
 
 
 class BlankApi(API):
     """
     空的API，什么都不做
     """
-    count = 0
+    action = ''
 
     def __init__(self):
-        BlankApi.count += 1
-        super().__init__('', locals())
+        super().__init__(__class__.__name__, locals())
 
 
 class Account(API):
@@ -70,11 +246,6 @@ class Account(API):
     Bot账号
     https://docs.go-cqhttp.org/api/#bot-%E8%B4%A6%E5%8F%B7
     """
-    count = 0
-
-    def __init__(self, api: str, data: dict):
-        Account.count += 1
-        super().__init__(api, data)
 
 
 class GetLoginInfo(Account):
@@ -83,11 +254,11 @@ class GetLoginInfo(Account):
     https://docs.go-cqhttp.org/api/#%E8%8E%B7%E5%8F%96%E7%99%BB%E5%BD%95%E5%8F%B7%E4%BF%A1%E6%81%AF
 
     响应数据: user_id int64 QQ号, nickname string QQ昵称
+    :param no_cache: 是否不使用缓存
     """
-    count = 0
+    cache_ttl = 3600
 
-    def __init__(self):
-        __class__.count += 1
+    def __init__(self, no_cache: bool = False):
         super().__init__(__class__.__name__, locals())
 
 
@@ -103,10 +274,8 @@ class SetQqProfile(Account):
     :param college: 学校
     :param personal_note: 个人说明
     """
-    count = 0
 
     def __init__(self, nickname: str, company: str, email: str, college: str, personal_note: str):
-        __class__.count += 1
         super().__init__(__class__.__name__, locals())
 
 
@@ -118,10 +287,8 @@ class _GetModelShow(Account):
     响应数据: variants array, 其中model_show str, need_pay bool
     :param model: 机型名称
     """
-    count = 0
 
     def __init__(self, model: str):
-        __class__.count += 1
         super().__init__(__class__.__name__, locals())
 
 
@@ -134,10 +301,8 @@ class _SetModelShow(Account):
     :param model: 机型名称
     :param model_show:
     """
-    count = 0
 
     def __init__(self, model: str, model_show: str):
-        __class__.count += 1
         super().__init__(__class__.__name__, locals())
 
 
@@ -151,10 +316,8 @@ class GetOnlineClients(Account):
     Device: app_id int64 客户端ID device_name str 设备名称 device_kind str 设备类型
     :param: no_cache: 是否无视缓存
     """
-    count = 0
 
     def __init__(self, no_cache: bool):
-        __class__.count += 1
         super().__init__(__class__.__name__, locals())
 
 
@@ -163,11 +326,6 @@ class FriendInfo(API):
     好友信息
     https://docs.go-cqhttp.org/api/#%E5%A5%BD%E5%8F%8B%E4%BF%A1%E6%81%AF
     """
-    count = 0
-
-    def __init__(self, api: str, data: dict):
-        FriendInfo.count += 1
-        super().__init__(api, data)
 
 
 class GetStrangerInfo(FriendInfo):
@@ -180,10 +338,9 @@ class GetStrangerInfo(FriendInfo):
     :param user_id: QQ号
     :param no_cache: 是否不使用缓存（使用缓存可能更新不及时, 但响应更快）
     """
-    count = 0
+    cache_ttl = 300
 
     def __init__(self, user_id: int, no_cache: bool = False):
-        __class__.count += 1
         super().__init__(__class__.__name__, locals())
 
 
@@ -193,11 +350,11 @@ class GetFriendList(FriendInfo):
     https://docs.go-cqhttp.org/api/#%E8%8E%B7%E5%8F%96%E5%A5%BD%E5%8F%8B%E5%88%97%E8%A1%A8
 
     响应数据: user_id int QQ号,nickname str 昵称,remark str 备注名
+    :param no_cache: 是否不使用缓存
     """
-    count = 0
+    cache_ttl = 60
 
-    def __init__(self):
-        __class__.count += 1
+    def __init__(self, no_cache: bool = False):
         super().__init__(__class__.__name__, locals())
 
 
@@ -208,10 +365,8 @@ class GetUnidirectionalFriendList(FriendInfo):
 
     响应数据: user_id int QQ号,nickname str 昵称,source str 来源
     """
-    count = 0
 
     def __init__(self):
-        __class__.count += 1
         super().__init__(__class__.__name__, locals())
 
 
@@ -220,11 +375,6 @@ class FriendOperation(API):
     好友操作
     https://docs.go-cqhttp.org/api/#%E5%A5%BD%E5%8F%8B%E6%93%8D%E4%BD%9C
     """
-    count = 0
-
-    def __init__(self, api: str, data: dict):
-        FriendOperation.count += 1
-        super().__init__(api, data)
 
 
 class DeleteFriend(FriendOperation):
@@ -235,10 +385,9 @@ class DeleteFriend(FriendOperation):
     响应数据: 该API无响应数据
     :param user_id: int64,好友QQ号
     """
-    count = 0
+    invalidates = ((GetFriendList, ()),)
 
     def __init__(self, user_id: int):
-        __class__.count += 1
         super().__init__(__class__.__name__, locals())
 
 
@@ -250,10 +399,8 @@ class DeleteUnidirectionalFriend(FriendOperation):
     响应数据: 该API无响应数据
     :param user_id: int64,单向好友QQ号
     """
-    count = 0
 
     def __init__(self, user_id: int):
-        __class__.count += 1
         super().__init__(__class__.__name__, locals())
 
 
@@ -262,11 +409,24 @@ class Message(API):
     消息
     https://docs.go-cqhttp.org/api/#%E6%B6%88%E6%81%AF
     """
-    count = 0
 
-    def __init__(self, api: str, data: dict):
-        Message.count += 1
-        super().__init__(api, data)
+    @staticmethod
+    def writer() -> bot_db.BatchWriter:
+        """
+        :return: message表共享的批量写入
+        """
+        return bot_db.BatchWriter.instance('message', ('message_id', 'user_id', 'group_id', 'message'))
+
+    @staticmethod
+    def save(message_id: int, user_id: int | None, group_id: int | None, message: str) -> None:
+        """
+        把消息交给message表的批量写入, 不等待数据库
+        :param message_id: 消息id
+        :param user_id: 私聊对象或发送者的QQ号
+        :param group_id: 群号
+        :param message: 消息内容
+        """
+        Message.writer().put(message_id, user_id, group_id, message)
 
 
 class SendPrivateMsg(Message):
@@ -280,28 +440,13 @@ class SendPrivateMsg(Message):
     :param group_id: 主动发起临时会话时的来源群号(可选, 机器人本身必须是管理员/群主)
     :param auto_escape: 消息内容是否作为纯文本发送 ( 即不解析 CQ 码 ) , 只在 message 字段是字符串时有效
     """
-    count = 0
 
     def __init__(self, user_id: int, message: str, group_id: int = None, auto_escape: bool = False):
-        __class__.count += 1
-        super().__init__(__class__.__name__, locals())
-        db = bot_db.DataBase(
-            host=config['database']['host'],
-            user=config['database']['user'],
-            password=config['database']['password'],
-            db='bot'
-        )
-        if group_id is None:
-            sql = f'''insert into message
-                        (message_id, user_id, message)
-                        VALUES
-                        ({self.response.json()['data']['message_id']}, {user_id}, '{escape_string(message)}')'''
-        else:
-            sql = f'''insert into message
-                        (message_id, user_id, group_id, message)
-                        VALUES
-                        ({self.response.json()['data']['message_id']}, {user_id}, {group_id}, '{escape_string(message)}')'''
-        db.execute(sql)
+        super().__init__(__class__.__name__, locals())
+
+    def _on_response(self) -> None:
+        user_id, group_id, message = self.data['user_id'], self.data['group_id'], self.data['message']
+        Message.save(self.json['data']['message_id'], user_id, group_id, message)
 
 
 class SendGroupMsg(Message):
@@ -314,21 +459,12 @@ class SendGroupMsg(Message):
     :param message: 要发送的内容
     :param auto_escape: 消息内容是否作为纯文本发送 ( 即不解析 CQ 码 ) , 只在 message 字段是字符串时有效
     """
-    count = 0
 
     def __init__(self, group_id: int, message: str, auto_escape: bool = False):
-        __class__.count += 1
         super().__init__(__class__.__name__, locals())
-        db = bot_db.DataBase(
-            host=config['database']['host'],
-            user=config['database']['user'],
-            password=config['database']['password'],
-            db='bot'
-        )
-        db.execute(f'''insert into message 
-                (message_id, group_id, message) 
-                VALUES 
-                ({self.response.json()['data']['message_id']}, {group_id}, '{escape_string(message)}')''')
+
+    def _on_response(self) -> None:
+        Message.save(self.json['data']['message_id'], None, self.data['group_id'], self.data['message'])
 
 
 class SendMsg(Message):
@@ -343,32 +479,17 @@ class SendMsg(Message):
     :param message: 要发送的内容
     :param auto_escape: 消息内容是否作为纯文本发送 ( 即不解析 CQ 码 ) , 只在 message 字段是字符串时有效
     """
-    count = 0
 
     def __init__(
             self,
             message_type: str, message: str,
             user_id: int = None, group_id: int = None, auto_escape: bool = False
     ):
-        __class__.count += 1
-        super().__init__(__class__.__name__, locals())
-        db = bot_db.DataBase(
-            host=config['database']['host'],
-            user=config['database']['user'],
-            password=config['database']['password'],
-            db='bot'
-        )
-        if group_id is None:
-            sql = f'''insert into message 
-                (message_id, user_id, message) 
-                VALUES 
-                ({self.response.json()['data']['message_id']}, {user_id}, '{escape_string(message)}')'''
-        else:
-            sql = f'''insert into message 
-                (message_id, group_id, message) 
-                VALUES 
-                ({self.response.json()['data']['message_id']}, {group_id}, '{escape_string(message)}')'''
-        db.execute(sql)
+        super().__init__(__class__.__name__, locals())
+
+    def _on_response(self) -> None:
+        user_id, group_id, message = self.data['user_id'], self.data['group_id'], self.data['message']
+        Message.save(self.json['data']['message_id'], user_id if group_id is None else None, group_id, message)
 
 
 class GetMsg(Message):
@@ -381,10 +502,8 @@ class GetMsg(Message):
     raw_message message 原始消息内容
     :param message_id: 消息id
     """
-    count = 0
 
     def __init__(self, message_id: int):
-        __class__.count += 1
         super().__init__(__class__.__name__, locals())
 
 
@@ -396,10 +515,8 @@ class DeleteMsg(Message):
     响应数据: 该 API 无响应数据
     :param message_id: 消息 ID
     """
-    count = 0
 
     def __init__(self, message_id: int):
-        __class__.count += 1
         super().__init__(__class__.__name__, locals())
 
 
@@ -411,10 +528,8 @@ class MarkMsgAsRead(Message):
     响应数据: 该 API 无响应数据
     :param message_id: 消息 ID
     """
-    count = 0
 
     def __init__(self, message_id: int):
-        __class__.count += 1
         super().__init__(__class__.__name__, locals())
 
 
@@ -426,10 +541,8 @@ class GetForwardMsg(Message):
     响应数据: messages forward message[] 消息列表
     :param message_id: 消息id
     """
-    count = 0
 
     def __init__(self, message_id: int):
-        __class__.count += 1
         super().__init__(__class__.__name__, locals())
 
 
@@ -444,10 +557,8 @@ class SendGroupForwardMsg(Message):
     :param group_id: 群号
     :param messages: 自定义转发消息, 具体看 CQcode
     """
-    count = 0
 
     def __init__(self, group_id: int, messages):
-        __class__.count += 1
         super().__init__(__class__.__name__, locals())
 
 
@@ -462,10 +573,8 @@ class SendPrivateForwardMsg(Message):
     :param user_id: 好友QQ号
     :param messages: 自定义转发消息, 具体看 CQcode
     """
-    count = 0
 
     def __init__(self, user_id: int, messages):
-        __class__.count += 1
         super().__init__(__class__.__name__, locals())
 
 
@@ -478,10 +587,8 @@ class GetGroupMsgHistory(Message):
     :param message_seq: 起始消息序号, 可通过 get_msg 获得, 不提供起始序号将默认获取最新的消息
     :param group_id: 群号
     """
-    count = 0
 
     def __init__(self, group_id: int, message_seq: int = None):
-        __class__.count += 1
         super().__init__(__class__.__name__, locals())
 
 
@@ -490,11 +597,6 @@ class Image(API):
     图片
     https://docs.go-cqhttp.org/api/#%E5%9B%BE%E7%89%87
     """
-    count = 0
-
-    def __init__(self, api: str, data: dict):
-        Image.count += 1
-        super().__init__(api, data)
 
 
 class GetImage(Image):
@@ -505,10 +607,8 @@ class GetImage(Image):
     响应数据: size	int32	图片源文件大小, filename	string	图片文件原名, url	string	图片下载地址
     :param file: 图片缓存文件名
     """
-    count = 0
 
     def __init__(self, file: str):
-        __class__.count += 1
         super().__init__(__class__.__name__, locals())
 
 
@@ -519,10 +619,8 @@ class CanSendImage(Image):
 
     响应数据: yes boolean 是或否
     """
-    count = 0
 
     def __init__(self):
-        __class__.count += 1
         super().__init__(__class__.__name__, locals())
 
 
@@ -536,10 +634,8 @@ class OcrImage(Image):
     TextDetection: text string 文本, confidence int32 置信度, coordinates vector2[] 坐标
     :param image: 图片ID
     """
-    count = 0
 
     def __init__(self, image: str):
-        __class__.count += 1
         super().__init__(__class__.__name__, locals())
 
 
@@ -548,11 +644,6 @@ class Voice(API):
     语音
     https://docs.go-cqhttp.org/api/#%E8%AF%AD%E9%9F%B3
     """
-    count = 0
-
-    def __init__(self, api: str, data: dict):
-        Voice.count += 1
-        super().__init__(api, data)
 
 
 class CanSendRecord(Voice):
@@ -562,10 +653,8 @@ class CanSendRecord(Voice):
 
     响应数据: yes boolean 是或否
     """
-    count = 0
 
     def __init__(self):
-        __class__.count += 1
         super().__init__(__class__.__name__, locals())
 
 
@@ -574,11 +663,6 @@ class Handle(API):
     处理
     https://docs.go-cqhttp.org/api/#%E5%A4%84%E7%90%86
     """
-    count = 0
-
-    def __init__(self, api: str, data: dict):
-        Handle.count += 1
-        super().__init__(api, data)
 
 
 class SetFriendAddRequest(Handle):
@@ -591,10 +675,8 @@ class SetFriendAddRequest(Handle):
     :param approve: 是否同意请求
     :param remark: 添加后的好友备注（仅在同意时有效）
     """
-    count = 0
 
     def __init__(self, flag: str, approve: bool = True, remark: str = ''):
-        __class__.count += 1
         super().__init__(__class__.__name__, locals())
 
 
@@ -609,10 +691,8 @@ class SetGroupAddRequest(Handle):
     :param approve: 是否同意请求／邀请
     :param reason: 拒绝理由（仅在拒绝时有效）
     """
-    count = 0
 
     def __init__(self, flag: str, sub_type: str, approve: bool = True, reason: str = ''):
-        __class__.count += 1
         super().__init__(__class__.__name__, locals())
 
 
@@ -621,11 +701,6 @@ class GroupInfo(API):
     群信息
     https://docs.go-cqhttp.org/api/#%E7%BE%A4%E4%BF%A1%E6%81%AF
     """
-    count = 0
-
-    def __init__(self, api: str, data: dict):
-        GroupInfo.count += 1
-        super().__init__(api, data)
 
 
 class GetGroupInfo(GroupInfo):
@@ -640,10 +715,9 @@ class GetGroupInfo(GroupInfo):
     :param group_id: 群号
     :param no_cache: 是否不使用缓存（使用缓存可能更新不及时, 但响应更快）
     """
-    count = 0
+    cache_ttl = 60
 
     def __init__(self, group_id: int, no_cache: bool = False):
-        __class__.count += 1
         super().__init__(__class__.__name__, locals())
 
 
@@ -655,10 +729,9 @@ class GetGroupList(GroupInfo):
     响应数据: 响应内容为 json 数组, 每个元素和上面的 get_group_info 接口相同。
     :param no_cache: 是否不使用缓存（使用缓存可能更新不及时, 但响应更快）
     """
-    count = 0
+    cache_ttl = 60
 
     def __init__(self, no_cache: bool = False):
-        __class__.count += 1
         super().__init__(__class__.__name__, locals())
 
 
@@ -676,10 +749,9 @@ class GetGroupMemberInfo(GroupInfo):
     :param user_id: QQ 号
     :param no_cache: 是否不使用缓存（使用缓存可能更新不及时, 但响应更快）
     """
-    count = 0
+    cache_ttl = 60
 
     def __init__(self, group_id: int, user_id: int, no_cache: bool = False):
-        __class__.count += 1
         super().__init__(__class__.__name__, locals())
 
 
@@ -694,10 +766,9 @@ class GetGroupMemberList(GroupInfo):
     :param group_id: 群号
     :param no_cache: 是否不使用缓存（使用缓存可能更新不及时, 但响应更快）
     """
-    count = 0
+    cache_ttl = 60
 
     def __init__(self, group_id: int, no_cache: bool = False):
-        __class__.count += 1
         super().__init__(__class__.__name__, locals())
 
 
@@ -717,10 +788,8 @@ class GetGroupHonorInfo(GroupInfo):
     :param group_id: 群号
     :param type: 要获取的群荣誉类型,可传入talkative,performer,legend,strong_newbie,emotion以分别获取单个类型的群荣誉数据,或传入all获取所有数据
     """
-    count = 0
 
     def __init__(self, group_id: int, type: str):
-        __class__.count += 1
         super().__init__(__class__.__name__, locals())
 
 
@@ -738,10 +807,8 @@ class GetGroupSystemMsg(GroupInfo):
     JoinRequest: request_id int64 请求ID, requester_uin int64 请求者ID, requester_nick str 请求者昵称,
     message str 验证消息, group_id int64 群号, group_name str 群名, checked bool 是否已被处理, actor int64 处理者, 未处理为0
     """
-    count = 0
 
     def __init__(self):
-        __class__.count += 1
         super().__init__(__class__.__name__, locals())
 
 
@@ -755,10 +822,8 @@ class GetEssenceMsgList(GroupInfo):
     , message_id int32 消息ID
     :param group_id: 群号
     """
-    count = 0
 
     def __init__(self, group_id: int):
-        __class__.count += 1
         super().__init__(__class__.__name__, locals())
 
 
@@ -771,10 +836,8 @@ class GetGroupAtAllRemain(GroupInfo):
     remain_at_all_count_for_uin int16 Bot 当天剩余 @全体成员 次数
     :param group_id: 群号
     """
-    count = 0
 
     def __init__(self, group_id: int):
-        __class__.count += 1
         super().__init__(__class__.__name__, locals())
 
 
@@ -783,12 +846,6 @@ class GroupSetting(API):
     群设置
     https://docs.go-cqhttp.org/api/#%E7%BE%A4%E8%AE%BE%E7%BD%AE
     """
-    count = 0
-
-    def __init__(self, api: str, data: dict):
-        GroupInfo.count += 1
-        __class__.count += 1
-        super().__init__(api, data)
 
 
 class SetGroupName(GroupSetting):
@@ -800,10 +857,9 @@ class SetGroupName(GroupSetting):
     :param group_id: 群号
     :param group_name: 新群名
     """
-    count = 0
+    invalidates = ((GetGroupInfo, ('group_id',)), (GetGroupList, ()))
 
     def __init__(self, group_id: int, group_name: str):
-        __class__.count += 1
         super().__init__(__class__.__name__, locals())
 
 
@@ -829,10 +885,8 @@ class SetGroupPortrait(GroupSetting):
     :param file: 图片文件名
     :param cache: 表示是否使用已缓存的文件
     """
-    count = 0
 
     def __init__(self, group_id: int, file: str, cache: int = 1):
-        __class__.count += 1
         super().__init__(__class__.__name__, locals())
 
 
@@ -846,10 +900,9 @@ class SetGroupAdmin(GroupSetting):
     :param user_id: 要设置管理员的 QQ 号
     :param enable: true 为设置, false 为取消
     """
-    count = 0
+    invalidates = ((GetGroupMemberInfo, ('group_id', 'user_id')), (GetGroupMemberList, ('group_id',)))
 
     def __init__(self, group_id: int, user_id: int, enable: bool = True):
-        __class__.count += 1
         super().__init__(__class__.__name__, locals())
 
 
@@ -863,10 +916,9 @@ class SetGroupCard(GroupSetting):
     :param user_id: 要设置的 QQ 号
     :param card: 群名片内容, 不填或空字符串表示删除群名片
     """
-    count = 0
+    invalidates = ((GetGroupMemberInfo, ('group_id', 'user_id')), (GetGroupMemberList, ('group_id',)))
 
     def __init__(self, group_id: int, user_id: int, card: str = ''):
-        __class__.count += 1
         super().__init__(__class__.__name__, locals())
 
 
@@ -881,10 +933,9 @@ class SetGroupSpecialTitle(GroupSetting):
     :param special_title: 专属头衔, 不填或空字符串表示删除专属头衔
     :param duration: 专属头衔有效期, 单位秒, -1 表示永久, 不过此项似乎没有效果, 可能是只有某些特殊的时间长度有效, 有待测试
     """
-    count = 0
+    invalidates = ((GetGroupMemberInfo, ('group_id', 'user_id')), (GetGroupMemberList, ('group_id',)))
 
     def __init__(self, group_id: int, user_id: int, special_title: str = '', duration: int = -1):
-        __class__.count += 1
         super().__init__(__class__.__name__, locals())
 
 
@@ -893,11 +944,6 @@ class GroupOperation(API):
     群操作
     https://docs.go-cqhttp.org/api/#%E7%BE%A4%E6%93%8D%E4%BD%9C
     """
-    count = 0
-
-    def __init__(self, api: str, data: dict):
-        GroupOperation.count += 1
-        super().__init__(api, data)
 
 
 class SetGroupBan(GroupOperation):
@@ -910,10 +956,8 @@ class SetGroupBan(GroupOperation):
     :param user_id: 要禁言的 QQ 号
     :param duration: 禁言时长, 单位秒, 0 表示取消禁言
     """
-    count = 0
 
     def __init__(self, group_id: int, user_id: int, duration: int = 1800):
-        __class__.count += 1
         super().__init__(__class__.__name__, locals())
 
 
@@ -926,10 +970,8 @@ class SetGroupWholeBan(GroupOperation):
     :param group_id: 群号
     :param enable: 是否禁言
     """
-    count = 0
 
     def __init__(self, group_id: int, enable: bool = True):
-        __class__.count += 1
         super().__init__(__class__.__name__, locals())
 
 
@@ -946,10 +988,8 @@ class SetGroupAnonymousBan(GroupOperation):
     :param anonymous_flag: 可选, 要禁言的匿名用户的 flag（需从群消息上报的数据中获得）
     :param duration: 禁言时长, 单位秒, 无法取消匿名用户禁言
     """
-    count = 0
 
     def __init__(self, group_id: int, duration: int = 1800, anonymous: dict = None, anonymous_flag: str = ''):
-        __class__.count += 1
         super().__init__(__class__.__name__, locals())
 
 
@@ -961,10 +1001,8 @@ class SetEssenceMsg(GroupOperation):
     响应数据: 该 API 无响应数据
     :param message_id: 消息 ID
     """
-    count = 0
 
     def __init__(self, message_id: int):
-        __class__.count += 1
         super().__init__(__class__.__name__, locals())
 
 
@@ -976,10 +1014,8 @@ class DeleteEssenceMsg(GroupOperation):
     响应数据: 该 API 无响应数据
     :param message_id: 消息 ID
     """
-    count = 0
 
     def __init__(self, message_id: int):
-        __class__.count += 1
         super().__init__(__class__.__name__, locals())
 
 
@@ -991,10 +1027,8 @@ class SendGroupSign(GroupOperation):
     响应数据: 该 API 无响应数据
     :param group_id: 群号
     """
-    count = 0
 
     def __init__(self, group_id: int):
-        __class__.count += 1
         super().__init__(__class__.__name__, locals())
 
 
@@ -1008,10 +1042,8 @@ class _SendGroupNotice(GroupOperation):
     :param content: 公告内容
     :param image: 图片路径（可选）
     """
-    count = 0
 
     def __init__(self, group_id: int, content: str, image: str = ''):
-        __class__.count += 1
         super().__init__(__class__.__name__, locals())
 
 
@@ -1027,10 +1059,8 @@ class _GetGroupNotice(GroupOperation):
     images 字段每个元素内容如下: height string 图片高度, width string 图片宽度, id string 图片ID
     :param group_id: 群号
     """
-    count = 0
 
     def __init__(self, group_id: int):
-        __class__.count += 1
         super().__init__(__class__.__name__, locals())
 
 
@@ -1044,10 +1074,13 @@ class SetGroupKick(GroupOperation):
     :param user_id: 要踢的 QQ 号
     :param reject_add_request: 拒绝此人的加群请求
     """
-    count = 0
+    invalidates = (
+        (GetGroupMemberInfo, ('group_id', 'user_id')),
+        (GetGroupMemberList, ('group_id',)),
+        (GetGroupInfo, ('group_id',)),
+    )
 
     def __init__(self, group_id: int, user_id: int, reject_add_request: bool = False):
-        __class__.count += 1
         super().__init__(__class__.__name__, locals())
 
 
@@ -1060,10 +1093,9 @@ class SetGroupLeave(GroupOperation):
     :param group_id: 群号
     :param is_dismiss: 是否解散, 如果登录号是群主, 则仅在此项为 true 时能够解散
     """
-    count = 0
+    invalidates = ((GetGroupInfo, ('group_id',)), (GetGroupList, ()), (GetGroupMemberList, ('group_id',)))
 
     def __init__(self, group_id: int, is_dismiss: bool = False):
-        __class__.count += 1
         super().__init__(__class__.__name__, locals())
 
 
@@ -1072,11 +1104,6 @@ class File(API):
     文件
     https://docs.go-cqhttp.org/api/#%E6%96%87%E4%BB%B6
     """
-    count = 0
-
-    def __init__(self, api: str, data: dict):
-        File.count += 1
-        super().__init__(api, data)
 
 
 class UploadGroupFile(File):
@@ -1092,10 +1119,8 @@ class UploadGroupFile(File):
     :param name: 储存名称
     :param folder: 父目录ID
     """
-    count = 0
 
     def __init__(self, group_id: int, file: str, name: str, folder: str = None):
-        __class__.count += 1
         super().__init__(__class__.__name__, locals())
 
 
@@ -1109,10 +1134,8 @@ class DeleteGroupFile(File):
     :param file_id: 文件ID 参考 File 对象
     :param busid: 文件类型 参考 File 对象
     """
-    count = 0
 
     def __init__(self, group_id: int, file_id: str, busid: int):
-        __class__.count += 1
         super().__init__(__class__.__name__, locals())
 
 
@@ -1126,10 +1149,8 @@ class CreateGroupFileFolder(File):
     :param name: 文件夹名称
     :param parent_id: 仅能为 /
     """
-    count = 0
 
     def __init__(self, group_id: int, name: str, parent_id: str = '/'):
-        __class__.count += 1
         super().__init__(__class__.__name__, locals())
 
 
@@ -1142,10 +1163,8 @@ class DeleteGroupFolder(File):
     :param group_id: 群号
     :param folder_id: 文件夹ID 参考 File 对象
     """
-    count = 0
 
     def __init__(self, group_id: int, folder_id: str):
-        __class__.count += 1
         super().__init__(__class__.__name__, locals())
 
 
@@ -1157,10 +1176,8 @@ class GetGroupFileSystemInfo(File):
     响应数据: file_count int32 文件总数, limit_count int32 文件上限, used_space int64 已使用空间, total_space int64 空间上限
     :param group_id: 群号
     """
-    count = 0
 
     def __init__(self, group_id: int):
-        __class__.count += 1
         super().__init__(__class__.__name__, locals())
 
 
@@ -1179,10 +1196,8 @@ class GetGroupRootFiles(File):
     creator int64 创建者, creator_name string 创建者名字, total_file_count int32 子文件数量
     :param group_id: 群号
     """
-    count = 0
 
     def __init__(self, group_id: int):
-        __class__.count += 1
         super().__init__(__class__.__name__, locals())
 
 
@@ -1202,10 +1217,8 @@ class GetGroupFilesByFolder(File):
     :param group_id: 群号
     :param folder_id: 文件夹ID 参考 Folder 对象
     """
-    count = 0
 
     def __init__(self, group_id: int, folder_id: str):
-        __class__.count += 1
         super().__init__(__class__.__name__, locals())
 
 
@@ -1219,10 +1232,8 @@ class GetGroupFileUrl(File):
     :param file_id: 文件ID 参考 File 对象
     :param busid: 文件类型 参考 File 对象
     """
-    count = 0
 
     def __init__(self, group_id: int, file_id: str, busid: int):
-        __class__.count += 1
         super().__init__(__class__.__name__, locals())
 
 
@@ -1238,10 +1249,8 @@ class UploadPrivateFile(File):
     :param file: 本地文件路径
     :param name: 文件名称
     """
-    count = 0
 
     def __init__(self, user_id: int, file: str, name: str):
-        __class__.count += 1
         super().__init__(__class__.__name__, locals())
 
 
@@ -1250,11 +1259,6 @@ class GoCqHttpRelated(API):
     Go-CqHttp 相关
     https://docs.go-cqhttp.org/api/#go-cqhttp-%E7%9B%B8%E5%85%B3
     """
-    count = 0
-
-    def __init__(self, api: str, data: dict):
-        GoCqHttpRelated.count += 1
-        super().__init__(api, data)
 
 
 class GetVersionInfo(GoCqHttpRelated):
@@ -1269,10 +1273,8 @@ class GetVersionInfo(GoCqHttpRelated):
     plugin_build_configuration string release 固定值, runtime_version string, runtime_os string,
     version string 应用版本, 如 v0.9.40-fix4, protocol int 0/1/2/3/-1 当前登陆使用协议类型
     """
-    count = 0
 
     def __init__(self):
-        __class__.count += 1
         super().__init__(__class__.__name__, locals())
 
 
@@ -1291,10 +1293,8 @@ class GetStatus(GoCqHttpRelated):
     MessageReceived uint64 接受信息总数, MessageSent uint64 发送信息总数, DisconnectTimes uint32 TCP 链接断开次数,
     LostTimes uint32 账号掉线次数, LastMessageTime int64 最后一条消息时间
     """
-    count = 0
 
     def __init__(self):
-        __class__.count += 1
         super().__init__(__class__.__name__, locals())
 
 
@@ -1306,10 +1306,8 @@ class ReloadEventFilter(GoCqHttpRelated):
     响应数据: 该API无响应数据
     :param file: 事件过滤器文件
     """
-    count = 0
 
     def __init__(self, file: str):
-        __class__.count += 1
         super().__init__(__class__.__name__, locals())
 
 
@@ -1332,10 +1330,8 @@ class DownloadFile(GoCqHttpRelated):
     :param thread_count: 下载线程数
     :param headers: 自定义请求头
     """
-    count = 0
 
     def __init__(self, url: str, thread_count: int, headers: str | dict):
-        __class__.count += 1
         super().__init__(__class__.__name__, locals())
 
 
@@ -1347,8 +1343,6 @@ class CheckUrlSafely(GoCqHttpRelated):
     响应数据: level int 安全等级, 1: 安全 2: 未知 3: 危险
     :param url: 需要检查的链接
     """
-    count = 0
 
     def __init__(self, url: str):
-        __class__.count += 1
         super().__init__(__class__.__name__, locals())
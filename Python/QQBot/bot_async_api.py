@@ -0,0 +1,82 @@
+"""
+bot_async_api.py
+
+bot_api中所有API的异步版本, 基于aiohttp
+
+本模块中的类由bot_api中的同名类自动生成, 终结点名称和参数与同步版本完全一致, 例如:
+
+    response = await bot_async_api.SendGroupMsg(group_id, 'hello')
+    message_id = response.json['data']['message_id']
+"""
+import time
+import inspect
+import bot_api
+from bot_metrics import metrics
+from bot_transport import AsyncTransport
+
+
+class AsyncAPI(object):
+    """
+    异步API基类, 实例化时只校验参数, await时才发送请求, await的结果是实例本身
+    """
+    sync: type[bot_api.API] = bot_api.API
+    signature: inspect.Signature
+
+    def __init__(self, *args, **kwargs):
+        bound = self.signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        self.api = self.sync.__name__
+        self.data = dict(bound.arguments)
+        self.json = None
+
+    def __await__(self):
+        return self.__request().__await__()
+
+    @staticmethod
+    async def call(action: str, **params) -> dict:
+        """
+        异步调用任意终结点并返回响应数据, 与bot_api.API.call相同
+        :param action: 终结点名称, 如send_group_msg
+        :param params: 请求参数
+        :return: go-cqhttp的响应数据
+        """
+        api_cls = bot_api.API.actions.get(action, bot_api.API)
+        response = bot_api.cache.lookup(api_cls, params)
+        if response is None:
+            start = time.perf_counter()
+            try:
+                response = await AsyncTransport.instance().request(action, params, api_cls.idempotent)
+            except Exception:
+                metrics.observe(action, time.perf_counter() - start, True)
+                raise
+            metrics.observe(action, time.perf_counter() - start, response.get('retcode') != 0)
+            bot_api.cache.update(api_cls, params, response)
+        return response
+
+    async def __request(self) -> 'AsyncAPI':
+        self.json = await AsyncAPI.call(self.sync.action, **self.data)
+        if self.json.get('retcode') == 0:
+            # _on_response只把消息放入BatchWriter的缓冲区, 不等待数据库, 直接在事件循环中调用
+            self.sync._on_response(self)
+        return self
+
+
+def _mirror(sync_cls: type[bot_api.API], async_base: type[AsyncAPI]) -> None:
+    """
+    为sync_cls的每个子类生成对应的异步类, 并放入本模块的命名空间
+    :param sync_cls: 同步API类
+    :param async_base: sync_cls对应的异步类
+    """
+    for sub_cls in sync_cls.__subclasses__():
+        signature = inspect.signature(sub_cls.__init__)
+        async_cls = type(sub_cls.__name__, (async_base,), {
+            '__doc__': sub_cls.__doc__,
+            '__module__': __name__,
+            'sync': sub_cls,
+            'signature': signature.replace(parameters=tuple(signature.parameters.values())[1:])
+        })
+        globals()[sub_cls.__name__] = async_cls
+        _mirror(sub_cls, async_cls)
+
+
+_mirror(bot_api.API, AsyncAPI)
@@ -0,0 +1,274 @@
+"""
+bot_async_db.py
+
+bot_db.DataBase的异步版本, 基于aiomysql, 在事件循环中直接await数据库操作而不需要切换到线程池, 例如:
+
+    db = AsyncDataBase(host, user, password, 'bot')
+    rows = await db.execute('SELECT `right` FROM `right` WHERE user_id=%s', (user_id,))
+    async with db.transaction():
+        if await db.update('UPDATE ...', params) == 0:
+            await db.update('INSERT ...', params)
+
+连接池与同步版本使用相同的配置项database.pool, 每个事件循环各有一个; 只支持MySQL后端,
+配置文件的database.backend为sqlite时创建AsyncDataBase会抛出ValueError。
+SQLite后端的语句在本地执行, 耗时很短, 可以直接使用bot_db.DataBase
+"""
+import asyncio
+import contextlib
+import contextvars
+import aiomysql
+import pymysql
+from pymysql.constants import CLIENT
+import bot_log
+import bot_db
+from bot_metrics import metrics
+from bot_config import config
+
+
+class AsyncCountingCursor(aiomysql.Cursor):
+    """
+    记录发往服务器的语句数的游标, 与bot_db.CountingCursor共用db_round_trips_total
+    """
+
+    async def _query(self, q):
+        metrics.increment('db_round_trips_total', 1, '与数据库服务器的往返次数')
+        return await super()._query(q)
+
+
+class AsyncDataBase(object):
+    """
+    异步数据库操作, 接口与bot_db.DataBase相同, 方法均为协程
+
+    连接来自按(地址, 用户名, 数据库名, 事件循环)共享的aiomysql连接池, 第一次使用时创建:
+    最少min_size个、最多max_size个连接, 空闲超过idle_timeout秒的连接被回收, 等待连接超过timeout秒抛出bot_db.PoolTimeout。
+    连接为自动提交模式, 多条语句的事务由transaction开始, 事务的连接只属于开始事务的任务
+    :param host: 数据库地址
+    :param user: 数据库用户名
+    :param password: 数据库密码
+    :param db: 数据库名
+    :raise ValueError: 配置文件选择的不是MySQL后端
+    """
+    __pools: dict[tuple, asyncio.Task] = {}
+
+    def __init__(self, host: str, user: str, password: str, db: str):
+        if config['database']['available'] and bot_db.Backend.get_class() is not bot_db.ConnectionPool:
+            raise ValueError(
+                f'AsyncDataBase只支持MySQL后端, 当前为{config["database"]["backend"]}, 请使用bot_db.DataBase'
+            )
+        self.log = bot_log.Log('database')
+        self.host = host
+        self.user = user
+        self.password = password
+        self.db = db
+        self.timeout = config['database'].get('pool', {}).get('timeout', 10)
+        self.__transaction: contextvars.ContextVar[tuple | None] = contextvars.ContextVar(
+            f'transaction-{id(self)}', default=None
+        )
+
+    async def pool(self) -> aiomysql.Pool:
+        """
+        获取当前事件循环的连接池, 第一次调用时创建
+        :return: aiomysql连接池
+        """
+        loop = asyncio.get_running_loop()
+        key = (self.host, self.user, self.db, loop)
+        task = AsyncDataBase.__pools.get(key)
+        if task is None:
+            options = config['database'].get('pool', {})
+            task = loop.create_task(aiomysql.create_pool(
+                minsize=options.get('min_size', 1),
+                maxsize=options.get('max_size', 10),
+                pool_recycle=options.get('idle_timeout', 300),
+                host=self.host, user=self.user, password=self.password, db=self.db, autocommit=True,
+                client_flag=CLIENT.FOUND_ROWS, cursorclass=AsyncCountingCursor
+            ))
+            AsyncDataBase.__pools[key] = task
+        if task.done() and not task.cancelled() and task.exception() is None:
+            return task.result()
+        try:
+            return await asyncio.shield(task)
+        except pymysql.MySQLError:
+            if AsyncDataBase.__pools.get(key) is task:
+                del AsyncDataBase.__pools[key]
+            raise
+
+    async def __acquire(self):
+        pool = await self.pool()
+        if pool.freesize:
+            return await pool.acquire()
+        try:
+            return await asyncio.wait_for(pool.acquire(), self.timeout)
+        except asyncio.TimeoutError:
+            raise bot_db.PoolTimeout(f'等待数据库连接超过{self.timeout}秒') from None
+
+    @staticmethod
+    def __release(pool: aiomysql.Pool, connection, broken: bool) -> None:
+        if broken:
+            connection.close()
+        pool.release(connection)
+
+    def __current(self):
+        """
+        当前任务所在事务的连接, 不在事务中时返回None
+        """
+        transaction = self.__transaction.get()
+        if transaction is not None and transaction[0] is asyncio.current_task():
+            return transaction[1]
+        return None
+
+    @contextlib.asynccontextmanager
+    async def transaction(self):
+        """
+        事务, 在async with块中当前任务通过该对象执行的语句使用同一个连接, 离开时一次提交, 发生异常时回滚。
+        事务中执行失败的语句会抛出pymysql.MySQLError; 事务可以嵌套, 由最外层提交。
+        块中创建的其它任务不属于该事务
+        :return: 自身
+        """
+        if not config['database']['available'] or self.__current() is not None:
+            yield self
+            return
+        pool = await self.pool()
+        connection = await self.__acquire()
+        broken = False
+        token = self.__transaction.set((asyncio.current_task(), connection))
+        try:
+            await connection.begin()
+            metrics.increment('db_round_trips_total', 1, '与数据库服务器的往返次数')
+            yield self
+            await connection.commit()
+            metrics.increment('db_round_trips_total', 1, '与数据库服务器的往返次数')
+            metrics.increment('db_commits_total', 1, '提交的事务数')
+        except BaseException as err:
+            broken = isinstance(err, (pymysql.OperationalError, pymysql.InterfaceError, asyncio.CancelledError))
+            if not broken:
+                try:
+                    await connection.rollback()
+                    metrics.increment('db_round_trips_total', 1, '与数据库服务器的往返次数')
+                except pymysql.MySQLError:
+                    broken = True
+            raise
+        finally:
+            self.__transaction.reset(token)
+            AsyncDataBase.__release(pool, connection, broken)
+
+    async def __run(self, sql: str, run, default):
+        """
+        用await run(cursor)执行; 在事务中时使用事务的连接且失败时抛出异常, 否则借出连接, 失败时返回default
+        """
+        connection = self.__current()
+        if connection is not None:
+            try:
+                async with connection.cursor() as cursor:
+                    rev = await run(cursor)
+            except pymysql.MySQLError as err:
+                self.log.warning(str(err) + '，执行MySQL语句失败：' + sql)
+                raise
+            self.log.info('执行MySQL语句成功：' + sql)
+            return rev
+        try:
+            pool = await self.pool()
+            connection = await self.__acquire()
+        except pymysql.MySQLError as err:
+            self.log.warning(str(err) + '，获取数据库连接失败：' + sql)
+            return default
+        broken = False
+        try:
+            async with connection.cursor() as cursor:
+                rev = await run(cursor)
+                self.log.info('执行MySQL语句成功：' + sql)
+                return rev
+        except pymysql.MySQLError as err:
+            broken = isinstance(err, (pymysql.OperationalError, pymysql.InterfaceError))
+            self.log.warning(str(err) + '，执行MySQL语句失败：' + sql)
+            return default
+        except asyncio.CancelledError:
+            broken = True
+            raise
+        finally:
+            AsyncDataBase.__release(pool, connection, broken)
+
+    async def execute(self, sql: str, params=None) -> tuple[tuple[..., ...], ...]:
+        """
+        执行MySQL语句
+        :param sql: MySQL语句, 参数用%s或%(name)s占位
+        :param params: 参数的元组或字典
+        :return: MySQL语句执行结果
+        """
+        if not config['database']['available']:
+            return ()
+
+        async def run(cursor):
+            await cursor.execute(sql, params)
+            return tuple(await cursor.fetchall())
+
+        return await self.__run(sql, run, ())
+
+    async def update(self, sql: str, params=None) -> int:
+        """
+        执行INSERT、UPDATE、DELETE等语句
+        :param sql: MySQL语句, 参数用%s或%(name)s占位
+        :param params: 参数的元组或字典
+        :return: 匹配的行数, 失败时为0
+        """
+        if not config['database']['available']:
+            return 0
+        return await self.__run(sql, lambda cursor: cursor.execute(sql, params), 0)
+
+    async def executemany(self, sql: str, rows) -> int:
+        """
+        用多组参数执行同一条MySQL语句, INSERT ... VALUES语句由aiomysql合并为多行INSERT
+        :param sql: MySQL语句, 参数用%s或%(name)s占位
+        :param rows: 参数的序列
+        :return: 影响的行数, 失败时为0
+        """
+        if not config['database']['available']:
+            return 0
+
+        async def run(cursor) -> int:
+            return await cursor.executemany(sql, rows) or 0
+
+        return await self.__run(sql, run, 0)
+
+    async def bulk_insert(self, table: str, columns, rows, max_bytes: int = None) -> int:
+        """
+        批量插入, 按字节数把行分成若干条多行INSERT语句, 全部在同一事务中执行
+        :param table: 表名
+        :param columns: 列名
+        :param rows: 行的可迭代对象, 值的顺序与columns相同
+        :param max_bytes: 一条语句的最大字节数, 默认为配置文件的database.max_packet或1MiB
+        :return: 插入的行数, 失败时为0
+        """
+        if not config['database']['available']:
+            return 0
+        statements = bot_db.insert_statements(table, columns, rows, max_bytes)
+        if not statements:
+            return 0
+
+        async def run(cursor) -> int:
+            return sum([await cursor.execute(statement) for statement in statements])
+
+        sql = f'insert into {table} ... ({len(statements)}条语句)'
+        if len(statements) == 1 or self.__current() is not None:
+            return await self.__run(sql, run, 0)
+        try:
+            async with self.transaction():
+                return await self.__run(sql, run, 0)
+        except pymysql.MySQLError:
+            return 0
+
+    @staticmethod
+    async def close() -> None:
+        """
+        关闭当前事件循环的全部连接池, 在事件循环结束前调用
+        """
+        loop = asyncio.get_running_loop()
+        for key, task in list(AsyncDataBase.__pools.items()):
+            if key[3] is not loop:
+                continue
+            del AsyncDataBase.__pools[key]
+            try:
+                pool = await task
+            except pymysql.MySQLError:
+                continue
+            pool.close()
+            await pool.wait_closed()
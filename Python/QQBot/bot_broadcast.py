@@ -0,0 +1,94 @@
+"""
+bot_broadcast.py
+
+向多个群或好友群发消息
+"""
+import time
+from bot_outbox import Outbox, Priority
+from bot_log import Log
+
+
+class BroadcastResult(object):
+    """
+    群发结果
+    :param message_type: group 或 private
+    """
+
+    def __init__(self, message_type: str):
+        self.message_type = message_type
+        self.message_ids: dict[int, int] = {}
+        self.errors: dict[int, str] = {}
+        self.elapsed = 0.0
+
+    @property
+    def succeeded(self) -> int:
+        """
+        发送成功的数量
+        """
+        return len(self.message_ids)
+
+    @property
+    def failed(self) -> int:
+        """
+        发送失败的数量
+        """
+        return len(self.errors)
+
+    def summary(self) -> str:
+        """
+        获取群发结果的摘要
+        :return: 摘要文本
+        """
+        rev = '群发完成: 成功{}个, 失败{}个, 用时{:.2f}秒'.format(self.succeeded, self.failed, self.elapsed)
+        for target, error in self.errors.items():
+            rev += '\n{}: {}'.format(target, error)
+        return rev
+
+
+class Broadcaster(object):
+    """
+    群发消息, 以群发优先级提交到发送队列, 由发送队列负责并发以及全局和每个目标的限流, 以免触发风控
+    :param outbox: 使用的发送队列, 默认为进程内共享的发送队列
+    """
+
+    def __init__(self, outbox: Outbox = None):
+        self.log = Log('broadcast')
+        self.outbox = outbox if outbox is not None else Outbox.instance()
+
+    def send(self, targets, message: str, message_type: str = 'group', auto_escape: bool = False) -> BroadcastResult:
+        """
+        群发消息, 阻塞直到所有目标发送完成
+        :param targets: 群号或QQ号的可迭代对象, 重复的目标只发送一次
+        :param message: 要发送的内容
+        :param message_type: group 为群聊, private 为私聊
+        :param auto_escape: 消息内容是否作为纯文本发送
+        :return: 每个目标的发送结果
+        """
+        if message_type not in ('group', 'private'):
+            raise ValueError('message_type只能是group或private')
+        result = BroadcastResult(message_type)
+        start = time.monotonic()
+        if message_type == 'group':
+            futures = {
+                target: self.outbox.send_group_msg(target, message, Priority.BROADCAST, auto_escape)
+                for target in dict.fromkeys(targets)
+            }
+        else:
+            futures = {
+                target: self.outbox.send_private_msg(target, message, Priority.BROADCAST, auto_escape=auto_escape)
+                for target in dict.fromkeys(targets)
+            }
+        for target, future in futures.items():
+            try:
+                response = future.result()
+            except Exception as err:
+                result.errors[target] = str(err)
+                continue
+            if response.get('retcode') != 0:
+                result.errors[target] = response.get('wording') or response.get('msg') or str(response.get('retcode'))
+            else:
+                result.message_ids[target] = response['data']['message_id']
+        result.elapsed = time.monotonic() - start
+        if result.failed:
+            self.log.warning(result.summary())
+        return result
@@ -1,11 +1,510 @@
+import re
+import time
+import atexit
+import sqlite3
 import pymysql
+import threading
+import contextlib
+import functools
 import bot_log
+from bot_metrics import metrics
+from pymysql.constants import CLIENT
+from pymysql.converters import escape_item
+from abc import ABC, abstractmethod
 from bot_config import config
 
 
+class CountingCursor(pymysql.cursors.Cursor):
+    """
+    记录发往服务器的语句数的游标, 计入bot_metrics的db_round_trips_total
+    """
+
+    def _query(self, q):
+        metrics.increment('db_round_trips_total', 1, '与数据库服务器的往返次数')
+        return super()._query(q)
+
+
+class PoolTimeout(pymysql.MySQLError):
+    """
+    等待连接池中的空闲连接超时
+    """
+
+
+class Backend(ABC):
+    """
+    存储后端, 由配置文件的database.backend选择: mysql(默认)为ConnectionPool, sqlite为SQLiteBackend
+
+    Error: 后端抛出的异常基类
+    literal_insert: 批量插入是否写成转义后的多行INSERT语句, 否则用executemany在一个事务中插入
+    """
+    Error: type[Exception] = pymysql.MySQLError
+    literal_insert = True
+
+    def __init__(self):
+        self.__transactions = threading.local()
+
+    def current_transaction(self):
+        """
+        当前线程在该后端上进行中的事务, 由DataBase.transaction设置, 同一线程的所有DataBase对象共用
+        :return: 事务的连接, 不在事务中时为None
+        """
+        return getattr(self.__transactions, 'connection', None)
+
+    def set_transaction(self, connection) -> None:
+        """
+        设置当前线程进行中的事务
+        :param connection: 事务的连接, None表示事务已结束
+        """
+        self.__transactions.connection = connection
+
+    @abstractmethod
+    def acquire(self, timeout: float = None):
+        """
+        借出一个连接, 用完后必须调用release归还
+        :param timeout: 等待连接的最长秒数
+        :return: DB-API连接
+        """
+
+    @abstractmethod
+    def release(self, connection, broken: bool = False) -> None:
+        """
+        归还连接
+        :param connection: acquire借出的连接
+        :param broken: 连接是否已不可用
+        """
+
+    def begin(self, connection) -> None:
+        """
+        在连接上开始事务
+        :param connection: acquire借出的连接
+        """
+        connection.begin()
+
+    def is_broken(self, err: Exception) -> bool:
+        """
+        异常是否说明连接已不可用
+        :param err: 执行语句时的异常
+        :return: 连接是否已不可用
+        """
+        return isinstance(err, (pymysql.OperationalError, pymysql.InterfaceError))
+
+    def translate(self, sql: str) -> str:
+        """
+        把%s和%(name)s占位的语句转换为后端的参数格式
+        :param sql: 语句
+        :return: 后端可以执行的语句
+        """
+        return sql
+
+    @staticmethod
+    def prepare(row) -> tuple[object, int]:
+        """
+        把一行转换为insert使用的形式
+        :param row: 一行的值
+        :return: 转换后的行和估计的字节数
+        """
+        values = escape_row(row)
+        return values, len(values.encode()) + 2
+
+    def insert(self, cursor, table: str, columns, rows: list) -> int:
+        """
+        用一条语句插入prepare转换后的行
+        :param cursor: 游标
+        :param table: 表名
+        :param columns: 列名
+        :param rows: prepare转换后的行
+        :return: 插入的行数
+        """
+        return cursor.execute(f'insert into {table} ({", ".join(columns)}) VALUES\n' + ',\n'.join(rows))
+
+    def close(self) -> None:
+        """
+        关闭后端的全部连接
+        """
+
+    @staticmethod
+    def get_class() -> type['Backend']:
+        """
+        :return: 配置文件选择的后端类
+        """
+        return SQLiteBackend if config['database'].get('backend', 'mysql') == 'sqlite' else ConnectionPool
+
+    @staticmethod
+    def instance(host: str, user: str, password: str, db: str) -> 'Backend':
+        """
+        获取配置文件选择的进程内共享的后端
+        :param host: 数据库地址, SQLite不使用
+        :param user: 数据库用户名, SQLite不使用
+        :param password: 数据库密码, SQLite不使用
+        :param db: 数据库名, SQLite的文件为database.path, 默认为<db>.sqlite3
+        :return: 存储后端
+        """
+        if Backend.get_class() is SQLiteBackend:
+            return SQLiteBackend.instance(config['database'].get('path', f'{db}.sqlite3'))
+        return ConnectionPool.instance(host, user, password, db)
+
+
+class ConnectionPool(Backend):
+    """
+    线程安全的MySQL连接池
+
+    连接为自动提交模式, 单条语句不需要再发送COMMIT, 多条语句的事务由DataBase.transaction显式开始;
+    UPDATE返回匹配的行数而不是实际修改的行数。
+    同一时刻一个连接只借给一个线程。空闲连接后进先出, 借出时若已空闲超过ping_interval秒则先ping检查,
+    失败的连接被关闭并重新获取; 空闲超过idle_timeout秒的连接在归还或借出时被关闭, 但至少保留min_size个。
+    连接数达到max_size时等待其它线程归还, 超过timeout秒抛出PoolTimeout。
+    连接数和空闲连接数记录在bot_metrics的db_pool_connections和db_pool_idle中, 新建的连接数为db_pool_connects_total
+    :param host: 数据库地址
+    :param user: 数据库用户名
+    :param password: 数据库密码
+    :param db: 数据库名
+    :param min_size: 保留的最少连接数, 创建时预先建立
+    :param max_size: 最多连接数
+    :param idle_timeout: 空闲连接的最长保留秒数
+    :param ping_interval: 空闲超过该秒数的连接在借出前ping检查, 0表示每次都检查
+    :param timeout: 等待空闲连接的最长秒数
+    """
+    __instances: dict[tuple[str, str, str], 'ConnectionPool'] = {}
+    __instances_lock = threading.Lock()
+
+    def __init__(
+            self, host: str, user: str, password: str, db: str, min_size: int = 1, max_size: int = 10,
+            idle_timeout: float = 300, ping_interval: float = 5, timeout: float = 10
+    ):
+        super().__init__()
+        self.log = bot_log.Log('database')
+        self.host = host
+        self.user = user
+        self.password = password
+        self.db = db
+        self.min_size = min_size
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.ping_interval = ping_interval
+        self.timeout = timeout
+        self.size = 0
+        self.__idle: list[tuple[pymysql.connections.Connection, float]] = []  # (连接, 归还时间)
+        self.__closed = False
+        self.__condition = threading.Condition()
+        try:
+            for connection in [self.acquire() for _ in range(min_size)]:
+                self.release(connection)
+        except pymysql.MySQLError as err:
+            self.log.warning(f'{err}, 预先建立数据库连接失败')
+
+    def __connect(self) -> pymysql.connections.Connection:
+        connection = pymysql.connect(
+            host=self.host, user=self.user, password=self.password, database=self.db, autocommit=True,
+            client_flag=CLIENT.FOUND_ROWS, cursorclass=CountingCursor
+        )
+        metrics.increment('db_pool_connects_total', 1, '连接池新建的数据库连接数')
+        return connection
+
+    def __update(self) -> None:
+        metrics.set_gauge('db_pool_connections', self.size, '连接池中的数据库连接数')
+        metrics.set_gauge('db_pool_idle', len(self.__idle), '连接池中空闲的数据库连接数')
+
+    def __recycle(self, now: float) -> list[pymysql.connections.Connection]:
+        """
+        取出空闲太久的连接, 调用者在锁外关闭, 需要持有锁
+        """
+        expired = []
+        while self.__idle and self.size > self.min_size and now - self.__idle[0][1] > self.idle_timeout:
+            expired.append(self.__idle.pop(0)[0])
+            self.size -= 1
+        return expired
+
+    @staticmethod
+    def __close(connections) -> None:
+        for connection in connections:
+            try:
+                connection.close()
+            except pymysql.Error:
+                pass
+
+    def acquire(self, timeout: float = None) -> pymysql.connections.Connection:
+        """
+        借出一个连接, 用完后必须调用release归还
+        :param timeout: 等待空闲连接的最长秒数, 默认为self.timeout
+        :return: 连接
+        """
+        timeout = self.timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        while True:
+            expired = []
+            try:
+                with self.__condition:
+                    while True:
+                        if self.__closed:
+                            raise pymysql.InterfaceError('连接池已关闭')
+                        now = time.monotonic()
+                        expired += self.__recycle(now)
+                        if self.__idle:
+                            connection, since = self.__idle.pop()
+                            break
+                        if self.size < self.max_size:
+                            connection, since = None, now
+                            self.size += 1
+                            break
+                        if now >= deadline:
+                            raise PoolTimeout(f'等待数据库连接超过{timeout}秒')
+                        self.__condition.wait(deadline - now)
+                    self.__update()
+            finally:
+                ConnectionPool.__close(expired)
+            if connection is None:
+                try:
+                    return self.__connect()
+                except BaseException:
+                    self.__discard()
+                    raise
+            if now - since < self.ping_interval:
+                return connection
+            try:
+                connection.ping(reconnect=False)
+                return connection
+            except pymysql.Error:
+                self.log.info('数据库连接已失效, 重新获取')
+                ConnectionPool.__close((connection,))
+                self.__discard()
+
+    def release(self, connection: pymysql.connections.Connection, broken: bool = False) -> None:
+        """
+        归还连接
+        :param connection: acquire借出的连接
+        :param broken: 连接是否已不可用, 不可用的连接被关闭而不放回
+        """
+        with self.__condition:
+            if broken or self.__closed:
+                expired = [connection]
+                self.size -= 1
+            else:
+                self.__idle.append((connection, time.monotonic()))
+                expired = self.__recycle(time.monotonic())
+            self.__update()
+            self.__condition.notify()
+        ConnectionPool.__close(expired)
+
+    def __discard(self) -> None:
+        with self.__condition:
+            self.size -= 1
+            self.__update()
+            self.__condition.notify()
+
+    def close(self) -> None:
+        """
+        关闭连接池和全部空闲连接, 借出的连接在归还时关闭
+        """
+        with self.__condition:
+            self.__closed = True
+            idle, self.__idle = self.__idle, []
+            self.size -= len(idle)
+            self.__update()
+            self.__condition.notify_all()
+        ConnectionPool.__close(connection for connection, _ in idle)
+
+    @staticmethod
+    def instance(host: str, user: str, password: str, db: str) -> 'ConnectionPool':
+        """
+        获取进程内共享的连接池, 以(地址, 用户名, 数据库名)区分, 第一次调用时根据配置文件的database.pool创建
+        :param host: 数据库地址
+        :param user: 数据库用户名
+        :param password: 数据库密码
+        :param db: 数据库名
+        :return: 连接池
+        """
+        key = (host, user, db)
+        pool = ConnectionPool.__instances.get(key)
+        if pool is None:
+            with ConnectionPool.__instances_lock:
+                pool = ConnectionPool.__instances.get(key)
+                if pool is None:
+                    options = config['database'].get('pool', {})
+                    pool = ConnectionPool(
+                        host, user, password, db,
+                        min_size=options.get('min_size', 1),
+                        max_size=options.get('max_size', 10),
+                        idle_timeout=options.get('idle_timeout', 300),
+                        ping_interval=options.get('ping_interval', 5),
+                        timeout=options.get('timeout', 10)
+                    )
+                    ConnectionPool.__instances[key] = pool
+                    atexit.register(pool.close)
+        return pool
+
+
+_PLACEHOLDER = re.compile(r'%\((\w+)\)s|%s|%%')
+
+
+@functools.lru_cache(maxsize=256)
+def _translate_placeholders(sql: str) -> str:
+    """
+    把%s和%(name)s占位转换为SQLite的?和:name占位, 缓存只以语句为键, 不引用后端对象
+    :param sql: 语句
+    :return: SQLite可以执行的语句
+    """
+    return _PLACEHOLDER.sub(lambda match: f':{match[1]}' if match[1] else '?' if match[0] == '%s' else '%', sql)
+
+
+class SQLiteBackend(Backend):
+    """
+    嵌入式SQLite后端, 不需要数据库服务器, 适合小型部署和压测
+
+    每个线程使用自己的连接, 连接为自动提交模式, 事务以BEGIN IMMEDIATE开始;
+    数据库使用WAL日志模式, 读不阻塞写, 多个线程同时写时最多等待timeout秒。
+    线程的连接在事务中时, 事务之外的语句借到该线程的另一个连接, 自动提交而不随事务回滚;
+    此时写锁由本线程的事务持有, 这个连接不等待写锁, 写入立即失败。
+    第一次连接时按database_structure.md创建不存在的表
+    :param path: 数据库文件路径
+    :param timeout: 等待其它连接释放写锁的最长秒数
+    """
+    Error = sqlite3.Error
+    literal_insert = False
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS `message` (
+            `message_id` INTEGER, `user_id` INTEGER, `group_id` INTEGER, `message` TEXT
+        );
+        CREATE TABLE IF NOT EXISTS `event` (
+            `time` INTEGER, `post_type` TEXT, `message_type` TEXT, `sub_type` TEXT, `message_id` INTEGER,
+            `user_id` INTEGER, `group_id` INTEGER, `raw_message` TEXT, `request_type` TEXT, `notice_type` TEXT,
+            `meta_event_type` TEXT
+        );
+        CREATE TABLE IF NOT EXISTS `right` (`user_id` INTEGER, `group_id` INTEGER, `right` INTEGER);
+    """
+    __instances: dict[str, 'SQLiteBackend'] = {}
+    __instances_lock = threading.Lock()
+
+    def __init__(self, path: str, timeout: float = 10):
+        super().__init__()
+        self.log = bot_log.Log('database')
+        self.path = path
+        self.timeout = timeout
+        self.__local = threading.local()
+        self.__connections: list[sqlite3.Connection] = []
+        self.__lock = threading.Lock()
+        self.__closed = False
+        self.__initialized = False
+
+    def __connect(self, timeout: float) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.path, timeout=timeout, isolation_level=None, check_same_thread=False)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=NORMAL')
+        with self.__lock:
+            if self.__closed:
+                connection.close()
+                raise sqlite3.ProgrammingError('SQLite后端已关闭')
+            self.__connections.append(connection)
+            if not self.__initialized:
+                connection.executescript(SQLiteBackend.SCHEMA)
+                self.__initialized = True
+        metrics.increment('db_pool_connects_total', 1, '连接池新建的数据库连接数')
+        return connection
+
+    def acquire(self, timeout: float = None) -> sqlite3.Connection:
+        if self.current_transaction() is None:
+            connection = getattr(self.__local, 'connection', None)
+            if connection is None:
+                connection = self.__local.connection = self.__connect(self.timeout)
+        else:
+            connection = getattr(self.__local, 'spare', None)
+            if connection is None:
+                connection = self.__local.spare = self.__connect(0)
+        return connection
+
+    def release(self, connection: sqlite3.Connection, broken: bool = False) -> None:
+        names = [name for name in ('connection', 'spare') if getattr(self.__local, name, None) is connection]
+        if broken and names:
+            setattr(self.__local, names[0], None)
+            with self.__lock:
+                if connection in self.__connections:
+                    self.__connections.remove(connection)
+            connection.close()
+
+    def begin(self, connection: sqlite3.Connection) -> None:
+        connection.execute('BEGIN IMMEDIATE')
+
+    def is_broken(self, err: Exception) -> bool:
+        return isinstance(err, sqlite3.ProgrammingError)
+
+    def translate(self, sql: str) -> str:
+        return _translate_placeholders(sql)
+
+    @staticmethod
+    def prepare(row) -> tuple[object, int]:
+        return row, sum(len(value) if isinstance(value, str) else 8 for value in row) + 2
+
+    def insert(self, cursor, table: str, columns, rows: list) -> int:
+        cursor.executemany(
+            f'insert into {table} ({", ".join(columns)}) VALUES ({", ".join("?" * len(columns))})', rows
+        )
+        return cursor.rowcount
+
+    def close(self) -> None:
+        with self.__lock:
+            self.__closed = True
+            connections, self.__connections = self.__connections, []
+        for connection in connections:
+            connection.close()
+
+    @staticmethod
+    def instance(path: str) -> 'SQLiteBackend':
+        """
+        获取进程内共享的SQLite后端, 以文件路径区分
+        :param path: 数据库文件路径
+        :return: SQLite后端
+        """
+        backend = SQLiteBackend.__instances.get(path)
+        if backend is None:
+            with SQLiteBackend.__instances_lock:
+                backend = SQLiteBackend.__instances.get(path)
+                if backend is None:
+                    backend = SQLiteBackend(path, config['database'].get('pool', {}).get('timeout', 10))
+                    SQLiteBackend.__instances[path] = backend
+                    atexit.register(backend.close)
+        return backend
+
+
+def escape_row(row) -> str:
+    """
+    把一行转义为INSERT语句VALUES中的一项
+    :param row: 一行的值, None转义为NULL
+    :return: 如(1, 'a', NULL)的字符串
+    """
+    return '(' + ', '.join(escape_item(value, 'utf8mb4') for value in row) + ')'
+
+
+def insert_statements(table: str, columns, rows, max_bytes: int = None) -> list[str]:
+    """
+    把行按字节数分成若干条多行INSERT语句
+    :param table: 表名
+    :param columns: 列名
+    :param rows: 行的可迭代对象, 值的顺序与columns相同
+    :param max_bytes: 一条语句的最大字节数, 默认为配置文件的database.max_packet或1MiB
+    :return: INSERT语句
+    """
+    max_bytes = max_bytes or config['database'].get('max_packet', 1 << 20)
+    prefix = f'insert into {table} ({", ".join(columns)}) VALUES\n'
+    statements, chunk, size = [], [], len(prefix.encode())
+    for row in rows:
+        values = escape_row(row)
+        length = len(values.encode()) + 2
+        if chunk and size + length > max_bytes:
+            statements.append(prefix + ',\n'.join(chunk))
+            chunk, size = [], len(prefix.encode())
+        chunk.append(values)
+        size += length
+    if chunk:
+        statements.append(prefix + ',\n'.join(chunk))
+    return statements
+
+
 class DataBase(object):
     """
-    数据库操作
+    数据库操作, 连接来自共享的存储后端(见Backend), 每次执行时借出、执行完归还, 因此可以在多个线程中同时使用
+
+    语句中的参数用%s占位, 由驱动转义后代入, 不需要调用者拼接和转义; 使用SQLite后端时自动转换为?占位。
+    事务之外的每条语句自动提交, SELECT不会再发送COMMIT; 需要把多条语句作为整体提交时使用transaction。
+    提交次数记录在bot_metrics的db_commits_total中
     :param host: 数据库地址
     :param user: 数据库用户名
     :param password: 数据库密码
@@ -14,28 +513,392 @@ class DataBase(object):
 
     def __init__(self, host: str, user: str, password: str, db: str):
         self.log = bot_log.Log('database')
-        if config['database']['available']:
-            self.db_connect = pymysql.connect(host=host, user=user, password=password, database=db)
-            self.cursor = self.db_connect.cursor()
+        self.pool = Backend.instance(host, user, password, db) if config['database']['available'] else None
+        self.__local = threading.local()
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """
+        事务, 在with块中当前线程通过该对象执行的语句使用同一个连接, 离开时一次提交, 发生异常时回滚。
+        事务中执行失败的语句会抛出异常而不是返回空结果, 以便整个事务回滚; 事务可以嵌套, 由最外层提交。
+        同一线程中其它DataBase对象在块中开始的事务加入该事务, 它们在事务之外执行的语句不属于该事务
 
-    def __del__(self):
-        if config['database']['available']:
-            self.cursor.close()
-            self.db_connect.close()
+            with db.transaction():
+                if db.update('UPDATE ...', params) == 0:
+                    db.update('INSERT ...', params)
+        :return: 自身
+        """
+        if not config['database']['available'] or getattr(self.__local, 'connection', None) is not None:
+            yield self
+            return
+        connection = self.pool.current_transaction()
+        if connection is not None:
+            # 同一线程中其它DataBase对象开始的事务, 加入其中, 由它提交或回滚
+            self.__local.connection = connection
+            try:
+                yield self
+            finally:
+                self.__local.connection = None
+            return
+        connection = self.pool.acquire()
+        broken = False
+        self.__local.connection = connection
+        self.pool.set_transaction(connection)
+        try:
+            self.pool.begin(connection)
+            metrics.increment('db_round_trips_total', 1, '与数据库服务器的往返次数')
+            yield self
+            connection.commit()
+            metrics.increment('db_round_trips_total', 1, '与数据库服务器的往返次数')
+            metrics.increment('db_commits_total', 1, '提交的事务数')
+        except BaseException as err:
+            broken = self.pool.is_broken(err)
+            if not broken:
+                try:
+                    connection.rollback()
+                    metrics.increment('db_round_trips_total', 1, '与数据库服务器的往返次数')
+                except self.pool.Error:
+                    broken = True
+            raise
+        finally:
+            self.__local.connection = None
+            self.pool.set_transaction(None)
+            self.pool.release(connection, broken)
 
-    def execute(self, cmd: str) -> tuple[tuple[..., ...], ...]:
+    def __run(self, sql: str, run, default, atomic: bool = False):
         """
-        执行MySQL语句
-        :param cmd: MySQL语句
-        :return: MySQL语句执行结果
+        用run(cursor)执行; 在事务中时使用事务的连接且失败时抛出异常, 否则借出连接, 失败时返回default
+        :param atomic: 不在事务中时是否开始一个事务执行
         """
-        if config['database']['available']:
+        if getattr(self.__local, 'connection', None) is None and atomic:
+            try:
+                with self.transaction():
+                    return self.__run(sql, run, default)
+            except self.pool.Error:
+                return default
+        connection = getattr(self.__local, 'connection', None)
+        if connection is not None:
             try:
-                self.cursor.execute(cmd)
-                self.db_connect.commit()
-                self.log.info('执行MySQL语句成功：' + cmd)
-                return self.cursor.fetchall()
-            except pymysql.MySQLError as err:
-                self.db_connect.rollback()
-                self.log.warning(str(err) + '，执行MySQL语句失败：' + cmd)
-                return ()
+                with contextlib.closing(connection.cursor()) as cursor:
+                    rev = run(cursor)
+            except self.pool.Error as err:
+                self.log.warning(str(err) + '，执行SQL语句失败：' + sql)
+                raise
+            self.log.info('执行SQL语句成功：' + sql)
+            return rev
+        try:
+            connection = self.pool.acquire()
+        except self.pool.Error as err:
+            self.log.warning(str(err) + '，获取数据库连接失败：' + sql)
+            return default
+        broken = False
+        try:
+            with contextlib.closing(connection.cursor()) as cursor:
+                rev = run(cursor)
+                self.log.info('执行SQL语句成功：' + sql)
+                return rev
+        except self.pool.Error as err:
+            broken = self.pool.is_broken(err)
+            self.log.warning(str(err) + '，执行SQL语句失败：' + sql)
+            return default
+        finally:
+            self.pool.release(connection, broken)
+
+    def execute(self, sql: str, params=None) -> tuple[tuple[..., ...], ...]:
+        """
+        执行SQL语句
+        :param sql: SQL语句, 参数用%s或%(name)s占位
+        :param params: 参数的元组或字典
+        :return: SQL语句执行结果
+        """
+        if not config['database']['available']:
+            return ()
+        statement = sql if params is None else self.pool.translate(sql)
+
+        def run(cursor):
+            cursor.execute(statement) if params is None else cursor.execute(statement, params)
+            return tuple(cursor.fetchall())
+
+        return self.__run(sql, run, ())
+
+    def update(self, sql: str, params=None) -> int:
+        """
+        执行INSERT、UPDATE、DELETE等语句
+        :param sql: SQL语句, 参数用%s或%(name)s占位
+        :param params: 参数的元组或字典
+        :return: 匹配的行数, 失败时为0
+        """
+        if not config['database']['available']:
+            return 0
+        statement = sql if params is None else self.pool.translate(sql)
+
+        def run(cursor) -> int:
+            cursor.execute(statement) if params is None else cursor.execute(statement, params)
+            return cursor.rowcount
+
+        return self.__run(sql, run, 0)
+
+    def executemany(self, sql: str, rows) -> int:
+        """
+        用多组参数执行同一条SQL语句, MySQL的INSERT ... VALUES语句由pymysql合并为多行INSERT, SQLite在一个事务中执行
+        :param sql: SQL语句, 参数用%s或%(name)s占位
+        :param rows: 参数的可迭代对象
+        :return: 影响的行数, 失败时为0
+        """
+        if not config['database']['available']:
+            return 0
+        statement = self.pool.translate(sql)
+
+        def run(cursor) -> int:
+            cursor.executemany(statement, rows)
+            return max(cursor.rowcount, 0)
+
+        return self.__run(sql, run, 0, atomic=not self.pool.literal_insert)
+
+    def insert_prepared(self, table: str, columns, rows: list) -> int:
+        """
+        插入已经由Backend.prepare转换的行, 使用一条语句
+        :param table: 表名
+        :param columns: 列名
+        :param rows: 转换后的行
+        :return: 插入的行数, 失败时为0
+        """
+        if not config['database']['available'] or not rows:
+            return 0
+        return self.__run(
+            f'insert into {table} ... ({len(rows)}行)', lambda cursor: self.pool.insert(cursor, table, columns, rows), 0,
+            atomic=not self.pool.literal_insert
+        )
+
+    def bulk_insert(self, table: str, columns, rows, max_bytes: int = None) -> int:
+        """
+        批量插入, 按字节数把行分成若干条多行INSERT语句, 全部在同一事务中执行
+        :param table: 表名
+        :param columns: 列名
+        :param rows: 行的可迭代对象, 值的顺序与columns相同
+        :param max_bytes: 一条语句的最大字节数, 默认为配置文件的database.max_packet或1MiB, 应小于MySQL的max_allowed_packet
+        :return: 插入的行数, 失败时为0
+        """
+        if not config['database']['available']:
+            return 0
+        max_bytes = max_bytes or config['database'].get('max_packet', 1 << 20)
+        chunks, chunk, size = [], [], 0
+        for row in rows:
+            prepared, length = self.pool.prepare(row)
+            if chunk and size + length > max_bytes:
+                chunks.append(chunk)
+                chunk, size = [], 0
+            chunk.append(prepared)
+            size += length
+        if chunk:
+            chunks.append(chunk)
+        if not chunks:
+            return 0
+
+        def run(cursor) -> int:
+            return sum(self.pool.insert(cursor, table, columns, chunk) for chunk in chunks)
+
+        sql = f'insert into {table} ... ({len(chunks)}条语句)'
+        return self.__run(sql, run, 0, atomic=len(chunks) > 1 or not self.pool.literal_insert)
+
+
+class BatchWriter(object):
+    """
+    批量写入, 调用者把行放入缓冲区后立即返回, 由后台线程合并为多行INSERT写入
+
+    行在put时即由存储后端的Backend.prepare转换(MySQL为转义后的VALUES项), 缓冲区按转换后的字节数计算占用。
+    缓冲的行数达到max_rows、字节数达到max_bytes或最早的一行等待超过interval秒时写入一次, 关闭时写入剩余的行。
+    缓冲区超过max_pending行或max_pending_bytes字节时put会阻塞, 直到后台线程写入或超时。
+    写入的行数、丢弃的行数和缓冲区占用记录在bot_metrics的db_<表名>_rows_written_total、db_<表名>_rows_dropped_total、
+    db_<表名>_pending_rows和db_<表名>_pending_bytes中, db_<表名>_rows_per_second为最近的写入速率;
+    最近一次写入的耗时为db_<表名>_flush_seconds, 写入次数、失败次数和总耗时为db_<表名>_flushes_total、
+    db_<表名>_flush_errors_total和db_<表名>_flush_seconds_total, 不计入go-cqhttp终结点的统计
+    :param table: 表名
+    :param columns: 列名
+    :param max_rows: 一条INSERT语句最多包含的行数
+    :param interval: 一行最长的缓冲秒数
+    :param max_pending: 缓冲区最多容纳的行数
+    :param max_bytes: 一条INSERT语句中VALUES的最大字节数, 应小于MySQL的max_allowed_packet
+    :param max_pending_bytes: 缓冲区最多容纳的字节数
+    """
+    __instances: dict[str, 'BatchWriter'] = {}
+    __instances_lock = threading.Lock()
+    __RATE_WINDOW = 5  # 计算写入速率的窗口秒数
+
+    def __init__(
+            self, table: str, columns: tuple[str, ...], max_rows: int = 500, interval: float = 1,
+            max_pending: int = 10000, max_bytes: int = 1 << 20, max_pending_bytes: int = 16 << 20
+    ):
+        self.log = bot_log.Log('database')
+        self.table = table
+        self.columns = columns
+        self.max_rows = max_rows
+        self.interval = interval
+        self.max_pending = max_pending
+        self.max_bytes = max_bytes
+        self.max_pending_bytes = max_pending_bytes
+        self.written = 0
+        self.dropped = 0
+        self.__prepare = Backend.get_class().prepare
+        self.__rows: list[tuple[object, int, float]] = []  # (转换后的行, 字节数, 放入的时间)
+        self.__bytes = 0
+        self.__rate: list[tuple[float, int]] = []  # 最近的(写入时间, 行数)
+        self.__closed = False
+        self.__condition = threading.Condition()
+        self.__thread = threading.Thread(target=self.__run, name=f'batch-writer-{table}', daemon=True)
+        self.__thread.start()
+
+    def put(self, *row, timeout: float = None) -> bool:
+        """
+        放入一行, 值的顺序与columns相同, None写入为NULL
+        :param row: 一行的值
+        :param timeout: 缓冲区已满时最多等待的秒数, None表示一直等待
+        :return: 是否放入, 等待超时时丢弃该行并返回False
+        """
+        if len(row) != len(self.columns):
+            raise ValueError(f'{self.table}需要{len(self.columns)}列, 实际为{len(row)}列')
+        values, size = self.__prepare(row)
+        with self.__condition:
+            if self.__closed:
+                raise RuntimeError('批量写入已关闭')
+            deadline = None if timeout is None else time.monotonic() + timeout
+            while self.__rows and (
+                    len(self.__rows) >= self.max_pending or self.__bytes + size > self.max_pending_bytes
+            ):
+                wait = None if deadline is None else deadline - time.monotonic()
+                if wait is not None and wait <= 0:
+                    self.dropped += 1
+                    metrics.increment(
+                        f'db_{self.table}_rows_dropped_total', 1, f'因缓冲区已满而丢弃的{self.table}行数'
+                    )
+                    return False
+                self.__condition.wait(wait)
+            empty = not self.__rows
+            self.__rows.append((values, size, time.monotonic()))
+            self.__bytes += size
+            # 缓冲区由空变为非空时唤醒后台线程开始计时, 否则只有攒满一批才会写入
+            if empty or len(self.__rows) >= self.max_rows or self.__bytes >= self.max_bytes:
+                self.__condition.notify_all()
+        return True
+
+    def __take(self) -> list[str] | None:
+        """
+        等待并取出下一批要写入的行, 关闭且缓冲区为空时返回None
+        """
+        with self.__condition:
+            while True:
+                if self.__rows and (
+                        len(self.__rows) >= self.max_rows or self.__bytes >= self.max_bytes or self.__closed
+                ):
+                    break
+                if self.__rows:
+                    # 按缓冲区中最早的一行计时, 写入一部分后剩余的行不会重新开始计时
+                    wait = self.__rows[0][2] + self.interval - time.monotonic()
+                    if wait <= 0:
+                        break
+                elif self.__closed:
+                    return None
+                else:
+                    wait = None
+                self.__condition.wait(wait)
+            count, size = 0, 0
+            for _, row_size, _ in self.__rows[:self.max_rows]:
+                if count and size + row_size > self.max_bytes:
+                    break
+                count += 1
+                size += row_size
+            rows, self.__rows = [values for values, _, _ in self.__rows[:count]], self.__rows[count:]
+            self.__bytes -= size
+            self.__condition.notify_all()
+            metrics.set_gauge(f'db_{self.table}_pending_rows', len(self.__rows), f'等待写入的{self.table}行数')
+            metrics.set_gauge(f'db_{self.table}_pending_bytes', self.__bytes, f'等待写入的{self.table}字节数')
+            return rows
+
+    def __run(self) -> None:
+        while (rows := self.__take()) is not None:
+            start = time.perf_counter()
+            written = self.__write(rows)
+            seconds = time.perf_counter() - start
+            metrics.set_gauge(f'db_{self.table}_flush_seconds', seconds, f'最近一次写入{self.table}的秒数')
+            metrics.increment(f'db_{self.table}_flush_seconds_total', seconds, f'写入{self.table}的总秒数')
+            metrics.increment(f'db_{self.table}_flushes_total', 1, f'写入{self.table}的次数')
+            if written:
+                self.__count(len(rows))
+            else:
+                metrics.increment(f'db_{self.table}_flush_errors_total', 1, f'写入{self.table}失败的次数')
+
+    def __count(self, rows: int) -> None:
+        """
+        记录写入的行数并更新写入速率
+        """
+        now = time.monotonic()
+        self.written += rows
+        self.__rate.append((now, rows))
+        while self.__rate and self.__rate[0][0] < now - BatchWriter.__RATE_WINDOW:
+            self.__rate.pop(0)
+        metrics.increment(f'db_{self.table}_rows_written_total', rows, f'写入的{self.table}行数')
+        metrics.set_gauge(f'db_{self.table}_rows_per_second', self.rows_per_second, f'最近{self.table}的每秒写入行数')
+
+    @property
+    def rows_per_second(self) -> float:
+        """
+        最近几秒的平均每秒写入行数
+        """
+        rate = list(self.__rate)
+        if not rate:
+            return 0.0
+        return sum(rows for _, rows in rate) / max(time.monotonic() - rate[0][0], self.interval, 1)
+
+    def __write(self, rows: list) -> bool:
+        """
+        写入一批行, 日志只记录行数, 不记录整条语句
+        :return: 是否成功
+        """
+        if not config['database']['available']:
+            return True
+        db = DataBase(config['database']['host'], config['database']['user'], config['database']['password'], 'bot')
+        if db.insert_prepared(self.table, self.columns, rows) == 0:
+            self.log.warning(f'写入{self.table}失败, 丢弃{len(rows)}行')
+            return False
+        return True
+
+    def close(self) -> None:
+        """
+        关闭并等待缓冲区中的行全部写入
+        """
+        with self.__condition:
+            self.__closed = True
+            self.__condition.notify_all()
+        self.__thread.join()
+
+    @staticmethod
+    def instance(table: str, columns: tuple[str, ...]) -> 'BatchWriter':
+        """
+        获取进程内某个表共享的批量写入, 第一次调用时根据配置文件创建, 进程退出时会写入剩余的行
+        :param table: 表名
+        :param columns: 列名
+        :return: 批量写入
+        """
+        writer = BatchWriter.__instances.get(table)
+        if writer is None:
+            with BatchWriter.__instances_lock:
+                writer = BatchWriter.__instances.get(table)
+                if writer is None:
+                    batch = config['database'].get('batch', {})
+                    writer = BatchWriter(
+                        table, columns,
+                        max_rows=batch.get('max_rows', 500),
+                        interval=batch.get('interval', 1),
+                        max_pending=batch.get('max_pending', 10000),
+                        max_bytes=batch.get('max_bytes', 1 << 20),
+                        max_pending_bytes=batch.get('max_pending_bytes', 16 << 20)
+                    )
+                    BatchWriter.__instances[table] = writer
+                    if config['database']['available']:
+                        # 先创建存储后端, 使进程退出时写入剩余的行之后才关闭后端
+                        Backend.instance(
+                            config['database']['host'], config['database']['user'], config['database']['password'],
+                            'bot'
+                        )
+                    atexit.register(writer.close)
+        return writer
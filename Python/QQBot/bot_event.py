@@ -0,0 +1,478 @@
+"""
+bot_event.py
+
+接收go-cqhttp通过HTTP POST上报的事件, 解析为事件对象后交给有界队列和工作线程处理,
+处理函数返回的快速操作在截止时间内完成时直接作为上报的响应返回
+https://docs.go-cqhttp.org/reference/#http-post
+https://docs.go-cqhttp.org/reference/#快速操作
+"""
+import hmac
+import json
+import queue
+import socket
+import hashlib
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import bot_db
+import bot_api
+import bot_outbox
+import bot_roster
+from bot_metrics import metrics
+from bot_log import Log
+from bot_config import config
+
+
+class Event(object):
+    """
+    go-cqhttp上报的事件
+    https://docs.go-cqhttp.org/event/
+
+    post_types: 上报类型 -> 事件类, 由子类的post_type自动登记
+    :param data: 上报的数据
+    """
+    post_type: str = ''
+    post_types: dict[str, type['Event']] = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        for post_type in cls.post_type.split():
+            Event.post_types[post_type] = cls
+
+    def __init__(self, data: dict):
+        self.data = data
+        self.quick: QuickOperation | None = None
+        self.time: int = data.get('time', 0)
+        self.self_id: int = data.get('self_id', 0)
+        self.post_type: str = data.get('post_type', '')
+
+    @staticmethod
+    def parse(data: dict) -> 'Event':
+        """
+        根据post_type创建对应的事件对象
+        :param data: 上报的数据
+        :return: 事件对象, 未知的上报类型为Event
+        """
+        return Event.post_types.get(data.get('post_type'), Event)(data)
+
+    def __repr__(self) -> str:
+        return f'{type(self).__name__}({self.data})'
+
+
+class QuickOperation(object):
+    """
+    事件的快速操作, 在接收上报的线程和处理事件的工作线程之间交接, 结果只会被认领一次:
+    工作线程在截止时间前给出结果时, 由接收线程作为上报的响应返回; 否则由工作线程调用API执行
+    """
+
+    def __init__(self):
+        self.operation: dict | None = None
+        self.__claimed = False
+        self.__done = threading.Event()
+        self.__lock = threading.Lock()
+
+    def resolve(self, operation: dict | None) -> bool:
+        """
+        工作线程给出结果
+        :param operation: 快速操作, 没有时为None
+        :return: 结果是否会由接收线程返回, 为False时需要调用者自行执行
+        """
+        with self.__lock:
+            if self.__claimed:
+                return False
+            self.operation, self.__claimed = operation, True
+        self.__done.set()
+        return True
+
+    def wait(self, timeout: float) -> dict | None:
+        """
+        接收线程等待结果, 超时后工作线程的结果不再由接收线程返回
+        :param timeout: 等待的秒数
+        :return: 快速操作, 超时或没有时为None
+        """
+        self.__done.wait(timeout)
+        with self.__lock:
+            self.__claimed = True
+            return self.operation
+
+
+class MessageEvent(Event):
+    """
+    消息事件, 包括收到的消息(message)和机器人自己发出的消息(message_sent)
+    """
+    post_type = 'message message_sent'
+
+    def __init__(self, data: dict):
+        super().__init__(data)
+        self.message_type: str = data.get('message_type', '')
+        self.sub_type: str = data.get('sub_type', '')
+        self.message_id: int = data.get('message_id', 0)
+        self.user_id: int = data.get('user_id', 0)
+        self.group_id: int | None = data.get('group_id')
+        self.message = data.get('message', '')
+        self.raw_message: str = data.get('raw_message', '')
+        self.sender: dict = data.get('sender') or {}
+
+    @property
+    def is_group(self) -> bool:
+        """
+        是否为群消息
+        """
+        return self.message_type == 'group'
+
+
+class NoticeEvent(Event):
+    """
+    通知事件, 如群成员增加、群名片变更
+    """
+    post_type = 'notice'
+
+    def __init__(self, data: dict):
+        super().__init__(data)
+        self.notice_type: str = data.get('notice_type', '')
+        self.sub_type: str = data.get('sub_type', '')
+        self.user_id: int = data.get('user_id', 0)
+        self.group_id: int | None = data.get('group_id')
+
+
+class RequestEvent(Event):
+    """
+    请求事件, 如加好友请求、加群请求
+    """
+    post_type = 'request'
+
+    def __init__(self, data: dict):
+        super().__init__(data)
+        self.request_type: str = data.get('request_type', '')
+        self.sub_type: str = data.get('sub_type', '')
+        self.user_id: int = data.get('user_id', 0)
+        self.group_id: int | None = data.get('group_id')
+        self.comment: str = data.get('comment', '')
+        self.flag: str = data.get('flag', '')
+
+
+class MetaEvent(Event):
+    """
+    元事件, 如心跳、生命周期
+    """
+    post_type = 'meta_event'
+
+    def __init__(self, data: dict):
+        super().__init__(data)
+        self.meta_event_type: str = data.get('meta_event_type', '')
+
+
+class EventRecorder(object):
+    """
+    把事件写入数据库的event表, 作为EventServer的处理函数使用
+
+    事件经bot_db.BatchWriter合并为多行INSERT写入, 缓冲区已满时最多等待put_timeout秒, 仍然满则丢弃该事件,
+    不会长时间占用工作线程
+    :param post_types: 记录的上报类型, 默认不记录心跳等元事件
+    :param put_timeout: 缓冲区已满时等待的秒数
+    """
+    COLUMNS = (
+        'time', 'post_type', 'message_type', 'sub_type', 'message_id', 'user_id', 'group_id', 'raw_message',
+        'request_type', 'notice_type', 'meta_event_type'
+    )
+    MAX_MESSAGE_LENGTH = 20000
+
+    def __init__(self, post_types=('message', 'message_sent', 'notice', 'request'), put_timeout: float = 0.1):
+        self.post_types = frozenset(post_types)
+        self.put_timeout = put_timeout
+        self.writer = bot_db.BatchWriter.instance('event', EventRecorder.COLUMNS)
+
+    def __call__(self, event: Event) -> None:
+        if event.post_type not in self.post_types:
+            return
+        data = event.data
+        raw_message = data.get('raw_message')
+        if raw_message is not None and len(raw_message) > EventRecorder.MAX_MESSAGE_LENGTH:
+            raw_message = raw_message[:EventRecorder.MAX_MESSAGE_LENGTH]
+        self.writer.put(
+            event.time, event.post_type, data.get('message_type'), data.get('sub_type'), data.get('message_id'),
+            data.get('user_id'), data.get('group_id'), raw_message, data.get('request_type'),
+            data.get('notice_type'), data.get('meta_event_type'), timeout=self.put_timeout
+        )
+
+
+class EventServer(object):
+    """
+    事件接收服务器
+
+    收到上报后立即解析并放入有界队列, 由工作线程调用处理函数, 因此耗时的操作不会阻塞后续事件的接收。
+    队列已满时最多等待enqueue_timeout秒, 仍然满则丢弃该事件。
+    队列深度记录在bot_metrics的event_queue_depth中,
+    接收和丢弃的事件数分别为events_received_total和events_dropped_total;
+    请求体不是JSON对象的上报以400拒绝, 次数为events_rejected_total
+
+    处理函数可以返回快速操作: 字符串视为reply, 字典为完整的快速操作, 如{'reply': 'pong', 'at_sender': False};
+    多个处理函数的快速操作会合并。消息和请求事件最多等待reply_deadline秒,
+    快速操作在此之前给出时直接作为上报的响应返回, 省去一次send_msg调用; 超时后改由SendGroupMsg、SendPrivateMsg等API执行。
+    两种方式的次数分别为quick_operations_inline_total和quick_operations_fallback_total
+    :param host: 监听地址
+    :param port: 监听端口
+    :param workers: 工作线程数
+    :param queue_size: 队列容量
+    :param secret: go-cqhttp配置的secret, 设置后校验X-Signature
+    :param enqueue_timeout: 队列已满时等待的秒数
+    :param reply_deadline: 等待快速操作的秒数, 0表示不等待
+    """
+    __instance = None
+    __instance_lock = threading.Lock()
+
+    def __init__(
+            self, host: str = '127.0.0.1', port: int = 5701, workers: int = 8, queue_size: int = 1000,
+            secret: str = None, enqueue_timeout: float = 1, reply_deadline: float = 0.5
+    ):
+        self.log = Log('event')
+        self.workers = workers
+        self.secret = secret.encode() if secret else None
+        self.enqueue_timeout = enqueue_timeout
+        self.reply_deadline = reply_deadline
+        self.__handlers: list[tuple[type[Event], object]] = []
+        self.__queue: queue.Queue[Event | None] = queue.Queue(queue_size)
+        self.__threads: list[threading.Thread] = []
+        self.__server = ThreadingHTTPServer((host, port), self.__request_handler())
+        self.__server.daemon_threads = True
+        metrics.set_gauge('event_queue_capacity', queue_size, '事件队列容量')
+        metrics.set_gauge('event_queue_depth', 0, '事件队列中等待处理的事件数')
+
+    @property
+    def address(self) -> tuple[str, int]:
+        """
+        实际监听的地址和端口
+        """
+        return self.__server.server_address[:2]
+
+    @property
+    def depth(self) -> int:
+        """
+        队列中等待处理的事件数
+        """
+        return self.__queue.qsize()
+
+    def add_handler(self, handler, event_type: type[Event] = Event) -> None:
+        """
+        登记处理函数, 按登记顺序调用
+        :param handler: 参数为事件对象的函数, 可以返回快速操作
+        :param event_type: 只处理该类型(包括子类)的事件, 默认处理所有事件
+        """
+        self.__handlers.append((event_type, handler))
+
+    def on(self, event_type: type[Event] = Event):
+        """
+        登记处理函数的装饰器, 与add_handler相同
+        :param event_type: 只处理该类型(包括子类)的事件, 默认处理所有事件
+        """
+        def decorator(handler):
+            self.add_handler(handler, event_type)
+            return handler
+
+        return decorator
+
+    def submit(self, event: Event) -> bool:
+        """
+        把事件放入队列
+        :param event: 事件对象
+        :return: 是否放入成功, 队列已满且超时时为False
+        """
+        metrics.increment('events_received_total', 1, '收到的事件数')
+        try:
+            self.__queue.put(event, timeout=self.enqueue_timeout)
+        except queue.Full:
+            metrics.increment('events_dropped_total', 1, '因队列已满而丢弃的事件数')
+            self.log.warning(f'事件队列已满, 丢弃事件: {event}')
+            return False
+        metrics.set_gauge('event_queue_depth', self.__queue.qsize(), '事件队列中等待处理的事件数')
+        return True
+
+    def dispatch(self, event: Event) -> None:
+        """
+        在当前线程中调用所有匹配的处理函数, 单个处理函数出错不影响其它处理函数;
+        快速操作交给接收线程, 接收线程已经不再等待时调用API执行
+        :param event: 事件对象
+        """
+        operation = {}
+        for event_type, handler in self.__handlers:
+            if isinstance(event, event_type):
+                try:
+                    result = handler(event)
+                except Exception as err:
+                    self.log.warning(f'处理事件失败: {err!r}, 事件: {event}')
+                    continue
+                if result:
+                    operation.update({'reply': result} if isinstance(result, str) else result)
+        if event.quick is not None and event.quick.resolve(operation or None):
+            if operation:
+                metrics.increment('quick_operations_inline_total', 1, '作为上报响应返回的快速操作数')
+        elif operation:
+            metrics.increment('quick_operations_fallback_total', 1, '超时后调用API执行的快速操作数')
+            try:
+                EventServer.execute(event, operation)
+            except Exception as err:
+                self.log.warning(f'执行快速操作失败: {err!r}, 事件: {event}')
+
+    @staticmethod
+    def execute(event: Event, operation: dict) -> None:
+        """
+        通过API执行快速操作, 用于不能作为上报响应返回的情况, 消息经由发送队列发送
+        :param event: 事件对象
+        :param operation: 快速操作
+        """
+        if isinstance(event, MessageEvent):
+            if operation.get('reply'):
+                message = operation['reply']
+                auto_escape = operation.get('auto_escape', False)
+                outbox = bot_outbox.Outbox.instance()
+                if event.is_group:
+                    if operation.get('at_sender', True):
+                        message = f'[CQ:at,qq={event.user_id}] {message}'
+                    outbox.send_group_msg(event.group_id, message, auto_escape=auto_escape)
+                else:
+                    outbox.send_private_msg(event.user_id, message, auto_escape=auto_escape)
+            if event.is_group:
+                if operation.get('delete'):
+                    bot_api.DeleteMsg(event.message_id)
+                if operation.get('kick'):
+                    bot_api.SetGroupKick(event.group_id, event.user_id)
+                elif operation.get('ban'):
+                    bot_api.SetGroupBan(event.group_id, event.user_id, operation.get('ban_duration', 30 * 60))
+        elif isinstance(event, RequestEvent) and 'approve' in operation:
+            if event.request_type == 'friend':
+                bot_api.SetFriendAddRequest(event.flag, operation['approve'], operation.get('remark', ''))
+            elif event.request_type == 'group':
+                bot_api.SetGroupAddRequest(
+                    event.flag, event.sub_type, operation['approve'], operation.get('reason', '')
+                )
+
+    def __work(self) -> None:
+        while (event := self.__queue.get()) is not None:
+            metrics.set_gauge('event_queue_depth', self.__queue.qsize(), '事件队列中等待处理的事件数')
+            self.dispatch(event)
+
+    def verify(self, body: bytes, signature: str | None) -> bool:
+        """
+        校验上报的签名
+        :param body: 请求体
+        :param signature: X-Signature请求头
+        :return: 没有设置secret或签名正确时为True
+        """
+        if self.secret is None:
+            return True
+        expected = 'sha1=' + hmac.new(self.secret, body, hashlib.sha1).hexdigest()
+        return signature is not None and hmac.compare_digest(expected, signature)
+
+    def __request_handler(self) -> type[BaseHTTPRequestHandler]:
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def setup(self):
+                super().setup()
+                # 响应头和响应体分两次写出, 关闭Nagle算法以免与go-cqhttp的延迟确认互相等待
+                self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+            def do_POST(self):
+                length = self.headers.get('Content-Length') or '0'
+                if not length.isdigit():
+                    self.__reject()
+                    return
+                body = self.rfile.read(int(length))
+                if not server.verify(body, self.headers.get('X-Signature')):
+                    self.__respond(401)
+                    return
+                try:
+                    data = json.loads(body)
+                    # 合法的JSON但不是对象(如[]或"x")时Event.parse无法取得上报类型
+                    event = Event.parse(data) if isinstance(data, dict) else None
+                except (ValueError, TypeError):
+                    event = None
+                if event is None:
+                    self.__reject()
+                    return
+                if server.reply_deadline <= 0 or not isinstance(event, (MessageEvent, RequestEvent)):
+                    self.__respond(204)
+                    server.submit(event)
+                    return
+                event.quick = QuickOperation()
+                operation = event.quick.wait(server.reply_deadline) if server.submit(event) else None
+                if operation:
+                    self.__respond(200, json.dumps(operation).encode())
+                else:
+                    self.__respond(204)
+
+            def __reject(self) -> None:
+                metrics.increment('events_rejected_total', 1, '无法解析而拒绝的上报数')
+                self.__respond(400)
+
+            def __respond(self, status: int, body: bytes = b'') -> None:
+                self.send_response(status)
+                if body:
+                    self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def start(self) -> 'EventServer':
+        """
+        启动工作线程, 并在后台线程中开始接收事件
+        :return: 自身
+        """
+        for index in range(self.workers):
+            thread = threading.Thread(target=self.__work, name=f'event-worker-{index}', daemon=True)
+            thread.start()
+            self.__threads.append(thread)
+        threading.Thread(target=self.__server.serve_forever, name='event-server', daemon=True).start()
+        return self
+
+    def stop(self, wait: bool = True) -> None:
+        """
+        停止接收事件, 队列中已有的事件仍会被处理
+        :param wait: 是否等待队列中的事件处理完成
+        """
+        self.__server.shutdown()
+        self.__server.server_close()
+        for _ in self.__threads:
+            self.__queue.put(None)
+        if wait:
+            for thread in self.__threads:
+                thread.join()
+
+    @staticmethod
+    def instance() -> 'EventServer':
+        """
+        获取进程内共享的事件接收服务器, 第一次调用时根据配置文件创建, 需要调用start启动;
+        群成员变动的通知交给bot_roster.Roster更新名册, 数据库可用且event.record不为false时, 事件由EventRecorder写入event表,
+        event.commands不为false时, 消息由bot_router.Router执行bot_operation中的指令并作为快速操作回复
+        :return: 事件接收服务器
+        """
+        if EventServer.__instance is None:
+            with EventServer.__instance_lock:
+                if EventServer.__instance is None:
+                    event = config.get('event', {})
+                    server = EventServer(
+                        host=event.get('host', '127.0.0.1'),
+                        port=event.get('port', 5701),
+                        workers=event.get('workers', 8),
+                        queue_size=event.get('queue_size', 1000),
+                        secret=event.get('secret'),
+                        enqueue_timeout=event.get('enqueue_timeout', 1),
+                        reply_deadline=event.get('reply_deadline', 0.5)
+                    )
+                    server.add_handler(bot_roster.Roster.instance(), NoticeEvent)
+                    if config['database']['available'] and event.get('record', True):
+                        server.add_handler(EventRecorder(put_timeout=event.get('record_timeout', 0.1)))
+                    if event.get('commands', True):
+                        # bot_operation依赖模型和云服务的SDK, 只在启用指令时导入
+                        import bot_router
+                        import bot_operation
+                        router = bot_router.Router.from_base(bot_operation.Operation)
+                        server.add_handler(router.handler(bot_api.BlankApi), MessageEvent)
+                    EventServer.__instance = server
+        return EventServer.__instance
@@ -0,0 +1,221 @@
+"""
+bot_files.py
+
+群文件爬取: 并发遍历群文件的目录树, 缓存每个群的结果, 再次爬取时给出新增、删除和修改的文件
+"""
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import bot_api
+
+
+class GroupFile(object):
+    """
+    群文件, 下载链接在第一次访问url时才获取
+    :param group_id: 群号
+    :param path: 所在文件夹的路径, 根目录为/
+    :param data: GetGroupRootFiles或GetGroupFilesByFolder返回的File对象
+    """
+    __slots__ = ('group_id', 'path', 'file_id', 'file_name', 'busid', 'file_size', 'modify_time', '__url')
+
+    def __init__(self, group_id: int, path: str, data: dict):
+        self.group_id = group_id
+        self.path = path
+        self.file_id = data['file_id']
+        self.file_name = data['file_name']
+        self.busid = data['busid']
+        self.file_size = data['file_size']
+        self.modify_time = data['modify_time']
+        self.__url = None
+
+    @property
+    def url(self) -> str:
+        """
+        文件下载链接, 第一次访问时调用GetGroupFileUrl
+        """
+        if self.__url is None:
+            response = bot_api.GetGroupFileUrl(self.group_id, self.file_id, self.busid).json
+            if response.get('retcode') != 0:
+                raise RuntimeError(f'获取群{self.group_id}的文件{self.file_name}的链接失败: {response.get("wording")}')
+            self.__url = response['data']['url']
+        return self.__url
+
+    def same_as(self, other: 'GroupFile') -> bool:
+        """
+        判断两次爬取到的同一个文件是否没有变化
+        :param other: 另一次爬取到的文件
+        :return: 文件名、路径、大小和修改时间都相同时为True
+        """
+        return (self.file_name, self.path, self.file_size, self.modify_time) == \
+            (other.file_name, other.path, other.file_size, other.modify_time)
+
+    def __repr__(self) -> str:
+        return f'GroupFile({self.group_id}, {self.path.rstrip("/")}/{self.file_name!r}, {self.file_size})'
+
+
+class FileTree(object):
+    """
+    一个群的文件树
+    :param group_id: 群号
+    """
+
+    def __init__(self, group_id: int):
+        self.group_id = group_id
+        self.files: dict[str, GroupFile] = {}  # 文件ID -> 文件
+        self.folders: dict[str, str] = {}  # 文件夹ID -> 路径
+        self.file_count = 0  # 爬取时群文件系统中的文件数
+        self.used_space = 0  # 爬取时群文件系统已使用的空间
+
+    def __len__(self) -> int:
+        return len(self.files)
+
+
+class FileDiff(object):
+    """
+    两次爬取之间的变化
+    :param error: 爬取失败时的错误信息, 这时没有变化, 缓存的文件树保持不变
+    """
+
+    def __init__(self, error: str = None):
+        self.added: list[GroupFile] = []
+        self.removed: list[GroupFile] = []
+        self.changed: list[GroupFile] = []
+        self.error = error
+
+    def __bool__(self) -> bool:
+        return bool(self.added or self.removed or self.changed)
+
+    @staticmethod
+    def compare(old: FileTree | None, new: FileTree) -> 'FileDiff':
+        """
+        比较两棵文件树
+        :param old: 上一次的文件树, 没有时所有文件都视为新增
+        :param new: 本次的文件树
+        :return: 变化
+        """
+        rev = FileDiff()
+        old_files = old.files if old is not None else {}
+        for file_id, file in new.files.items():
+            previous = old_files.get(file_id)
+            if previous is None:
+                rev.added.append(file)
+            elif not file.same_as(previous):
+                rev.changed.append(file)
+        rev.removed = [file for file_id, file in old_files.items() if file_id not in new.files]
+        return rev
+
+
+class FileCrawler(object):
+    """
+    群文件爬取
+
+    所有群的文件夹请求共用一个线程池, 同时进行的请求数不超过concurrency;
+    再次爬取时先比较GetGroupFileSystemInfo的文件数和已用空间, 都没有变化时直接使用缓存的文件树,
+    这种情况下只重命名或移动的文件不会被发现, 需要时可以强制爬取
+    :param concurrency: 同时进行的最大请求数
+    """
+
+    def __init__(self, concurrency: int = 8):
+        self.concurrency = concurrency
+        self.__trees: dict[int, FileTree] = {}
+        self.__lock = threading.Lock()
+
+    def tree(self, group_id: int) -> FileTree | None:
+        """
+        获取缓存的文件树
+        :param group_id: 群号
+        :return: 上一次爬取的文件树, 没有爬取过时返回None
+        """
+        return self.__trees.get(group_id)
+
+    def crawl(self, group_id: int, force: bool = False) -> FileDiff:
+        """
+        爬取一个群的文件
+        :param group_id: 群号
+        :param force: 是否忽略文件系统信息, 总是重新遍历目录树
+        :return: 与上一次爬取相比的变化
+        """
+        rev = self.crawl_many((group_id,), force)[group_id]
+        if rev.error is not None:
+            raise RuntimeError(rev.error)
+        return rev
+
+    def crawl_many(self, group_ids, force: bool = False) -> dict[int, FileDiff]:
+        """
+        同时爬取多个群的文件, 一个群失败(如没有群文件权限)不影响其它群
+        :param group_ids: 群号的可迭代对象
+        :param force: 是否忽略文件系统信息, 总是重新遍历目录树
+        :return: 键为群号, 值为与上一次爬取相比的变化, 失败的群的FileDiff.error为错误信息
+        """
+        group_ids = list(dict.fromkeys(group_ids))
+        errors: dict[int, str] = {}
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='file-crawler') as executor:
+            infos = {group_id: executor.submit(FileCrawler.__info, group_id) for group_id in group_ids}
+            trees: dict[int, FileTree] = {}
+            pending = {}
+            for group_id in group_ids:
+                try:
+                    info = infos[group_id].result()
+                except Exception as err:
+                    errors[group_id] = f'获取群{group_id}的文件系统信息失败: {err}'
+                    continue
+                if info.get('retcode') != 0:
+                    errors[group_id] = f'获取群{group_id}的文件系统信息失败: {info.get("wording")}'
+                    continue
+                old = self.__trees.get(group_id)
+                if not force and old is not None and \
+                        (old.file_count, old.used_space) == (info['data']['file_count'], info['data']['used_space']):
+                    continue
+                tree = trees[group_id] = FileTree(group_id)
+                tree.file_count, tree.used_space = info['data']['file_count'], info['data']['used_space']
+                pending[executor.submit(FileCrawler.__list, group_id, None)] = (tree, '/')
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    tree, path = pending.pop(future)
+                    if tree.group_id in errors:
+                        continue
+                    try:
+                        files, folders = future.result()
+                    except Exception as err:
+                        errors[tree.group_id] = str(err)
+                        continue
+                    for data in files:
+                        file = GroupFile(tree.group_id, path, data)
+                        tree.files[file.file_id] = file
+                    for data in folders:
+                        folder_path = f'{path}{data["folder_name"]}/'
+                        tree.folders[data['folder_id']] = folder_path
+                        pending[executor.submit(FileCrawler.__list, tree.group_id, data['folder_id'])] = \
+                            (tree, folder_path)
+        rev = {}
+        with self.__lock:
+            for group_id in group_ids:
+                if group_id in errors:
+                    rev[group_id] = FileDiff(errors[group_id])
+                elif group_id in trees:
+                    rev[group_id] = FileDiff.compare(self.__trees.get(group_id), trees[group_id])
+                    self.__trees[group_id] = trees[group_id]
+                else:
+                    rev[group_id] = FileDiff()
+        return rev
+
+    @staticmethod
+    def __info(group_id: int) -> dict:
+        return bot_api.GetGroupFileSystemInfo(group_id).json
+
+    @staticmethod
+    def __list(group_id: int, folder_id: str | None) -> tuple[list[dict], list[dict]]:
+        """
+        获取一个文件夹的内容
+        :param group_id: 群号
+        :param folder_id: 文件夹ID, None为根目录
+        :return: 文件和文件夹
+        """
+        if folder_id is None:
+            response = bot_api.GetGroupRootFiles(group_id).json
+        else:
+            response = bot_api.GetGroupFilesByFolder(group_id, folder_id).json
+        if response.get('retcode') != 0:
+            raise RuntimeError(f'获取群{group_id}的文件列表失败: {response.get("wording")}')
+        data = response['data'] or {}
+        return data.get('files') or [], data.get('folders') or []
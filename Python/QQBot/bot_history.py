@@ -0,0 +1,116 @@
+"""
+bot_history.py
+
+群消息历史的迭代器: 从新到旧自动翻页, 在调用者处理当前页时预取下一页, 可以同时把消息批量写入message表
+"""
+import asyncio
+from concurrent.futures import Future, ThreadPoolExecutor
+import bot_api
+import bot_async_api
+
+
+class GroupHistory(object):
+    """
+    群消息历史, 可以用for或async for从新到旧遍历, 每个元素为GetGroupMsgHistory返回的一条消息
+
+    每次请求返回起始序号及之前的19条消息, 下一页从本页最早的消息序号减一开始;
+    遇到早于since的消息、序号小于stop_seq的消息、取够limit条或没有更早的消息时停止
+    :param group_id: 群号
+    :param start_seq: 起始消息序号, 默认从最新的消息开始
+    :param stop_seq: 最小的消息序号(包含)
+    :param since: 最早的消息时间戳(包含)
+    :param limit: 最多返回的消息数
+    :param backfill: 是否把遍历到的消息写入message表
+    """
+
+    def __init__(
+            self, group_id: int, start_seq: int = None, stop_seq: int = None, since: int = None, limit: int = None,
+            backfill: bool = False
+    ):
+        self.group_id = group_id
+        self.start_seq = start_seq
+        self.stop_seq = stop_seq
+        self.since = since
+        self.limit = limit
+        self.backfill = backfill
+
+    def __page(self, response: dict) -> list[dict]:
+        """
+        检查响应并取出本页消息, 按从新到旧排列
+        """
+        if response.get('retcode') != 0:
+            raise RuntimeError(f'获取群{self.group_id}的消息历史失败: {response.get("wording") or response.get("msg")}')
+        return sorted((response['data'] or {}).get('messages') or [], key=lambda m: m['message_seq'], reverse=True)
+
+    def __accept(self, messages: list[dict], last_seq: int | None, count: int) -> tuple[list[dict], bool]:
+        """
+        按停止条件筛选本页消息
+        :param messages: 从新到旧排列的消息
+        :param last_seq: 上一页最早的消息序号, 用于去掉重复的消息
+        :param count: 已返回的消息数
+        :return: 可以返回的消息, 以及是否已经停止
+        """
+        rev = []
+        for message in messages:
+            if last_seq is not None and message['message_seq'] >= last_seq:
+                continue
+            if self.stop_seq is not None and message['message_seq'] < self.stop_seq:
+                return rev, True
+            if self.since is not None and message['time'] < self.since:
+                return rev, True
+            if self.limit is not None and count + len(rev) >= self.limit:
+                return rev, True
+            rev.append(message)
+        return rev, not rev or (self.limit is not None and count + len(rev) >= self.limit)
+
+    def __save(self, messages: list[dict]) -> None:
+        if self.backfill:
+            for message in messages:
+                bot_api.Message.save(
+                    message['message_id'], message['sender']['user_id'], self.group_id, message['raw_message']
+                )
+
+    def __iter__(self):
+        def fetch(seq: int | None) -> dict:
+            return bot_api.GetGroupMsgHistory(self.group_id, seq).json
+
+        executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='history')
+        future: Future = executor.submit(fetch, self.start_seq)
+        last_seq, count = None, 0
+        try:
+            while future is not None:
+                messages = self.__page(future.result())
+                accepted, stopped = self.__accept(messages, last_seq, count)
+                future = None
+                if not stopped:
+                    last_seq = accepted[-1]['message_seq']
+                    future = executor.submit(fetch, last_seq - 1)
+                self.__save(accepted)
+                count += len(accepted)
+                yield from accepted
+        finally:
+            if future is not None:
+                future.cancel()
+            executor.shutdown(wait=False)
+
+    async def __aiter__(self):
+        def fetch(seq: int | None) -> asyncio.Future:
+            return asyncio.ensure_future(bot_async_api.GetGroupMsgHistory(self.group_id, seq))
+
+        task = fetch(self.start_seq)
+        last_seq, count = None, 0
+        try:
+            while task is not None:
+                messages = self.__page((await task).json)
+                accepted, stopped = self.__accept(messages, last_seq, count)
+                task = None
+                if not stopped:
+                    last_seq = accepted[-1]['message_seq']
+                    task = fetch(last_seq - 1)
+                self.__save(accepted)
+                count += len(accepted)
+                for message in accepted:
+                    yield message
+        finally:
+            if task is not None:
+                task.cancel()
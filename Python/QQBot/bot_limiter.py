@@ -0,0 +1,162 @@
+"""
+bot_limiter.py
+
+令牌桶限流
+"""
+import time
+import threading
+
+
+class TokenBucket(object):
+    """
+    线程安全的令牌桶, 以固定速率生成令牌, 最多积攒capacity个
+    :param rate: 每秒生成的令牌数
+    :param capacity: 桶容量, 即允许的突发量, 默认与rate相同
+    """
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1)
+        self.__tokens = self.capacity
+        self.__last = time.monotonic()
+        self.__lock = threading.Lock()
+
+    def __refill(self) -> None:
+        """
+        补充上次以来生成的令牌, 需要持有锁
+        """
+        now = time.monotonic()
+        self.__tokens = min(self.capacity, self.__tokens + (now - self.__last) * self.rate)
+        self.__last = now
+
+    def reserve(self, tokens: float = 1) -> float:
+        """
+        预定令牌, 令牌不足时仍然扣除, 由调用者等待返回的时间后再执行操作
+        :param tokens: 需要的令牌数
+        :return: 需要等待的秒数
+        """
+        with self.__lock:
+            self.__refill()
+            self.__tokens -= tokens
+            return 0.0 if self.__tokens >= 0 else -self.__tokens / self.rate
+
+    def try_acquire(self, tokens: float = 1) -> bool:
+        """
+        尝试获取令牌, 不等待
+        :param tokens: 需要的令牌数
+        :return: 是否获取成功
+        """
+        with self.__lock:
+            self.__refill()
+            if self.__tokens < tokens:
+                return False
+            self.__tokens -= tokens
+            return True
+
+    def give_back(self, tokens: float = 1) -> None:
+        """
+        归还获取后没有使用的令牌
+        :param tokens: 归还的令牌数
+        """
+        with self.__lock:
+            self.__refill()
+            self.__tokens = min(self.capacity, self.__tokens + tokens)
+
+    def wait_time(self, tokens: float = 1) -> float:
+        """
+        令牌足够还需要的时间, 不消耗令牌
+        :param tokens: 需要的令牌数
+        :return: 需要等待的秒数
+        """
+        with self.__lock:
+            self.__refill()
+            return max(0.0, (tokens - self.__tokens) / self.rate)
+
+    def full(self) -> bool:
+        """
+        令牌是否已补满, 补满的令牌桶与新建的令牌桶没有区别
+        """
+        with self.__lock:
+            self.__refill()
+            return self.__tokens >= self.capacity
+
+    def acquire(self, tokens: float = 1) -> None:
+        """
+        获取令牌, 令牌不足时阻塞当前线程
+        :param tokens: 需要的令牌数
+        """
+        delay = self.reserve(tokens)
+        if delay > 0:
+            time.sleep(delay)
+
+
+class RateLimiter(object):
+    """
+    全局加按对象的两级限流, 每个对象(如群号、QQ号)各有一个令牌桶, 所有对象再共享一个全局令牌桶
+
+    对象的令牌桶补满所需的时间过后, 新建令牌桶时顺便删除已补满的令牌桶, 避免令牌桶随对象数无限增长
+    :param rate: 全局每秒允许的次数
+    :param per_key_rate: 每个对象每秒允许的次数
+    :param capacity: 全局突发量
+    :param per_key_capacity: 每个对象的突发量
+    """
+
+    def __init__(
+            self, rate: float, per_key_rate: float, capacity: float = None, per_key_capacity: float = None
+    ):
+        self.per_key_rate = per_key_rate
+        self.per_key_capacity = per_key_capacity
+        self.__global = TokenBucket(rate, capacity)
+        self.__buckets: dict[object, TokenBucket] = {}
+        self.__lock = threading.Lock()
+        probe = TokenBucket(per_key_rate, per_key_capacity)
+        self.__sweep_interval = probe.capacity / probe.rate  # 令牌桶从空到满的秒数
+        self.__swept = time.monotonic()
+
+    def bucket(self, key) -> TokenBucket:
+        """
+        获取对象对应的令牌桶, 不存在时创建
+        :param key: 对象
+        :return: 令牌桶
+        """
+        bucket = self.__buckets.get(key)
+        if bucket is None:
+            with self.__lock:
+                now = time.monotonic()
+                if now - self.__swept >= self.__sweep_interval:
+                    self.__swept = now
+                    # 其他线程可能刚取得将被删除的令牌桶, 最多使该对象多用一次突发量
+                    for idle in [k for k, b in self.__buckets.items() if b.full()]:
+                        del self.__buckets[idle]
+                bucket = self.__buckets.setdefault(key, TokenBucket(self.per_key_rate, self.per_key_capacity))
+        return bucket
+
+    def acquire(self, key) -> None:
+        """
+        先等待对象自己的令牌, 再等待全局令牌, 避免排队中的对象占用全局额度
+        :param key: 对象
+        """
+        self.bucket(key).acquire()
+        self.__global.acquire()
+
+    def try_acquire(self, key) -> bool:
+        """
+        尝试获取对象自己的令牌和全局令牌, 不等待
+        :param key: 对象
+        :return: 是否都获取成功, 失败时两者都不消耗
+        """
+        bucket = self.bucket(key)
+        if not bucket.try_acquire():
+            return False
+        if not self.__global.try_acquire():
+            bucket.give_back()
+            return False
+        return True
+
+    def retry_after(self, key) -> float:
+        """
+        try_acquire失败后, 对象自己的令牌和全局令牌都足够还需要的时间
+        :param key: 对象
+        :return: 需要等待的秒数
+        """
+        return max(self.bucket(key).wait_time(), self.__global.wait_time())
@@ -1,5 +1,5 @@
 import logging
-import bot_api
+import bot_outbox
 
 
 class Log(object):
@@ -26,7 +26,11 @@ class Log(object):
 
     @staticmethod
     def __send_message_to_dev(message):
-        bot_api.SendPrivateMsg(1397200108, message)
+        try:
+            bot_outbox.Outbox.instance().send_private_msg(1397200108, message, bot_outbox.Priority.ALERT)
+        except RuntimeError:
+            # 进程退出时发送队列已关闭, 只写入日志文件
+            pass
 
     def debug(self, msg: str):
         """
@@ -0,0 +1,192 @@
+"""
+bot_metrics.py
+
+go-cqhttp API调用的统计: 每个终结点的调用数、错误数和延迟直方图
+"""
+import threading
+from bisect import bisect_left
+
+# 延迟直方图的桶上界(秒), 从1毫秒到约60秒按1.5倍递增
+BUCKETS = tuple(round(0.001 * 1.5 ** i, 6) for i in range(28))
+
+
+class EndpointMetrics(object):
+    """
+    单个终结点的统计
+    """
+    __slots__ = ('calls', 'errors', 'total_seconds', 'buckets', 'lock')
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.total_seconds = 0.0
+        self.buckets = [0] * (len(BUCKETS) + 1)  # 最后一个桶为+Inf
+        self.lock = threading.Lock()
+
+    def observe(self, seconds: float, error: bool) -> None:
+        """
+        记录一次调用
+        :param seconds: 耗时
+        :param error: 是否出错
+        """
+        index = bisect_left(BUCKETS, seconds)
+        with self.lock:
+            self.calls += 1
+            self.errors += error
+            self.total_seconds += seconds
+            self.buckets[index] += 1
+
+    def percentile(self, q: float) -> float:
+        """
+        根据直方图估算分位数, 在桶内按线性插值
+        :param q: 0到1之间的分位
+        :return: 估算的耗时(秒), 没有调用时返回0
+        """
+        with self.lock:
+            buckets, calls = list(self.buckets), self.calls
+        if calls == 0:
+            return 0.0
+        rank = q * calls
+        seen = 0
+        for index, count in enumerate(buckets):
+            if count and seen + count >= rank:
+                lower = BUCKETS[index - 1] if index > 0 else 0.0
+                upper = BUCKETS[index] if index < len(BUCKETS) else BUCKETS[-1]
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return BUCKETS[-1]
+
+    def to_dict(self) -> dict:
+        """
+        导出为字典
+        :return: 包含calls、errors、avg、p50、p95、p99的字典, 时间单位为秒
+        """
+        with self.lock:
+            calls, errors, total = self.calls, self.errors, self.total_seconds
+        return {
+            'calls': calls,
+            'errors': errors,
+            'avg': total / calls if calls else 0.0,
+            'p50': self.percentile(0.5),
+            'p95': self.percentile(0.95),
+            'p99': self.percentile(0.99),
+        }
+
+
+class Metrics(object):
+    """
+    所有终结点的统计, 线程安全
+    """
+
+    def __init__(self):
+        self.__endpoints: dict[str, EndpointMetrics] = {}
+        self.__gauges: dict[str, tuple[float, str]] = {}
+        self.__counters: dict[str, tuple[float, str]] = {}
+        self.__lock = threading.Lock()
+
+    def endpoint(self, action: str) -> EndpointMetrics:
+        """
+        获取终结点的统计, 不存在时创建
+        :param action: 终结点名称
+        :return: 终结点的统计
+        """
+        endpoint = self.__endpoints.get(action)
+        if endpoint is None:
+            with self.__lock:
+                endpoint = self.__endpoints.setdefault(action, EndpointMetrics())
+        return endpoint
+
+    def observe(self, action: str, seconds: float, error: bool = False) -> None:
+        """
+        记录一次调用
+        :param action: 终结点名称
+        :param seconds: 耗时
+        :param error: 是否出错
+        """
+        self.endpoint(action).observe(seconds, error)
+
+    def calls(self, action: str) -> int:
+        """
+        获取终结点的调用数
+        :param action: 终结点名称
+        :return: 调用数
+        """
+        endpoint = self.__endpoints.get(action)
+        return endpoint.calls if endpoint is not None else 0
+
+    def set_gauge(self, name: str, value: float, description: str = '') -> None:
+        """
+        设置一个瞬时值, 如熔断器状态
+        :param name: 指标名称, 应符合Prometheus的命名规则
+        :param value: 当前值
+        :param description: 指标说明
+        """
+        with self.__lock:
+            self.__gauges[name] = (value, description)
+
+    def increment(self, name: str, value: float = 1, description: str = '') -> None:
+        """
+        累加一个计数器, 如熔断器打开的次数
+        :param name: 指标名称, 应符合Prometheus的命名规则
+        :param value: 增量
+        :param description: 指标说明
+        """
+        with self.__lock:
+            self.__counters[name] = (self.__counters.get(name, (0, ''))[0] + value, description)
+
+    def reset(self) -> None:
+        """
+        清空所有终结点的统计和计数器, 瞬时值保留
+        """
+        with self.__lock:
+            self.__endpoints.clear()
+            self.__counters.clear()
+
+    def to_dict(self) -> dict[str, dict]:
+        """
+        导出为字典
+        :return: 键为终结点名称, 值为EndpointMetrics.to_dict(); 另有gauges和counters两项, 分别为瞬时值和计数器
+        """
+        with self.__lock:
+            endpoints = dict(self.__endpoints)
+            gauges = {name: value for name, (value, _) in self.__gauges.items()}
+            counters = {name: value for name, (value, _) in self.__counters.items()}
+        rev = {action: endpoint.to_dict() for action, endpoint in sorted(endpoints.items())}
+        rev.update({'gauges': gauges, 'counters': counters})
+        return rev
+
+    def to_prometheus(self) -> str:
+        """
+        导出为Prometheus文本格式
+        :return: Prometheus文本
+        """
+        with self.__lock:
+            endpoints = sorted(self.__endpoints.items())
+            others = [(name, 'gauge') + gauge for name, gauge in self.__gauges.items()]
+            others += [(name, 'counter') + counter for name, counter in self.__counters.items()]
+        rev = []
+        for name, kind, value, description in sorted(others):
+            rev += [f'# HELP {name} {description}', f'# TYPE {name} {kind}', f'{name} {value}']
+        calls = ['# HELP gocqhttp_api_calls_total go-cqhttp API调用次数', '# TYPE gocqhttp_api_calls_total counter']
+        errors = ['# HELP gocqhttp_api_errors_total go-cqhttp API错误次数', '# TYPE gocqhttp_api_errors_total counter']
+        latency = [
+            '# HELP gocqhttp_api_latency_seconds go-cqhttp API调用耗时',
+            '# TYPE gocqhttp_api_latency_seconds histogram'
+        ]
+        for action, endpoint in endpoints:
+            with endpoint.lock:
+                buckets, count, error, total = list(endpoint.buckets), endpoint.calls, endpoint.errors, \
+                    endpoint.total_seconds
+            label = f'endpoint="{action}"'
+            calls.append(f'gocqhttp_api_calls_total{{{label}}} {count}')
+            errors.append(f'gocqhttp_api_errors_total{{{label}}} {error}')
+            cumulative = 0
+            for bound, bucket in zip(BUCKETS + ('+Inf',), buckets):
+                cumulative += bucket
+                latency.append(f'gocqhttp_api_latency_seconds_bucket{{{label},le="{bound}"}} {cumulative}')
+            latency.append(f'gocqhttp_api_latency_seconds_sum{{{label}}} {total}')
+            latency.append(f'gocqhttp_api_latency_seconds_count{{{label}}} {count}')
+        return '\n'.join(rev + calls + errors + latency) + '\n'
+
+
+metrics = Metrics()
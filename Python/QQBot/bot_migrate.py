@@ -0,0 +1,235 @@
+"""
+bot_migrate.py
+
+数据库结构的版本化迁移: 每个迁移有递增的版本号, 已执行的版本记录在schema_version表中, 只执行尚未执行的迁移。
+表结构见database_structure.md, MySQL和SQLite后端各有对应的语句
+
+    python bot_migrate.py              升级到最新版本
+    python bot_migrate.py --explain    升级并输出升级前后热点查询的执行计划
+    python bot_migrate.py --status     只输出当前版本和待执行的迁移
+"""
+import time
+import argparse
+import bot_db
+from bot_log import Log
+from bot_config import config
+
+
+class AddIndex(object):
+    """
+    添加索引的迁移步骤, 索引已存在时跳过: MySQL先查询information_schema.statistics, SQLite使用IF NOT EXISTS
+    :param table: 表名
+    :param name: 索引名
+    :param columns: 列名
+    """
+
+    def __init__(self, table: str, name: str, columns: tuple[str, ...]):
+        self.table = table
+        self.name = name
+        self.columns = columns
+
+    def __call__(self, db: bot_db.DataBase, backend: str) -> None:
+        columns = ', '.join(f'`{column}`' for column in self.columns)
+        if backend == 'sqlite':
+            db.update(f'CREATE INDEX IF NOT EXISTS `{self.name}` ON `{self.table}` ({columns})')
+        elif not db.execute(
+                'SELECT 1 FROM information_schema.statistics '
+                'WHERE table_schema=DATABASE() AND table_name=%s AND index_name=%s LIMIT 1', (self.table, self.name)
+        ):
+            db.update(f'ALTER TABLE `{self.table}` ADD INDEX `{self.name}` ({columns})')
+
+    def __repr__(self) -> str:
+        return f'AddIndex({self.table}, {self.name}, {self.columns})'
+
+
+class Migration(object):
+    """
+    一个迁移
+    :param version: 版本号, 从1开始递增
+    :param description: 说明
+    :param mysql: MySQL后端执行的步骤
+    :param sqlite: SQLite后端执行的步骤
+
+    步骤为语句或参数为(数据库, 后端名称)的函数, 如AddIndex; 每个步骤都应当可以重复执行
+    """
+
+    def __init__(self, version: int, description: str, mysql: list, sqlite: list):
+        self.version = version
+        self.description = description
+        self.statements = {'mysql': mysql, 'sqlite': sqlite}
+
+    def __repr__(self) -> str:
+        return f'Migration({self.version}, {self.description})'
+
+
+# 版本2添加的索引
+INDEXES = [
+    AddIndex('right', 'right_user_id', ('user_id',)),
+    AddIndex('right', 'right_group_id', ('group_id',)),
+    AddIndex('right', 'right_right_user_id', ('right', 'user_id')),
+    AddIndex('message', 'message_message_id', ('message_id',)),
+    AddIndex('message', 'message_user_id', ('user_id',)),
+    AddIndex('message', 'message_group_id_user_id', ('group_id', 'user_id')),
+    AddIndex('event', 'event_group_id_time', ('group_id', 'time')),
+    AddIndex('event', 'event_user_id_time', ('user_id', 'time')),
+]
+
+MIGRATIONS = [
+    Migration(
+        1, '创建message、event、right表',
+        mysql=[
+            # 消息内容最长20000个字符, utf8mb4下超过VARCHAR和TEXT的字节数上限, 使用MEDIUMTEXT
+            'CREATE TABLE IF NOT EXISTS `message` ('
+            '`message_id` INT, `user_id` BIGINT, `group_id` BIGINT, `message` MEDIUMTEXT)',
+            'CREATE TABLE IF NOT EXISTS `event` ('
+            '`time` BIGINT, `post_type` VARCHAR(13), `message_type` VARCHAR(8), `sub_type` VARCHAR(10), '
+            '`message_id` INT, `user_id` BIGINT, `group_id` BIGINT, `raw_message` MEDIUMTEXT, '
+            '`request_type` VARCHAR(7), `notice_type` VARCHAR(15), `meta_event_type` VARCHAR(11))',
+            'CREATE TABLE IF NOT EXISTS `right` (`user_id` BIGINT, `group_id` BIGINT, `right` INT)',
+        ],
+        sqlite=[statement for statement in bot_db.SQLiteBackend.SCHEMA.split(';') if statement.strip()]
+    ),
+    Migration(2, '为权限、消息和事件的查询添加索引', mysql=INDEXES, sqlite=INDEXES),
+]
+
+# 输出执行计划的热点查询: 名称 -> (语句, 参数); bot_right的权限查询, 以及按消息号、用户、群查找bot_api.Message.save
+# 和bot_event.EventRecorder记录的消息和事件
+QUERIES = {
+    'bot_right.get_right(user_id)': ('SELECT `right` FROM `right` WHERE user_id=%s', (10000,)),
+    'bot_right.get_right(group_id)': ('SELECT `right` FROM `right` WHERE group_id=%s', (100000,)),
+    'bot_right.dev_list': ('SELECT user_id FROM `right` WHERE `right`>=%s', (4,)),
+    'bot_right.set_right': ('UPDATE `right` SET `right`=%s WHERE user_id=%s', (1, 10000)),
+    'message(message_id)': ('SELECT user_id, group_id, message FROM message WHERE message_id=%s', (1,)),
+    'message(user_id)': ('SELECT message FROM message WHERE user_id=%s', (10000,)),
+    'message(group_id, user_id)': (
+        'SELECT message FROM message WHERE group_id=%s AND user_id=%s', (100000, 10000)
+    ),
+    'event(group_id, time)': (
+        'SELECT time, user_id, raw_message FROM event WHERE group_id=%s AND time BETWEEN %s AND %s ORDER BY time',
+        (100000, 0, 2000000000)
+    ),
+    'event(user_id, time)': (
+        'SELECT time, group_id, raw_message FROM event WHERE user_id=%s AND time>=%s ORDER BY time', (10000, 0)
+    ),
+}
+
+
+class Migrator(object):
+    """
+    迁移执行器
+
+    每个迁移在一个事务中执行并写入schema_version; MySQL的DDL语句会隐式提交, 失败时已执行的步骤不会回滚,
+    因此每个步骤都可以重复执行(CREATE TABLE IF NOT EXISTS、AddIndex), 修正后重新运行即可从失败的版本继续
+    :param db: 数据库, 默认按配置文件连接bot库
+    :param migrations: 迁移, 默认为MIGRATIONS
+    """
+
+    def __init__(self, db: bot_db.DataBase = None, migrations: list[Migration] = None):
+        self.log = Log('migrate')
+        self.db = db if db is not None else bot_db.DataBase(
+            host=config['database']['host'],
+            user=config['database']['user'],
+            password=config['database']['password'],
+            db='bot'
+        )
+        self.migrations = sorted(migrations if migrations is not None else MIGRATIONS, key=lambda m: m.version)
+        self.backend = 'sqlite' if isinstance(self.db.pool, bot_db.SQLiteBackend) else 'mysql'
+
+    def current(self) -> int:
+        """
+        :return: 当前的版本号, 没有执行过迁移时为0
+        """
+        self.db.update(
+            'CREATE TABLE IF NOT EXISTS `schema_version` '
+            '(`version` INT PRIMARY KEY, `description` VARCHAR(255), `applied_at` BIGINT)'
+        )
+        rev = self.db.execute('SELECT MAX(`version`) FROM `schema_version`')
+        return (rev[0][0] or 0) if rev else 0
+
+    def pending(self) -> list[Migration]:
+        """
+        :return: 尚未执行的迁移
+        """
+        current = self.current()
+        return [migration for migration in self.migrations if migration.version > current]
+
+    def migrate(self, target: int = None) -> list[Migration]:
+        """
+        执行尚未执行的迁移
+        :param target: 升级到的版本号, 默认为最新版本
+        :return: 执行的迁移
+        """
+        applied = []
+        for migration in self.pending():
+            if target is not None and migration.version > target:
+                break
+            start = time.perf_counter()
+            with self.db.transaction():
+                for step in migration.statements[self.backend]:
+                    if callable(step):
+                        step(self.db, self.backend)
+                    else:
+                        self.db.update(step)
+                self.db.update(
+                    'INSERT INTO `schema_version` VALUES (%s, %s, %s)',
+                    (migration.version, migration.description, int(time.time()))
+                )
+            self.log.info(f'迁移到版本{migration.version}: {migration.description}, 耗时{time.perf_counter() - start:.3f}秒')
+            applied.append(migration)
+        return applied
+
+    def explain(self, queries: dict[str, tuple[str, tuple]] = None) -> dict[str, list[str]]:
+        """
+        获取查询的执行计划
+        :param queries: 名称 -> (语句, 参数), 默认为QUERIES
+        :return: 名称 -> 执行计划的每一行
+        """
+        rev = {}
+        for name, (sql, params) in (queries if queries is not None else QUERIES).items():
+            if self.backend == 'sqlite':
+                rows = self.db.execute('EXPLAIN QUERY PLAN ' + sql, params)
+                rev[name] = [row[-1] for row in rows]
+            else:
+                rows = self.db.execute('EXPLAIN ' + sql, params)
+                # id, select_type, table, partitions, type, possible_keys, key, key_len, ref, rows, filtered, Extra
+                rev[name] = [
+                    f'type={row[4]} key={row[6]} rows={row[9]} {row[11] or ""}'.rstrip() if len(row) >= 12 else str(row)
+                    for row in rows
+                ]
+        return rev
+
+
+def print_plans(title: str, plans: dict[str, list[str]]) -> None:
+    """
+    输出执行计划
+    :param title: 标题
+    :param plans: Migrator.explain的结果
+    """
+    print(title)
+    for name, lines in plans.items():
+        print(f'  {name}')
+        for line in lines:
+            print(f'      {line}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='数据库结构迁移')
+    parser.add_argument('--target', type=int, help='升级到的版本号, 默认为最新版本')
+    parser.add_argument('--explain', action='store_true', help='输出升级前后热点查询的执行计划')
+    parser.add_argument('--status', action='store_true', help='只输出当前版本和待执行的迁移')
+    args = parser.parse_args()
+    if not config['database']['available']:
+        raise SystemExit('config.json中的数据库不可用')
+    migrator = Migrator()
+    print(f'当前版本: {migrator.current()}')
+    if args.status:
+        for pending in migrator.pending():
+            print(f'待执行: {pending.version} {pending.description}')
+        raise SystemExit(0)
+    before = migrator.explain() if args.explain else None
+    for done in migrator.migrate(args.target):
+        print(f'已执行: {done.version} {done.description}')
+    print(f'当前版本: {migrator.current()}')
+    if before is not None:
+        print_plans('升级前的执行计划:', before)
+        print_plans('升级后的执行计划:', migrator.explain())
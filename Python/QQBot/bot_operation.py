@@ -4,9 +4,11 @@ bot_operation.py
 用于执行用户指令对应的操作
 """
 import os
+import re
 import json
 import requests
 from bot_api import BlankApi
+from bot_router import Rest, UsageError
 from bot_config import config
 # ChatBot
 from transformers import AutoTokenizer, AutoModel
@@ -38,8 +40,14 @@ class Operation(object):
     :param rev: 该操作返回的信息
     :param user_id: 发起操作的用户
     :param group_id: 发起操作的用户所在群组
+
+    commands、choices、flags、options声明该操作的指令, 由bot_router.Router编译, 见bot_router
     """
     help: str
+    commands: tuple[str, ...] = ()
+    choices: tuple[str, ...] = ()
+    flags: dict[str, str] = {}
+    options: dict[str, tuple[str, type]] = {}
     total = 0
     effective = 0
     running = 0
@@ -58,6 +66,19 @@ class Operation(object):
     def __run(self):
         return None
 
+    @classmethod
+    def from_command(cls, command, api, user_id: int, group_id: int = None) -> 'Operation':
+        """
+        由bot_router解析后的指令创建操作, 声明了commands的子类必须实现, 否则Router.from_base拒绝该子类;
+        参数有误时抛出bot_router.UsageError
+        :param command: bot_router.Command
+        :param api: 该操作对应的API
+        :param user_id: 发起操作的用户
+        :param group_id: 发起操作的用户所在群组
+        :return: 操作
+        """
+        raise NotImplementedError
+
     @classmethod
     def get_help(cls):
         """
@@ -99,6 +120,8 @@ class ChatBot(Operation):
     -d Davinci
     -o ChatGPT
     -t ChatGLM"""
+    commands = ('-c', '--chat')
+    choices = ('-b', '-d', '-o', '-t')
     __tokenizer = {}
     __model = {}
     __token_usage = 0
@@ -110,6 +133,10 @@ class ChatBot(Operation):
         self.prompt = prompt
         super().__init__(api, self.__run(), user_id, group_id)
 
+    @classmethod
+    def from_command(cls, command, api, user_id: int, group_id: int = None) -> 'ChatBot':
+        return ChatBot(api, command.choice, command.text, user_id, group_id)
+
     @staticmethod
     def __set_tokenizer(key, value):
         ChatBot.__tokenizer.update({key: value})
@@ -278,6 +305,10 @@ class Drawer(Operation):
         -b [int] 图片数量
         -j [str] 完整的json参数
             -h 或 --help 样例"""
+    commands = ('-s', '--stablediffusion')
+    choices = ('-e', '-i', '-p', '-t')
+    options = {'-r': ('upscaling_resize', int), '-b': ('batch_size', int), '-j': ('json', Rest)}
+    __image_url = re.compile(r'\[CQ:image,[^\]]*?url=([^,\]]+)')
     __np = """((watermark)), ((nsfw)), ((out of frame)), ((extra fingers)), mutated hands, ((poorly drawn hands)),
         ((poorly drawn face)), (((mutation))), (((deformed))), (((tiling))), ((naked)), ((tile)), ((fleshpile)),
         ((ugly)), (((abstract))), blurry, ((bad anatomy)), ((bad proportions)), ((extra limbs)), cloned face, 
@@ -327,6 +358,31 @@ class Drawer(Operation):
         Operation.effective += 1
         super().__init__(api, self.__run(), user_id, group_id)
 
+    @classmethod
+    def from_command(cls, command, api, user_id: int, group_id: int = None) -> 'Drawer':
+        text, data = command.text, None
+        if 'json' in command.args:
+            try:
+                data = json.loads(command.args['json'])
+            except ValueError as err:
+                raise UsageError(f'-j的参数不是有效的JSON: {err}') from None
+            if not isinstance(data, dict):
+                raise UsageError('-j的参数应为JSON对象')
+        elif command.choice == '-e' and 'upscaling_resize' in command.args:
+            data = {
+                "resize_mode": 0,
+                "upscaling_resize": command.args['upscaling_resize'],
+                "upscaler_1": "R-ESRGAN 4x+ Anime6B",
+            }
+        elif command.choice in ('-i', '-t'):
+            data = dict(Drawer.__intial_data, prompt=Drawer.__image_url.sub('', text).strip())
+            data['batch_size'] = command.args.get('batch_size', 1)
+        url = Drawer.__image_url.search(text)
+        return Drawer(
+            api, user_id, command.choice, save_file=datetime.now().strftime('%Y%m%d%H%M%S%f'), data=data,
+            src_img_url=url.group(1).replace('&amp;', '&') if url else None, group_id=group_id
+        )
+
     @staticmethod
     def image_to_base64(image: Image.Image, fmt: str = 'png') -> str:
         """
@@ -513,11 +569,17 @@ class SysInfo(Operation):
     """
     help = """--sys 查看服务端运行状态
     -d 提供更多细节"""
+    commands = ('--sys',)
+    flags = {'-d': 'detail'}
 
     def __init__(self, api, detail: bool = False, user_id: int = 0, group_id: int = None):
         self.detail = detail
         super().__init__(api, self.__run(), user_id, group_id)
 
+    @classmethod
+    def from_command(cls, command, api, user_id: int, group_id: int = None) -> 'SysInfo':
+        return SysInfo(api, command.args.get('detail', False), user_id, group_id)
+
     def __run(self):
         """
         获取系统信息
@@ -584,6 +646,7 @@ class Translate(Operation):
     :param group_id: 发起操作的用户所在群组
     """
     help = """--translate <text> 翻译文本"""
+    commands = ('--translate',)
 
     def __init__(
             self, api, user_id: int, text: str,
@@ -595,6 +658,10 @@ class Translate(Operation):
         self.tar = tar
         super().__init__(api, self.__run(), user_id, group_id)
 
+    @classmethod
+    def from_command(cls, command, api, user_id: int, group_id: int = None) -> 'Translate':
+        return Translate(api, user_id, command.text, group_id=group_id)
+
     def __run(self):
         return self.__tencent_translate()
 
@@ -0,0 +1,252 @@
+"""
+bot_outbox.py
+
+带优先级和限流的消息发送队列, 调用者提交后立即得到Future, 由后台线程按优先级发送
+"""
+import time
+import queue
+import heapq
+import atexit
+import weakref
+import itertools
+import threading
+from enum import IntEnum
+from concurrent.futures import Future
+import bot_api
+from bot_limiter import RateLimiter
+from bot_config import config
+
+
+class Priority(IntEnum):
+    """
+    消息优先级, 数值越小越先发送
+    """
+    REPLY = 0  # 回复用户的消息
+    BROADCAST = 1  # 群发
+    ALERT = 2  # 发给开发者的日志提醒
+
+
+class _Item(object):
+    """
+    队列中的一条消息
+    """
+    __slots__ = ('priority', 'seq', 'key', 'api', 'args', 'kwargs', 'future')
+
+    def __init__(self, priority: Priority, seq: int, key: tuple, api, args: tuple, kwargs: dict):
+        self.priority = priority
+        self.seq = seq
+        self.key = key
+        self.api = api
+        self.args = args
+        self.kwargs = kwargs
+        self.future = Future()
+
+    def __lt__(self, other: '_Item') -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class Outbox(object):
+    """
+    消息发送队列
+
+    调度线程总是先处理优先级最高的消息; 某个会话(群或私聊)或全局的令牌用完时, 该消息搁置到令牌足够时再调度,
+    调度线程不等待, 不会阻塞其它会话和更高优先级的消息。取得令牌的消息交给发送线程, Future的结果为go-cqhttp的响应数据。
+    同一会话同时只有一条消息在发送或等待令牌, 后面的消息等它完成后再调度, 因此同一会话中同一优先级的消息按提交顺序送达
+    :param rate: 全局每秒最多发送的消息数
+    :param per_conversation_rate: 每个会话每秒最多发送的消息数
+    :param per_conversation_burst: 每个会话允许的突发消息数
+    :param workers: 同时发送的最大数量
+    """
+    __instance = None
+    __instance_lock = threading.Lock()
+
+    def __init__(
+            self, rate: float = 10, per_conversation_rate: float = 1, per_conversation_burst: float = 3,
+            workers: int = 4
+    ):
+        self.limiter = RateLimiter(rate, per_conversation_rate, per_key_capacity=per_conversation_burst)
+        self.__ready: list[_Item] = []
+        self.__delayed: list[tuple[float, _Item]] = []
+        self.__heads: dict[tuple, _Item] = {}  # 会话 -> 正在发送或等待令牌的消息
+        self.__held: dict[tuple, list[_Item]] = {}  # 会话 -> 等待前一条消息完成的消息
+        self.__seq = itertools.count()
+        self.__condition = threading.Condition()
+        self.__closed = False
+        # 发送线程不用concurrent.futures的线程池: 它在atexit之前就已关闭, 进程退出时无法再发送剩余消息
+        self.__jobs: queue.Queue[_Item | None] = queue.Queue()
+        self.__workers = []
+        for index in range(workers):
+            thread = threading.Thread(target=self.__work, name=f'outbox-worker-{index}', daemon=True)
+            thread.start()
+            self.__workers.append(thread)
+        self.__thread = threading.Thread(target=self.__run, name='outbox-scheduler', daemon=True)
+        self.__thread.start()
+
+    @property
+    def pending(self) -> int:
+        """
+        尚未发送的消息数
+        """
+        with self.__condition:
+            return len(self.__ready) + len(self.__delayed) + sum(len(held) for held in self.__held.values())
+
+    def send_group_msg(
+            self, group_id: int, message: str, priority: Priority = Priority.REPLY, auto_escape: bool = False
+    ) -> Future:
+        """
+        提交一条群聊消息
+        :param group_id: 群号
+        :param message: 要发送的内容
+        :param priority: 优先级
+        :param auto_escape: 消息内容是否作为纯文本发送
+        :return: 结果为go-cqhttp响应数据的Future
+        """
+        return self.__submit(
+            priority, ('group', group_id), bot_api.SendGroupMsg, (group_id, message, auto_escape), {}
+        )
+
+    def send_private_msg(
+            self, user_id: int, message: str, priority: Priority = Priority.REPLY,
+            group_id: int = None, auto_escape: bool = False
+    ) -> Future:
+        """
+        提交一条私聊消息
+        :param user_id: 对方 QQ 号
+        :param message: 要发送的内容
+        :param priority: 优先级
+        :param group_id: 主动发起临时会话时的来源群号
+        :param auto_escape: 消息内容是否作为纯文本发送
+        :return: 结果为go-cqhttp响应数据的Future
+        """
+        return self.__submit(
+            priority, ('private', user_id), bot_api.SendPrivateMsg, (user_id, message, group_id, auto_escape), {}
+        )
+
+    def __submit(self, priority: Priority, key: tuple, api, args: tuple, kwargs: dict) -> Future:
+        item = _Item(priority, next(self.__seq), key, api, args, kwargs)
+        with self.__condition:
+            if self.__closed:
+                raise RuntimeError('发送队列已关闭')
+            heapq.heappush(self.__ready, item)
+            self.__condition.notify()
+        return item.future
+
+    def __next(self) -> _Item | None:
+        """
+        取出下一条可以发送的消息并把它设为所在会话的队首, 会话已有队首时先搁置;
+        队列关闭且所有消息都已发送时返回None
+        """
+        with self.__condition:
+            while True:
+                now = time.monotonic()
+                while self.__delayed and self.__delayed[0][0] <= now:
+                    heapq.heappush(self.__ready, heapq.heappop(self.__delayed)[1])
+                while self.__ready:
+                    item = heapq.heappop(self.__ready)
+                    head = self.__heads.get(item.key)
+                    if head is None:
+                        self.__heads[item.key] = item
+                        return item
+                    if head is item:
+                        return item
+                    heapq.heappush(self.__held.setdefault(item.key, []), item)
+                if self.__closed and not self.__delayed and not self.__heads:
+                    return None
+                self.__condition.wait(self.__delayed[0][0] - now if self.__delayed else None)
+
+    def __done(self, item: _Item) -> None:
+        """
+        会话的队首发送完成或被取消, 放回该会话搁置的消息
+        """
+        with self.__condition:
+            if self.__heads.get(item.key) is item:
+                del self.__heads[item.key]
+            for held in self.__held.pop(item.key, ()):
+                heapq.heappush(self.__ready, held)
+            self.__condition.notify()
+
+    def __run(self) -> None:
+        while (item := self.__next()) is not None:
+            if item.future.cancelled():
+                self.__done(item)
+                continue
+            if not self.limiter.try_acquire(item.key):
+                with self.__condition:
+                    heapq.heappush(self.__delayed, (time.monotonic() + self.limiter.retry_after(item.key), item))
+                continue
+            if not item.future.set_running_or_notify_cancel():
+                self.__done(item)
+                continue
+            self.__jobs.put(item)
+
+    def __work(self) -> None:
+        while (item := self.__jobs.get()) is not None:
+            try:
+                item.future.set_result(item.api(*item.args, **item.kwargs).json)
+            except Exception as err:
+                item.future.set_exception(err)
+            finally:
+                self.__done(item)
+
+    def __cancel(self) -> int:
+        """
+        取消所有尚未开始发送的消息
+        :return: 取消的消息数
+        """
+        with self.__condition:
+            items = self.__ready + [item for _, item in self.__delayed]
+            items += [item for held in self.__held.values() for item in held]
+            for _, item in self.__delayed:
+                if self.__heads.get(item.key) is item:
+                    del self.__heads[item.key]
+            self.__ready, self.__delayed, self.__held = [], [], {}
+            self.__condition.notify()
+        return sum(item.future.cancel() for item in items)
+
+    def close(self, wait: bool = True, timeout: float = None) -> int:
+        """
+        关闭队列, 不再接受新消息, 已提交的消息仍会在后台发送
+        :param wait: 是否等待所有消息发送完成
+        :param timeout: 最多等待的秒数, 超时后取消尚未开始发送的消息并等待正在发送的消息完成, None表示一直等待
+        :return: 超时取消的消息数
+        """
+        with self.__condition:
+            self.__closed = True
+            self.__condition.notify()
+        if not wait:
+            return 0
+        self.__thread.join(timeout)
+        cancelled = self.__cancel() if self.__thread.is_alive() else 0
+        self.__thread.join()
+        for _ in self.__workers:
+            self.__jobs.put(None)
+        for thread in self.__workers:
+            thread.join()
+        return cancelled
+
+    @staticmethod
+    def instance() -> 'Outbox':
+        """
+        获取进程内共享的发送队列, 第一次调用时根据配置文件创建。
+        进程退出时最多等待outbox.shutdown_timeout秒发送剩余消息, 超时的消息被取消
+        :return: 发送队列
+        """
+        if Outbox.__instance is None:
+            with Outbox.__instance_lock:
+                if Outbox.__instance is None:
+                    options = config.get('outbox', {})
+                    outbox = Outbox(
+                        rate=options.get('rate', 10),
+                        per_conversation_rate=options.get('per_conversation_rate', 1),
+                        per_conversation_burst=options.get('per_conversation_burst', 3),
+                        workers=options.get('workers', 4)
+                    )
+                    # atexit中后注册的先执行, 进程退出时按以下顺序关闭:
+                    # 1. 本队列发送剩余消息; 2. bot_db.BatchWriter写入这些消息; 3. 存储后端关闭;
+                    # 4. weakref.finalize清空urllib3的连接池(pool_block的连接池被清空后取连接会永远等待)。
+                    # 后两者在第一次使用时才注册, 因此先创建message表的批量写入, 并确保weakref.finalize已注册
+                    bot_api.Message.writer()
+                    weakref.finalize(outbox, int)
+                    atexit.register(outbox.close, timeout=options.get('shutdown_timeout', 10))
+                    Outbox.__instance = outbox
+        return Outbox.__instance
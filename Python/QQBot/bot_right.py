@@ -107,9 +107,9 @@ class Right(object):
         """
         try:
             if group_id:
-                group_right = self.db.execute(f'SELECT `right` FROM `right` WHERE group_id={group_id}')
+                group_right = self.db.execute('SELECT `right` FROM `right` WHERE group_id=%s', (group_id,))
                 return group_right[0][0]
-            user_right = self.db.execute(f'SELECT `right` FROM `right` WHERE user_id={user_id}')
+            user_right = self.db.execute('SELECT `right` FROM `right` WHERE user_id=%s', (user_id,))
             if len(user_right) == 0:
                 return 0
             return user_right[0][0]
@@ -128,17 +128,14 @@ class Right(object):
         try:
             if not self.is_valid(right):
                 return False
-            # 先查询是否存在, 存在则更新, 不存在则插入
-            if user_id:
-                if len(self.db.execute(f'SELECT * FROM `right` WHERE user_id={user_id}')) == 0:
-                    self.db.execute(f'INSERT INTO `right` VALUES ({user_id}, null, {right})')
-                else:
-                    self.db.execute(f'UPDATE `right` SET `right`={right} WHERE user_id={user_id}')
-            elif group_id:
-                if len(self.db.execute(f'SELECT * FROM `right` WHERE group_id={group_id}')) == 0:
-                    self.db.execute(f'INSERT INTO `right` VALUES (null, {group_id}, {right})')
-                else:
-                    self.db.execute(f'UPDATE `right` SET `right`={right} WHERE group_id={group_id}')
+            # 在同一事务中先更新, 没有匹配的行则插入
+            with self.db.transaction():
+                if user_id:
+                    if self.db.update('UPDATE `right` SET `right`=%s WHERE user_id=%s', (right, user_id)) == 0:
+                        self.db.update('INSERT INTO `right` VALUES (%s, null, %s)', (user_id, right))
+                elif group_id:
+                    if self.db.update('UPDATE `right` SET `right`=%s WHERE group_id=%s', (right, group_id)) == 0:
+                        self.db.update('INSERT INTO `right` VALUES (null, %s, %s)', (group_id, right))
             return True
         except Exception as err:
             self.log.warning(f'{err}.设置用户权限失败：right={right} user_id={user_id} group_id={group_id}')
@@ -153,9 +150,9 @@ class Right(object):
         """
         try:
             if user_id:
-                self.db.execute(f'DELETE FROM `right` WHERE user_id={user_id}')
+                self.db.update('DELETE FROM `right` WHERE user_id=%s', (user_id,))
             elif group_id:
-                self.db.execute(f'DELETE FROM `right` WHERE group_id={group_id}')
+                self.db.update('DELETE FROM `right` WHERE group_id=%s', (group_id,))
             return True
         except Exception as err:
             self.log.warning(str(err) + '，删除用户权限失败：user_id=' + str(user_id) + ' group_id=' + str(group_id))
@@ -167,7 +164,7 @@ class Right(object):
         :return: 开发者元组
         """
         try:
-            raw = self.db.execute(f'SELECT user_id FROM `right` WHERE `right`>={Right.__DEV}')
+            raw = self.db.execute('SELECT user_id FROM `right` WHERE `right`>=%s', (Right.__DEV,))
             return tuple(data[0] for data in raw)
         except bot_db.pymysql.MySQLError:
             return ()
@@ -178,7 +175,7 @@ class Right(object):
         :return: 测试者元组
         """
         try:
-            raw = self.db.execute(f'SELECT user_id FROM `right` WHERE `right`>={Right.__TEST}')
+            raw = self.db.execute('SELECT user_id FROM `right` WHERE `right`>=%s', (Right.__TEST,))
             return tuple(data[0] for data in raw)
         except bot_db.pymysql.MySQLError:
             return ()
@@ -189,7 +186,7 @@ class Right(object):
         :return: 用户元组
         """
         try:
-            raw = self.db.execute(f'SELECT user_id FROM `right` WHERE `right`>={Right.__USER}')
+            raw = self.db.execute('SELECT user_id FROM `right` WHERE `right`>=%s', (Right.__USER,))
             return tuple(data[0] for data in raw)
         except bot_db.pymysql.MySQLError:
             return ()
@@ -0,0 +1,327 @@
+"""
+bot_roster.py
+
+群成员名册: 每个群的成员按QQ号、群名片或昵称前缀、角色建立索引,
+第一次访问时由GetGroupMemberList批量加载, 之后根据群成员变动的通知增量更新
+"""
+import sys
+import threading
+from bisect import bisect_left, insort
+import bot_api
+from bot_log import Log
+
+
+class Member(object):
+    """
+    群成员, 只保留名册需要的字段
+    :param user_id: QQ号
+    :param nickname: 昵称
+    :param card: 群名片
+    :param role: 角色, owner、admin或member
+    :param join_time: 加群时间戳
+    :param title: 专属头衔
+    """
+    __slots__ = ('user_id', 'nickname', 'card', 'role', 'join_time', 'title')
+
+    def __init__(
+            self, user_id: int, nickname: str = '', card: str = '', role: str = 'member', join_time: int = 0,
+            title: str = ''
+    ):
+        self.user_id = user_id
+        self.nickname = nickname
+        self.card = card
+        self.role = sys.intern(role)
+        self.join_time = join_time
+        self.title = title
+
+    @property
+    def name(self) -> str:
+        """
+        群内显示的名字, 没有群名片时为昵称
+        """
+        return self.card or self.nickname
+
+    @staticmethod
+    def from_json(data: dict) -> 'Member':
+        """
+        由GetGroupMemberInfo或GetGroupMemberList返回的成员数据创建
+        :param data: 成员数据
+        :return: 群成员
+        """
+        return Member(
+            user_id=data['user_id'],
+            nickname=data.get('nickname') or '',
+            card=data.get('card') or '',
+            role=data.get('role') or 'member',
+            join_time=data.get('join_time') or 0,
+            title=data.get('title') or ''
+        )
+
+    def __repr__(self) -> str:
+        return f'Member({self.user_id}, {self.name!r}, {self.role})'
+
+
+class GroupRoster(object):
+    """
+    单个群的名册, 线程安全
+
+    名字索引是按小写名字排序的(名字, QQ号)列表, 群名片和昵称各占一项, 前缀查找用二分法定位
+    :param group_id: 群号
+    """
+
+    def __init__(self, group_id: int):
+        self.group_id = group_id
+        self.__members: dict[int, Member] = {}
+        self.__names: list[tuple[str, int]] = []
+        self.__roles: dict[str, set[int]] = {}
+        self.__lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self.__members)
+
+    def __contains__(self, user_id: int) -> bool:
+        return user_id in self.__members
+
+    @staticmethod
+    def __keys(member: Member) -> set[str]:
+        return {name.casefold() for name in (member.card, member.nickname) if name}
+
+    def load(self, members: list[dict]) -> None:
+        """
+        用完整的成员列表替换名册
+        :param members: GetGroupMemberList返回的成员数据
+        """
+        parsed = {data['user_id']: Member.from_json(data) for data in members}
+        names = sorted((key, user_id) for user_id, member in parsed.items() for key in GroupRoster.__keys(member))
+        roles: dict[str, set[int]] = {}
+        for user_id, member in parsed.items():
+            roles.setdefault(member.role, set()).add(user_id)
+        with self.__lock:
+            self.__members, self.__names, self.__roles = parsed, names, roles
+
+    def add(self, member: Member) -> None:
+        """
+        加入或替换一个成员
+        :param member: 群成员
+        """
+        with self.__lock:
+            self.remove(member.user_id)
+            self.__members[member.user_id] = member
+            for key in GroupRoster.__keys(member):
+                insort(self.__names, (key, member.user_id))
+            self.__roles.setdefault(member.role, set()).add(member.user_id)
+
+    def remove(self, user_id: int) -> Member | None:
+        """
+        移除一个成员
+        :param user_id: QQ号
+        :return: 被移除的成员, 不在名册中时返回None
+        """
+        with self.__lock:
+            member = self.__members.pop(user_id, None)
+            if member is None:
+                return None
+            for key in GroupRoster.__keys(member):
+                index = bisect_left(self.__names, (key, user_id))
+                if index < len(self.__names) and self.__names[index] == (key, user_id):
+                    del self.__names[index]
+            self.__roles.get(member.role, set()).discard(user_id)
+            return member
+
+    def set_card(self, user_id: int, card: str) -> None:
+        """
+        修改成员的群名片
+        :param user_id: QQ号
+        :param card: 新的群名片
+        """
+        with self.__lock:
+            member = self.__members.get(user_id)
+            if member is not None:
+                self.remove(user_id)
+                member.card = card
+                self.add(member)
+
+    def set_role(self, user_id: int, role: str) -> None:
+        """
+        修改成员的角色
+        :param user_id: QQ号
+        :param role: 新的角色
+        """
+        with self.__lock:
+            member = self.__members.get(user_id)
+            if member is not None:
+                self.__roles.get(member.role, set()).discard(user_id)
+                member.role = sys.intern(role)
+                self.__roles.setdefault(member.role, set()).add(user_id)
+
+    def get(self, user_id: int) -> Member | None:
+        """
+        按QQ号查找成员
+        :param user_id: QQ号
+        :return: 群成员, 不存在时返回None
+        """
+        return self.__members.get(user_id)
+
+    def find(self, prefix: str, limit: int = None) -> list[Member]:
+        """
+        按群名片或昵称的前缀查找成员, 不区分大小写
+        :param prefix: 名字前缀
+        :param limit: 最多返回的数量, 默认不限
+        :return: 按名字排序的群成员
+        """
+        prefix = prefix.casefold()
+        rev: dict[int, Member] = {}
+        with self.__lock:
+            index = bisect_left(self.__names, (prefix,))
+            while index < len(self.__names) and self.__names[index][0].startswith(prefix):
+                user_id = self.__names[index][1]
+                rev.setdefault(user_id, self.__members[user_id])
+                if limit is not None and len(rev) >= limit:
+                    break
+                index += 1
+        return list(rev.values())
+
+    def with_role(self, role: str) -> list[Member]:
+        """
+        按角色查找成员
+        :param role: owner、admin或member
+        :return: 该角色的所有成员
+        """
+        with self.__lock:
+            return [self.__members[user_id] for user_id in self.__roles.get(role, ())]
+
+    def members(self) -> list[Member]:
+        """
+        获取全部成员
+        :return: 群成员列表
+        """
+        with self.__lock:
+            return list(self.__members.values())
+
+
+class Roster(object):
+    """
+    所有群的名册, 线程安全, 进程内共享一个实例
+
+    群的名册在第一次访问时加载; 群成员变动的通知由handle_notice更新已加载的群,
+    实例可以作为bot_event.EventServer的通知事件处理函数, EventServer.instance()会登记共享的实例
+    """
+    __instance = None
+    __instance_lock = threading.Lock()
+
+    def __init__(self):
+        self.log = Log('roster')
+        self.__groups: dict[int, GroupRoster] = {}
+        self.__lock = threading.Lock()
+
+    def group(self, group_id: int, refresh: bool = False) -> GroupRoster:
+        """
+        获取群的名册, 尚未加载或refresh为True时调用GetGroupMemberList加载
+        :param group_id: 群号
+        :param refresh: 是否重新加载
+        :return: 群的名册
+        """
+        roster = self.__groups.get(group_id)
+        if roster is not None and not refresh:
+            return roster
+        response = bot_api.GetGroupMemberList(group_id, True).json
+        bot_api.cache.invalidate(bot_api.GetGroupMemberList, group_id=group_id)  # 名册已保存成员, 不再缓存原始响应
+        if response.get('retcode') != 0:
+            raise RuntimeError(f'获取群{group_id}的成员列表失败: {response.get("wording") or response.get("msg")}')
+        with self.__lock:
+            roster = self.__groups.setdefault(group_id, GroupRoster(group_id))
+        roster.load(response['data'] or [])
+        return roster
+
+    def loaded(self, group_id: int) -> bool:
+        """
+        群的名册是否已加载
+        :param group_id: 群号
+        :return: 是否已加载
+        """
+        return group_id in self.__groups
+
+    def forget(self, group_id: int) -> None:
+        """
+        丢弃群的名册, 下次访问时重新加载
+        :param group_id: 群号
+        """
+        with self.__lock:
+            self.__groups.pop(group_id, None)
+
+    def get(self, group_id: int, user_id: int) -> Member | None:
+        """
+        按QQ号查找群成员
+        :param group_id: 群号
+        :param user_id: QQ号
+        :return: 群成员, 不存在时返回None
+        """
+        return self.group(group_id).get(user_id)
+
+    def find(self, group_id: int, prefix: str, limit: int = None) -> list[Member]:
+        """
+        按群名片或昵称的前缀查找群成员, 不区分大小写
+        :param group_id: 群号
+        :param prefix: 名字前缀
+        :param limit: 最多返回的数量, 默认不限
+        :return: 按名字排序的群成员
+        """
+        return self.group(group_id).find(prefix, limit)
+
+    def with_role(self, group_id: int, role: str) -> list[Member]:
+        """
+        按角色查找群成员
+        :param group_id: 群号
+        :param role: owner、admin或member
+        :return: 该角色的所有成员
+        """
+        return self.group(group_id).with_role(role)
+
+    def __call__(self, event) -> None:
+        self.handle_notice(event)
+
+    def handle_notice(self, event) -> bool:
+        """
+        根据go-cqhttp的通知事件更新名册,
+        处理group_increase、group_decrease、group_card和group_admin, 其它事件和未加载的群忽略
+        :param event: bot_event.Event或上报的数据
+        :return: 名册是否有变化
+        """
+        data: dict = getattr(event, 'data', event)
+        if data.get('post_type') != 'notice':
+            return False
+        notice_type, group_id, user_id = data.get('notice_type'), data.get('group_id'), data.get('user_id')
+        roster = self.__groups.get(group_id)
+        if roster is None:
+            return False
+        if notice_type == 'group_increase':
+            response = bot_api.GetGroupMemberInfo(group_id, user_id, True).json
+            if response.get('retcode') == 0:
+                roster.add(Member.from_json(response['data']))
+            else:
+                self.log.warning(f'获取群{group_id}的新成员{user_id}的信息失败, 只记录QQ号')
+                roster.add(Member(user_id, join_time=data.get('time') or 0))
+        elif notice_type == 'group_decrease':
+            if data.get('sub_type') == 'kick_me' or user_id == data.get('self_id'):
+                self.forget(group_id)
+            else:
+                roster.remove(user_id)
+        elif notice_type == 'group_card':
+            roster.set_card(user_id, data.get('card_new') or '')
+        elif notice_type == 'group_admin':
+            roster.set_role(user_id, 'admin' if data.get('sub_type') == 'set' else 'member')
+        else:
+            return False
+        return True
+
+    @staticmethod
+    def instance() -> 'Roster':
+        """
+        获取进程内共享的名册
+        :return: 名册
+        """
+        if Roster.__instance is None:
+            with Roster.__instance_lock:
+                if Roster.__instance is None:
+                    Roster.__instance = Roster()
+        return Roster.__instance
@@ -0,0 +1,212 @@
+"""
+bot_router.py
+
+指令路由: 由Operation子类声明的指令和参数在启动时编译为前缀树, 一次扫描完成指令匹配和参数解析
+
+Operation子类通过以下类属性声明指令:
+
+    commands: 指令名, 如('-c', '--chat')
+    choices: 互斥的子指令, 解析结果为Command.choice, 如('-d', '-o', '-t')
+    flags: 开关参数 -> 参数名, 如{'-d': 'detail'}
+    options: 带值的参数 -> (参数名, 类型), 如{'-b': ('batch_size', int)}; 类型为Rest时值为该参数之后的全部内容
+
+子指令和-h、--help只在第一个不是参数的词之前识别, 开关参数和带值的参数在任意位置识别,
+其余的词按原来的顺序组成Command.text, 因此"-s -i [图片] -b 2 提示词"中的-b 2仍是参数
+"""
+import os
+from bot_log import Log
+
+
+class Rest(str):
+    """
+    带值参数的类型, 值为该参数之后的全部内容, 用于可能包含空格和参数名的值, 如JSON
+    """
+
+
+class UsageError(ValueError):
+    """
+    指令的参数有误, 由Operation.from_command抛出, Router.dispatch把错误信息和帮助信息返回给用户
+    """
+
+
+class Command(object):
+    """
+    解析后的指令
+    :param operation: 指令对应的Operation子类
+    :param name: 指令名
+    """
+    __slots__ = ('operation', 'name', 'choice', 'args', 'text', 'help', 'error')
+
+    def __init__(self, operation: type, name: str):
+        self.operation = operation
+        self.name = name
+        self.choice: str | None = None
+        self.args: dict[str, object] = {}
+        self.text = ''
+        self.help = False
+        self.error: str | None = None
+
+    def __repr__(self) -> str:
+        return f'Command({self.name}, choice={self.choice}, args={self.args}, text={self.text!r})'
+
+
+class Router(object):
+    """
+    指令路由
+
+    前缀树的每个节点为字典, 键为字符, 空字符串键保存指令对应的Operation子类;
+    不以任何指令的首字符开头的消息只需一次比较就被排除
+    :param operations: 声明了commands的Operation子类
+    """
+    __HELP = ('-h', '--help')
+
+    def __init__(self, operations):
+        self.log = Log('router')
+        self.__trie: dict = {}
+        self.__specs: dict[type, dict[str, tuple]] = {}
+        for operation in operations:
+            spec = {choice: ('choice', choice, None) for choice in getattr(operation, 'choices', ())}
+            spec.update({flag: ('flag', name, None) for flag, name in getattr(operation, 'flags', {}).items()})
+            spec.update({
+                option: ('option', name, kind) for option, (name, kind) in getattr(operation, 'options', {}).items()
+            })
+            spec.update({flag: ('help', None, None) for flag in Router.__HELP})
+            self.__specs[operation] = spec
+            for command in operation.commands:
+                node = self.__trie
+                for char in command:
+                    node = node.setdefault(char, {})
+                if '' in node:
+                    raise ValueError(f'指令{command}重复: {node[""].__name__}, {operation.__name__}')
+                node[''] = operation
+        self.__first = frozenset(self.__trie)
+
+    @staticmethod
+    def from_base(base: type) -> 'Router':
+        """
+        由基类的所有声明了commands的子类(包括子类的子类)创建路由,
+        声明了commands却没有实现from_command的子类在启动时抛出TypeError, 而不是在收到指令时才失败
+        :param base: Operation基类
+        :return: 指令路由
+        """
+        operations, stack = [], list(base.__subclasses__())
+        while stack:
+            operation = stack.pop()
+            stack.extend(operation.__subclasses__())
+            if getattr(operation, 'commands', ()):
+                owner = next((klass for klass in operation.__mro__ if 'from_command' in vars(klass)), base)
+                if owner is base:
+                    raise TypeError(f'{operation.__name__}声明了指令{operation.commands}, 但没有实现from_command')
+                operations.append(operation)
+        return Router(operations)
+
+    def parse(self, message: str) -> Command | None:
+        """
+        解析消息
+        :param message: 消息内容
+        :return: 解析后的指令, 不是指令时返回None
+        """
+        if not message or message[0] not in self.__first:
+            return None
+        node, index, length = self.__trie, 0, len(message)
+        while index < length and not message[index].isspace():
+            node = node.get(message[index])
+            if node is None:
+                return None
+            index += 1
+        operation = node.get('')
+        if operation is None:
+            return None
+        command = Command(operation, message[:index])
+        spec = self.__specs[operation]
+        pending = None  # 等待取值的带值参数
+        texts = []  # 组成text的连续片段
+        text_start = text_end = None  # 当前片段在message中的范围
+        while index < length:
+            while index < length and message[index].isspace():
+                index += 1
+            start = index
+            while index < length and not message[index].isspace():
+                index += 1
+            if start == index:
+                break
+            token = message[start:index]
+            if pending is not None:
+                name, value_type = pending
+                pending = None
+                if value_type is Rest:
+                    if token in Router.__HELP:
+                        command.help = True
+                    else:
+                        command.args[name] = Rest(message[start:].strip())
+                    break
+                try:
+                    command.args[name] = value_type(token)
+                except ValueError:
+                    command.error = f'参数{name}的值{token}无效'
+                    return command
+                continue
+            kind, name, value_type = spec.get(token, (None, None, None))
+            if text_start is not None and kind in ('choice', 'help'):
+                kind = None
+            if kind is None:
+                if text_start is None or text_end is None:
+                    text_start = start
+                text_end = index
+                continue
+            if text_end is not None:
+                texts.append(message[text_start:text_end])
+                text_end = None
+            if kind == 'choice':
+                command.choice = token
+            elif kind == 'flag':
+                command.args[name] = True
+            elif kind == 'option':
+                pending = (name, value_type)
+            elif kind == 'help':
+                command.help = True
+        if text_end is not None:
+            texts.append(message[text_start:text_end])
+        command.text = ' '.join(texts)
+        if pending is not None:
+            command.error = f'参数{pending[0]}缺少值'
+        elif getattr(operation, 'choices', ()) and command.choice is None and not command.help:
+            command.error = '缺少子指令'
+        return command
+
+    def dispatch(self, message: str, api, user_id: int, group_id: int = None):
+        """
+        解析消息并执行对应的操作
+        :param message: 消息内容
+        :param api: 操作对应的API
+        :param user_id: 发起操作的用户
+        :param group_id: 发起操作的用户所在群组
+        :return: 操作返回的信息, 不是指令时返回None, 需要帮助或参数有误时返回帮助信息
+        """
+        command = self.parse(message)
+        if command is None:
+            return None
+        if not command.help and not command.error:
+            try:
+                return command.operation.from_command(command, api, user_id, group_id).rev
+            except UsageError as err:
+                command.error = str(err)
+        return (command.error + '\n' if command.error else '') + command.operation.get_help()
+
+    def handler(self, api):
+        """
+        生成bot_event.EventServer的消息处理函数, 操作的结果作为快速操作回复:
+        文本直接回复, 文件路径的列表(如bot_operation.Drawer生成的图片)回复为图片, 其它结果记录日志后忽略
+        :param api: 操作对应的API
+        :return: 参数为消息事件的函数
+        """
+        def handle(event):
+            rev = self.dispatch(event.raw_message, api, event.user_id, event.group_id)
+            if rev is None or isinstance(rev, str):
+                return rev or None
+            if isinstance(rev, (list, tuple)) and all(isinstance(path, str) and os.path.isfile(path) for path in rev):
+                return ''.join(f'[CQ:image,file=file:///{os.path.abspath(path)}]' for path in rev) or None
+            self.log.warning(f'指令的结果无法回复: {rev!r}, 消息: {event.raw_message}')
+            return None
+
+        return handle
@@ -0,0 +1,531 @@
+"""
+bot_transport.py
+
+与go-cqhttp通信的传输层, 由bot_api中所有API类共享
+"""
+import json
+import time
+import random
+import asyncio
+import itertools
+import threading
+import requests
+from aiohttp import ClientError, ClientSession, ClientTimeout, TCPConnector, WSMsgType
+from requests.adapters import HTTPAdapter
+from abc import ABC, abstractmethod
+from bot_metrics import metrics
+from bot_config import config
+
+
+class TransportError(Exception):
+    """
+    与go-cqhttp通信失败
+    :param message: 错误信息
+    :param retryable: 是否可以重试, 连接失败、超时和5xx为True, go-cqhttp能正常响应但请求有误时为False
+    """
+
+    def __init__(self, message: str, retryable: bool = True):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+class CircuitOpenError(TransportError):
+    """
+    熔断器处于打开状态, 请求未发送
+    """
+
+    def __init__(self, message: str):
+        super().__init__(message, False)
+
+
+class CircuitBreaker(object):
+    """
+    熔断器, 线程安全
+
+    连续failure_threshold次可重试的失败后打开, 打开期间请求直接抛出CircuitOpenError;
+    经过reset_timeout秒后进入半开状态, 只放行一个探测请求, 成功则关闭, 失败则重新打开。
+    状态变化记录在bot_metrics中: gocqhttp_circuit_state(0关闭, 1打开, 2半开)和gocqhttp_circuit_opened_total
+    :param failure_threshold: 打开熔断器所需的连续失败次数
+    :param reset_timeout: 打开后到允许探测的秒数
+    """
+    CLOSED = 0
+    OPEN = 1
+    HALF_OPEN = 2
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 10):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.__state = CircuitBreaker.CLOSED
+        self.__failures = 0
+        self.__opened_at = 0.0
+        self.__probing = False
+        self.__lock = threading.Lock()
+        self.__set_state(CircuitBreaker.CLOSED)
+
+    @property
+    def state(self) -> int:
+        """
+        当前状态
+        """
+        return self.__state
+
+    def __set_state(self, state: int) -> None:
+        self.__state = state
+        metrics.set_gauge('gocqhttp_circuit_state', state, 'go-cqhttp熔断器状态, 0关闭, 1打开, 2半开')
+        if state == CircuitBreaker.OPEN:
+            self.__opened_at = time.monotonic()
+            metrics.increment('gocqhttp_circuit_opened_total', 1, 'go-cqhttp熔断器打开次数')
+
+    def before_request(self) -> None:
+        """
+        发送请求前调用, 不允许发送时抛出CircuitOpenError
+        """
+        with self.__lock:
+            if self.__state == CircuitBreaker.OPEN and time.monotonic() - self.__opened_at >= self.reset_timeout:
+                self.__set_state(CircuitBreaker.HALF_OPEN)
+                self.__probing = False
+            if self.__state == CircuitBreaker.OPEN or (self.__state == CircuitBreaker.HALF_OPEN and self.__probing):
+                raise CircuitOpenError('go-cqhttp暂时不可用, 请求未发送')
+            if self.__state == CircuitBreaker.HALF_OPEN:
+                self.__probing = True
+
+    def record_success(self) -> None:
+        """
+        请求成功(包括go-cqhttp正常返回错误)后调用
+        """
+        with self.__lock:
+            self.__failures = 0
+            self.__probing = False
+            if self.__state != CircuitBreaker.CLOSED:
+                self.__set_state(CircuitBreaker.CLOSED)
+
+    def record_failure(self) -> None:
+        """
+        请求因连接失败、超时等原因失败后调用
+        """
+        with self.__lock:
+            self.__failures += 1
+            self.__probing = False
+            if self.__state == CircuitBreaker.HALF_OPEN or self.__failures >= self.failure_threshold:
+                self.__set_state(CircuitBreaker.OPEN)
+
+
+class RetryPolicy(object):
+    """
+    重试策略, 只用于幂等的终结点, 等待时间为指数退避加完全抖动
+    :param retries: 最多重试次数
+    :param base_delay: 第一次重试前的最长等待秒数
+    :param max_delay: 等待秒数的上限
+    """
+
+    def __init__(self, retries: int = 2, base_delay: float = 0.2, max_delay: float = 5):
+        self.retries = retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt: int) -> float:
+        """
+        第attempt次重试前的等待时间
+        :param attempt: 从0开始的重试序号
+        :return: 等待秒数
+        """
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def should_retry(self, error: TransportError, attempt: int, idempotent: bool) -> bool:
+        """
+        判断是否应该重试
+        :param error: 本次请求的错误
+        :param attempt: 已重试的次数
+        :param idempotent: 终结点是否幂等
+        :return: 是否重试
+        """
+        return idempotent and error.retryable and attempt < self.retries
+
+
+__policy = config['go-cqhttp'].get('retry', {})
+breaker = CircuitBreaker(__policy.get('failure_threshold', 5), __policy.get('reset_timeout', 10))
+retry_policy = RetryPolicy(__policy.get('retries', 2), __policy.get('base_delay', 0.2), __policy.get('max_delay', 5))
+
+
+class Transport(ABC):
+    """
+    传输层基类, 进程内共享一个实例
+    """
+    __instance = None
+    __lock = threading.Lock()
+
+    @abstractmethod
+    def post(self, action: str, data: dict) -> dict:
+        """
+        调用go-cqhttp的API, 由子类实现, 通信失败时抛出TransportError
+        :param action: 终结点名称, 如send_group_msg
+        :param data: 请求参数
+        :return: go-cqhttp的响应数据
+        """
+
+    def request(self, action: str, data: dict, idempotent: bool = False) -> dict:
+        """
+        经过熔断器调用go-cqhttp的API, 幂等的终结点失败时按重试策略重试
+        :param action: 终结点名称, 如send_group_msg
+        :param data: 请求参数
+        :param idempotent: 终结点是否幂等
+        :return: go-cqhttp的响应数据
+        """
+        attempt = 0
+        while True:
+            breaker.before_request()
+            try:
+                response = self.post(action, data)
+            except TransportError as err:
+                if err.retryable:
+                    breaker.record_failure()
+                else:
+                    breaker.record_success()
+                if not retry_policy.should_retry(err, attempt, idempotent):
+                    raise
+            else:
+                breaker.record_success()
+                return response
+            time.sleep(retry_policy.delay(attempt))
+            attempt += 1
+
+    def close(self) -> None:
+        """
+        释放传输层占用的连接
+        """
+
+    @staticmethod
+    def from_config() -> 'Transport':
+        """
+        根据配置文件创建传输层, config['go-cqhttp']['transport']为websocket时使用正向WebSocket, 否则使用HTTP
+        :return: 传输层实例
+        """
+        if config['go-cqhttp'].get('transport') == 'websocket':
+            websocket = config['go-cqhttp']['websocket']
+            return WebSocketTransport(
+                url=f'ws://{websocket["host"]}:{websocket["port"]}/api',
+                access_token=websocket.get('access_token'),
+                timeout=websocket.get('timeout', 30)
+            )
+        server = config['go-cqhttp']['server']
+        return HttpTransport(
+            host=server['host'],
+            port=server['port'],
+            pool_size=config['go-cqhttp'].get('pool_size', 10),
+            connect_timeout=config['go-cqhttp'].get('connect_timeout', 3),
+            read_timeout=config['go-cqhttp'].get('read_timeout', 30)
+        )
+
+    @staticmethod
+    def instance() -> 'Transport':
+        """
+        获取进程内共享的传输层实例, 第一次调用时根据配置文件创建
+        :return: 传输层实例
+        """
+        if Transport.__instance is None:
+            with Transport.__lock:
+                if Transport.__instance is None:
+                    Transport.__instance = Transport.from_config()
+        return Transport.__instance
+
+    @staticmethod
+    def set_instance(transport: 'Transport') -> None:
+        """
+        替换进程内共享的传输层实例, 旧实例会被关闭
+        :param transport: 新的传输层实例
+        """
+        with Transport.__lock:
+            old, Transport.__instance = Transport.__instance, transport
+        if old is not None and old is not transport:
+            old.close()
+
+
+class HttpTransport(Transport):
+    """
+    基于requests.Session的HTTP传输, 所有请求复用同一个keep-alive连接池
+
+    urllib3的连接池是线程安全的, go-cqhttp也不会下发cookie, 因此多个线程可以同时使用同一个实例
+    :param host: go-cqhttp地址
+    :param port: go-cqhttp端口
+    :param pool_size: 连接池大小, 即同时保持的最大连接数, 超出时请求会等待空闲连接
+    :param connect_timeout: 建立连接的超时秒数
+    :param read_timeout: 等待响应的超时秒数
+    """
+
+    def __init__(
+            self, host: str, port: int, pool_size: int = 10, connect_timeout: float = 3, read_timeout: float = 30
+    ):
+        self.base_url = f'http://{host}:{port}/'
+        self.pool_size = pool_size
+        self.timeout = (connect_timeout, read_timeout)
+        self.session = requests.Session()
+        self.session.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=True))
+
+    def post(self, action: str, data: dict) -> dict:
+        try:
+            response = self.session.post(self.base_url + action, json=data, timeout=self.timeout)
+        except requests.RequestException as err:
+            raise TransportError(f'{action}请求失败: {err}') from err
+        if response.status_code != 200:
+            raise TransportError(f'{action}请求失败: HTTP {response.status_code}', response.status_code >= 500)
+        try:
+            return response.json()
+        except ValueError as err:
+            raise TransportError(f'{action}的响应不是JSON: {response.text[:100]}', False) from err
+
+    def close(self) -> None:
+        self.session.close()
+
+
+class WebSocketTransport(Transport):
+    """
+    基于go-cqhttp正向WebSocket的传输, 所有请求共享同一个连接, 用echo字段把响应与请求对应起来
+
+    连接由后台线程中的事件循环维护, 断开后按指数退避自动重连, 断开时尚未收到响应的请求会抛出TransportError
+    :param url: WebSocket地址, 如ws://127.0.0.1:8080/api
+    :param access_token: go-cqhttp配置的access_token
+    :param timeout: 等待连接和等待响应的超时秒数, 超时抛出TransportError
+    :param reconnect_interval: 首次重连的间隔秒数
+    :param max_reconnect_interval: 重连间隔的上限秒数
+    """
+
+    def __init__(
+            self, url: str, access_token: str = None, timeout: float = 30,
+            reconnect_interval: float = 1, max_reconnect_interval: float = 30
+    ):
+        self.url = url
+        self.timeout = timeout
+        self.reconnect_interval = reconnect_interval
+        self.max_reconnect_interval = max_reconnect_interval
+        self.reconnect_count = 0
+        self.__headers = {'Authorization': 'Bearer ' + access_token} if access_token else {}
+        self.__echo = itertools.count()
+        self.__pending: dict[str, asyncio.Future] = {}
+        self.__ws = None
+        self.__closing = False
+        self.__loop = asyncio.new_event_loop()
+        self.__connected = asyncio.Event()
+        self.__thread = threading.Thread(target=self.__loop.run_forever, name='go-cqhttp-websocket', daemon=True)
+        self.__thread.start()
+        self.__runner = asyncio.run_coroutine_threadsafe(self.__run(), self.__loop)
+
+    @property
+    def connected(self) -> bool:
+        """
+        当前是否已连接
+        """
+        return self.__ws is not None
+
+    async def __run(self) -> None:
+        delay = self.reconnect_interval
+        async with ClientSession() as session:
+            while not self.__closing:
+                try:
+                    async with session.ws_connect(self.url, headers=self.__headers, heartbeat=30) as ws:
+                        self.__ws = ws
+                        self.__connected.set()
+                        delay = self.reconnect_interval
+                        async for message in ws:
+                            if message.type == WSMsgType.TEXT:
+                                self.__resolve(message.data)
+                            elif message.type == WSMsgType.ERROR:
+                                break
+                except (ClientError, OSError):
+                    pass
+                finally:
+                    self.__ws = None
+                    self.__connected.clear()
+                    for future in self.__pending.values():
+                        if not future.done():
+                            future.set_exception(TransportError('与go-cqhttp的WebSocket连接已断开'))
+                    self.__pending.clear()
+                if not self.__closing:
+                    await asyncio.sleep(delay)
+                    delay = min(delay * 2, self.max_reconnect_interval)
+                    self.reconnect_count += 1
+
+    def __resolve(self, text: str) -> None:
+        try:
+            payload = json.loads(text)
+        except ValueError:
+            return
+        future = self.__pending.pop(str(payload.get('echo')), None)
+        if future is not None and not future.done():
+            future.set_result(payload)
+
+    async def __request(self, action: str, data: dict) -> dict:
+        try:
+            await asyncio.wait_for(self.__connected.wait(), self.timeout)
+        except TimeoutError as err:
+            raise TransportError(f'{action}请求失败: 连接go-cqhttp超时') from err
+        # 等待期间连接可能已经断开, __run的finally会把__ws置为None
+        ws = self.__ws
+        if ws is None or ws.closed:
+            raise TransportError(f'{action}请求失败: 与go-cqhttp的WebSocket连接已断开')
+        echo = str(next(self.__echo))
+        future = self.__loop.create_future()
+        self.__pending[echo] = future
+        try:
+            await ws.send_json({'action': action, 'params': data, 'echo': echo})
+            return await asyncio.wait_for(future, self.timeout)
+        except TimeoutError as err:
+            raise TransportError(f'{action}请求失败: 等待响应超时') from err
+        except (ClientError, ConnectionError) as err:
+            raise TransportError(f'{action}请求失败: {err}') from err
+        finally:
+            self.__pending.pop(echo, None)
+
+    def post(self, action: str, data: dict) -> dict:
+        return asyncio.run_coroutine_threadsafe(self.__request(action, data), self.__loop).result()
+
+    async def post_async(self, action: str, data: dict) -> dict:
+        """
+        在任意事件循环中异步调用go-cqhttp的API
+        :param action: 终结点名称, 如send_group_msg
+        :param data: 请求参数
+        :return: go-cqhttp的响应数据
+        """
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(self.__request(action, data), self.__loop))
+
+    async def __stop(self) -> None:
+        """
+        关闭连接并等待__run和进行中的请求结束, 使ClientSession正常关闭
+        """
+        ws = self.__ws
+        if ws is not None:
+            await ws.close()
+        tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def close(self) -> None:
+        self.__closing = True
+        try:
+            asyncio.run_coroutine_threadsafe(self.__stop(), self.__loop).result(self.timeout)
+        except TimeoutError:
+            pass
+        finally:
+            self.__loop.call_soon_threadsafe(self.__loop.stop)
+
+
+class AsyncTransport(object):
+    """
+    基于aiohttp.ClientSession的异步HTTP传输, 供bot_async_api使用
+
+    会话在第一次请求时于当前事件循环中创建, 因此同一个实例只能在一个事件循环中使用
+    :param host: go-cqhttp地址
+    :param port: go-cqhttp端口
+    :param pool_size: 同时进行的最大请求数
+    :param connect_timeout: 建立连接的超时秒数
+    :param read_timeout: 等待响应的超时秒数
+    """
+    __instance = None
+
+    def __init__(
+            self, host: str, port: int, pool_size: int = 100, connect_timeout: float = 3, read_timeout: float = 30
+    ):
+        self.base_url = f'http://{host}:{port}/'
+        self.pool_size = pool_size
+        self.timeout = ClientTimeout(sock_connect=connect_timeout, sock_read=read_timeout)
+        self._session: ClientSession | None = None
+
+    async def post(self, action: str, data: dict) -> dict:
+        """
+        调用go-cqhttp的API, 通信失败时抛出TransportError
+        :param action: 终结点名称, 如send_group_msg
+        :param data: 请求参数
+        :return: go-cqhttp的响应数据
+        """
+        if self._session is None or self._session.closed:
+            self._session = ClientSession(connector=TCPConnector(limit=self.pool_size), timeout=self.timeout)
+        try:
+            async with self._session.post(self.base_url + action, json=data) as response:
+                if response.status != 200:
+                    raise TransportError(f'{action}请求失败: HTTP {response.status}', response.status >= 500)
+                try:
+                    return await response.json(content_type=None)
+                except ValueError as err:
+                    raise TransportError(f'{action}的响应不是JSON', False) from err
+        except (ClientError, TimeoutError) as err:
+            raise TransportError(f'{action}请求失败: {err}') from err
+
+    async def request(self, action: str, data: dict, idempotent: bool = False) -> dict:
+        """
+        经过熔断器异步调用go-cqhttp的API, 与Transport.request相同
+        :param action: 终结点名称, 如send_group_msg
+        :param data: 请求参数
+        :param idempotent: 终结点是否幂等
+        :return: go-cqhttp的响应数据
+        """
+        attempt = 0
+        while True:
+            breaker.before_request()
+            try:
+                response = await self.post(action, data)
+            except TransportError as err:
+                if err.retryable:
+                    breaker.record_failure()
+                else:
+                    breaker.record_success()
+                if not retry_policy.should_retry(err, attempt, idempotent):
+                    raise
+            else:
+                breaker.record_success()
+                return response
+            await asyncio.sleep(retry_policy.delay(attempt))
+            attempt += 1
+
+    async def close(self) -> None:
+        """
+        关闭会话
+        """
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    @staticmethod
+    def instance() -> 'AsyncTransport':
+        """
+        获取共享的异步传输层实例, 第一次调用时根据配置文件创建
+        :return: 异步传输层实例
+        """
+        if AsyncTransport.__instance is None and config['go-cqhttp'].get('transport') == 'websocket':
+            AsyncTransport.__instance = AsyncWebSocketTransport(Transport.instance())
+        elif AsyncTransport.__instance is None:
+            server = config['go-cqhttp']['server']
+            AsyncTransport.__instance = AsyncTransport(
+                host=server['host'],
+                port=server['port'],
+                pool_size=config['go-cqhttp'].get('async_pool_size', 100),
+                connect_timeout=config['go-cqhttp'].get('connect_timeout', 3),
+                read_timeout=config['go-cqhttp'].get('read_timeout', 30)
+            )
+        return AsyncTransport.__instance
+
+    @staticmethod
+    def set_instance(transport: 'AsyncTransport') -> None:
+        """
+        替换共享的异步传输层实例, 旧实例需要调用者自行关闭
+        :param transport: 新的异步传输层实例
+        """
+        AsyncTransport.__instance = transport
+
+
+class AsyncWebSocketTransport(AsyncTransport):
+    """
+    让异步API复用进程内共享的WebSocketTransport, 同步和异步请求共用同一个连接
+    :param transport: WebSocket传输层
+    """
+
+    def __init__(self, transport: WebSocketTransport):
+        super().__init__('', 0)
+        self.transport = transport
+
+    async def post(self, action: str, data: dict) -> dict:
+        return await self.transport.post_async(action, data)
+
+    async def close(self) -> None:
+        """
+        连接由WebSocketTransport管理, 这里什么都不做
+        """
@@ -0,0 +1,185 @@
+"""
+bot_upload.py
+
+按内容去重的群文件和私聊文件上传: 文件只计算一次哈希, 同一内容对同一个群只上传一次, 多个目标并行上传
+"""
+import os
+import hashlib
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+import bot_api
+from bot_metrics import metrics
+
+
+class FileHasher(object):
+    """
+    分块计算文件的sha256, 结果按(路径, 大小, 修改时间)缓存, 文件没有变化时不会再次读取
+    :param chunk_size: 每次读取的字节数
+    """
+
+    def __init__(self, chunk_size: int = 1 << 20):
+        self.chunk_size = chunk_size
+        self.__digests: dict[str, tuple[int, int, str]] = {}
+        self.__lock = threading.Lock()
+
+    def digest(self, file: str) -> tuple[str, int]:
+        """
+        计算文件的sha256
+        :param file: 本地文件路径
+        :return: 十六进制的哈希值和文件大小
+        """
+        path = os.path.realpath(file)
+        stat = os.stat(path)
+        cached = self.__digests.get(path)
+        if cached is not None and cached[:2] == (stat.st_size, stat.st_mtime_ns):
+            return cached[2], stat.st_size
+        sha256 = hashlib.sha256()
+        with open(path, 'rb') as f:
+            while chunk := f.read(self.chunk_size):
+                sha256.update(chunk)
+        with self.__lock:
+            self.__digests[path] = (stat.st_size, stat.st_mtime_ns, sha256.hexdigest())
+        return sha256.hexdigest(), stat.st_size
+
+
+class UploadResult(object):
+    """
+    一次上传的结果
+    :param digest: 文件内容的sha256
+    :param size: 文件大小
+    """
+
+    def __init__(self, digest: str, size: int):
+        self.digest = digest
+        self.size = size
+        self.uploaded: list[int] = []  # 实际上传的目标
+        self.skipped: list[int] = []  # 已经上传过或与其它调用合并的目标
+        self.errors: dict[int, str] = {}
+
+    @property
+    def bytes_uploaded(self) -> int:
+        """
+        实际上传的字节数
+        """
+        return self.size * len(self.uploaded)
+
+    @property
+    def bytes_saved(self) -> int:
+        """
+        因去重而没有上传的字节数
+        """
+        return self.size * len(self.skipped)
+
+
+class Uploader(object):
+    """
+    文件上传管理, 线程安全
+
+    以(目标类型, 内容哈希, 目标, 文件名, 父目录)为键: 正在上传的键被再次提交时, 后来的调用等待同一个上传完成而不是重新上传;
+    群文件会保留在群里, 已成功上传的群文件不再上传, 除非指定force或调用forget。
+    私聊文件是一条消息, 每次调用都会发送, 只合并同时进行的相同发送。
+    节省的字节数记录在bot_metrics的upload_bytes_saved_total中
+    :param concurrency: 同时进行的最大上传数
+    :param hasher: 使用的哈希缓存, 默认新建
+    """
+
+    def __init__(self, concurrency: int = 4, hasher: FileHasher = None):
+        self.hasher = hasher if hasher is not None else FileHasher()
+        self.bytes_saved = 0
+        self.__done: set[tuple] = set()
+        self.__inflight: dict[tuple, Future] = {}
+        self.__lock = threading.Lock()
+        self.__executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='upload')
+
+    def upload_group_file(
+            self, file: str, group_ids, name: str = None, folder: str = None, force: bool = False
+    ) -> UploadResult:
+        """
+        把文件上传到多个群, 阻塞直到全部完成
+        :param file: 本地文件路径
+        :param group_ids: 群号的可迭代对象
+        :param name: 储存名称, 默认为文件名
+        :param folder: 父目录ID
+        :param force: 是否忽略上传记录, 重新上传已经上传过的群
+        :return: 上传结果
+        """
+        name = name or os.path.basename(file)
+        return self.__upload(
+            file, group_ids, lambda digest, group_id: ('group', digest, group_id, name, folder),
+            lambda group_id: bot_api.UploadGroupFile(group_id, file, name, folder), skip_uploaded=not force
+        )
+
+    def upload_private_file(self, file: str, user_ids, name: str = None) -> UploadResult:
+        """
+        把文件发送给多个好友, 阻塞直到全部完成
+        :param file: 本地文件路径
+        :param user_ids: QQ号的可迭代对象
+        :param name: 文件名称, 默认为文件名
+        :return: 上传结果
+        """
+        name = name or os.path.basename(file)
+        return self.__upload(
+            file, user_ids, lambda digest, user_id: ('private', digest, user_id, name, None),
+            lambda user_id: bot_api.UploadPrivateFile(user_id, file, name), skip_uploaded=False
+        )
+
+    def __upload(self, file: str, targets, key, send, skip_uploaded: bool) -> UploadResult:
+        """
+        :param skip_uploaded: 是否跳过上传记录中已成功上传的目标
+        """
+        digest, size = self.hasher.digest(file)
+        result = UploadResult(digest, size)
+        futures: dict[int, tuple[Future, bool]] = {}
+        with self.__lock:
+            for target in dict.fromkeys(targets):
+                target_key = key(digest, target)
+                if skip_uploaded and target_key in self.__done:
+                    result.skipped.append(target)
+                elif target_key in self.__inflight:
+                    futures[target] = (self.__inflight[target_key], False)
+                else:
+                    future = self.__executor.submit(self.__send, target_key, send, target)
+                    self.__inflight[target_key] = future
+                    futures[target] = (future, True)
+        for target, (future, owner) in futures.items():
+            try:
+                response = future.result()
+            except Exception as err:
+                result.errors[target] = str(err)
+                continue
+            if response.get('retcode') != 0:
+                result.errors[target] = response.get('wording') or response.get('msg') or str(response.get('retcode'))
+            elif owner:
+                result.uploaded.append(target)
+            else:
+                result.skipped.append(target)
+        if result.skipped:
+            with self.__lock:
+                self.bytes_saved += result.bytes_saved
+            metrics.increment('upload_bytes_saved_total', result.bytes_saved, '因内容去重而没有上传的字节数')
+        return result
+
+    def __send(self, target_key: tuple, send, target: int) -> dict:
+        try:
+            response = send(target).json
+            if response.get('retcode') == 0 and target_key[0] == 'group':
+                with self.__lock:
+                    self.__done.add(target_key)
+            return response
+        finally:
+            with self.__lock:
+                self.__inflight.pop(target_key, None)
+
+    def forget(self, digest: str = None) -> None:
+        """
+        清除群文件的上传记录, 群文件被删除后需要重新上传时使用
+        :param digest: 只清除该内容的记录, 默认全部清除
+        """
+        with self.__lock:
+            self.__done = {key for key in self.__done if digest is not None and key[1] != digest}
+
+    def close(self) -> None:
+        """
+        等待正在进行的上传完成并关闭线程池
+        """
+        self.__executor.shutdown(wait=True)
@@ -0,0 +1,99 @@
+"""
+tests
+
+机器人模块的测试, 在机器人目录下运行:
+
+    python -m unittest discover tests
+    python -m pytest tests
+
+bot_config在导入时读取当前目录的config.json, 因此这里先在临时目录中写入测试用的配置文件并切换到该目录,
+go-cqhttp指向GOCQHTTP_PORT上由gocqhttp()启动的模拟服务器, 数据库不可用; 日志不会发送给开发者
+"""
+import os
+import sys
+import json
+import socket
+import logging
+import tempfile
+import threading
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WORKDIR = tempfile.mkdtemp(prefix='qqbot-tests-')
+
+
+def free_port() -> int:
+    """
+    :return: 本机一个空闲的TCP端口
+    """
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+GOCQHTTP_PORT = free_port()
+CONFIG = {
+    'go-cqhttp': {
+        'server': {'host': '127.0.0.1', 'port': GOCQHTTP_PORT},
+        'retry': {'retries': 0, 'base_delay': 0.01},
+    },
+    'database': {'available': False, 'host': '', 'user': '', 'password': ''},
+}
+
+
+def write_config(directory: str, **sections) -> str:
+    """
+    在directory中写入配置文件, sections中的项覆盖CONFIG中的同名项
+    :param directory: 目录
+    :param sections: 覆盖的配置项
+    :return: directory
+    """
+    with open(os.path.join(directory, 'config.json'), 'w') as file:
+        json.dump(dict(CONFIG, **sections), file)
+    return directory
+
+
+write_config(WORKDIR)
+os.chdir(WORKDIR)
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+import bot_log  # noqa: E402
+
+bot_log.Log.set_level(logging.CRITICAL + 1)
+
+
+from benchmark.mock_gocqhttp import MockGoCqHttp  # noqa: E402
+
+
+class RecordingGoCqHttp(MockGoCqHttp):
+    """
+    记录收到的消息的模拟服务器, actions中的终结点由测试给出响应: 终结点名称 -> 参数为请求参数、返回响应数据的函数
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.messages: list[tuple[int, str]] = []
+        self.actions: dict[str, object] = {}
+
+    def response(self, action: str, params: dict) -> dict:
+        if action in self.actions:
+            return self.actions[action](params)
+        if action.startswith('send_'):
+            self.messages.append((params.get('group_id') or params.get('user_id'), params.get('message')))
+        return super().response(action, params)
+
+
+__server: RecordingGoCqHttp | None = None
+__server_lock = threading.Lock()
+
+
+def gocqhttp() -> RecordingGoCqHttp:
+    """
+    获取GOCQHTTP_PORT上的模拟服务器, 第一次调用时启动; 所有测试共用, 避免传输层的keep-alive连接仍连着已停止的服务器
+    :return: 模拟服务器
+    """
+    global __server
+    with __server_lock:
+        if __server is None:
+            __server = RecordingGoCqHttp(port=GOCQHTTP_PORT).start()
+        return __server
@@ -0,0 +1,30 @@
+import threading
+import unittest
+from unittest import mock
+from tests import gocqhttp
+import bot_api
+import bot_async_api
+from bot_transport import AsyncTransport
+
+
+class AsyncAPITest(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.server = gocqhttp()
+        self.server.messages.clear()
+
+    async def asyncTearDown(self):
+        await AsyncTransport.instance().close()
+        AsyncTransport.set_instance(None)
+
+    async def test_on_response_runs_in_event_loop(self):
+        threads = []
+        with mock.patch.object(bot_api.SendGroupMsg, '_on_response', lambda api: threads.append(threading.get_ident())):
+            response = await bot_async_api.SendGroupMsg(1, 'hello')
+        self.assertEqual(response.json['retcode'], 0)
+        self.assertEqual(threads, [threading.get_ident()])
+        self.assertEqual(self.server.messages, [(1, 'hello')])
+
+
+if __name__ == '__main__':
+    unittest.main()
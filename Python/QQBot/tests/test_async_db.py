@@ -0,0 +1,179 @@
+import asyncio
+import unittest
+from unittest import mock
+import pymysql
+from tests import CONFIG  # noqa: F401, 先写入配置文件
+from bot_config import config
+import bot_db
+import bot_async_db
+from bot_async_db import AsyncDataBase
+
+
+class FakeCursor(object):
+    """
+    执行时记录语句, 语句中含有fail时抛出连接的error
+    """
+
+    def __init__(self, connection: 'FakeConnection'):
+        self.connection = connection
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        pass
+
+    async def execute(self, sql: str, params=None) -> int:
+        await asyncio.sleep(0)
+        self.connection.log.append(sql)
+        if 'fail' in sql:
+            raise self.connection.error
+        return 1
+
+    async def executemany(self, sql: str, rows) -> int:
+        return sum([await self.execute(sql, row) for row in rows])
+
+    async def fetchall(self) -> list[tuple]:
+        return [(self.connection.number,)]
+
+
+class FakeConnection(object):
+
+    def __init__(self, number: int):
+        self.number = number
+        self.log: list[str] = []
+        self.closed = False
+        self.error: pymysql.MySQLError = pymysql.ProgrammingError('语法错误')
+
+    def cursor(self) -> FakeCursor:
+        return FakeCursor(self)
+
+    async def begin(self) -> None:
+        self.log.append('BEGIN')
+
+    async def commit(self) -> None:
+        self.log.append('COMMIT')
+
+    async def rollback(self) -> None:
+        self.log.append('ROLLBACK')
+
+    def close(self) -> None:
+        self.closed = True
+
+
+class FakePool(object):
+    """
+    aiomysql连接池的替身, 空闲连接后进先出, 每次需要时新建连接
+    """
+
+    def __init__(self):
+        self.connections: list[FakeConnection] = []
+        self.idle: list[FakeConnection] = []
+
+    @property
+    def freesize(self) -> int:
+        return len(self.idle)
+
+    async def acquire(self) -> FakeConnection:
+        if self.idle:
+            return self.idle.pop()
+        self.connections.append(FakeConnection(len(self.connections)))
+        return self.connections[-1]
+
+    def release(self, connection: FakeConnection) -> None:
+        if not connection.closed:
+            self.idle.append(connection)
+
+    def close(self) -> None:
+        pass
+
+    async def wait_closed(self) -> None:
+        pass
+
+
+class AsyncDataBaseTest(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.pool = FakePool()
+        self.create_pool = mock.AsyncMock(return_value=self.pool)
+        for patcher in (
+                mock.patch.dict(config['database'], available=True, backend='mysql'),
+                mock.patch.object(bot_async_db.aiomysql, 'create_pool', self.create_pool),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.db = AsyncDataBase('', '', '', 'bot')
+
+    async def asyncTearDown(self):
+        await AsyncDataBase.close()
+
+    async def test_execute_and_update(self):
+        self.assertEqual(await self.db.execute('SELECT 1'), ((0,),))
+        self.assertEqual(await self.db.update('UPDATE t SET a=%s', (1,)), 1)
+        self.assertEqual(self.pool.connections[0].log, ['SELECT 1', 'UPDATE t SET a=%s'])
+        self.create_pool.assert_awaited_once()
+
+    async def test_failed_statement_returns_default(self):
+        self.assertEqual(await self.db.execute('SELECT fail'), ())
+        self.assertEqual(await self.db.update('UPDATE fail'), 0)
+        self.assertFalse(self.pool.connections[0].closed)
+        self.pool.connections[0].error = pymysql.OperationalError(2013, '连接断开')
+        self.assertEqual(await self.db.update('UPDATE fail'), 0)
+        self.assertTrue(self.pool.connections[0].closed)
+
+    async def test_pool_error_returns_default_and_retries(self):
+        self.create_pool.side_effect = [pymysql.OperationalError(2003, '无法连接'), self.pool]
+        self.assertEqual(await self.db.execute('SELECT 1'), ())
+        self.assertEqual(await self.db.execute('SELECT 1'), ((0,),))
+        self.assertEqual(self.create_pool.await_count, 2)
+
+    async def test_transaction_commits_once(self):
+        async with self.db.transaction():
+            await self.db.update('INSERT a')
+            async with self.db.transaction():
+                await self.db.update('INSERT b')
+        self.assertEqual(self.pool.connections[0].log, ['BEGIN', 'INSERT a', 'INSERT b', 'COMMIT'])
+
+    async def test_transaction_rolls_back_on_error(self):
+        with self.assertRaises(pymysql.ProgrammingError):
+            async with self.db.transaction():
+                await self.db.update('INSERT a')
+                await self.db.update('INSERT fail')
+        self.assertEqual(self.pool.connections[0].log, ['BEGIN', 'INSERT a', 'INSERT fail', 'ROLLBACK'])
+        self.assertFalse(self.pool.connections[0].closed)
+
+    async def test_transaction_belongs_to_its_task(self):
+        async with self.db.transaction():
+            await self.db.update('INSERT a')
+            await asyncio.create_task(self.db.update('INSERT other'))
+        self.assertEqual(self.pool.connections[0].log, ['BEGIN', 'INSERT a', 'COMMIT'])
+        self.assertEqual(self.pool.connections[1].log, ['INSERT other'])
+
+    async def test_bulk_insert_splits_in_one_transaction(self):
+        rows = [(i, 'x' * 100) for i in range(10)]
+        statements = bot_db.insert_statements('t', ('a', 'b'), rows, 500)
+        self.assertGreater(len(statements), 1)
+        self.assertEqual(await self.db.bulk_insert('t', ('a', 'b'), rows, max_bytes=500), len(statements))
+        self.assertEqual(self.pool.connections[0].log, ['BEGIN'] + statements + ['COMMIT'])
+
+
+class BackendTest(unittest.IsolatedAsyncioTestCase):
+
+    def test_sqlite_backend_rejected(self):
+        with mock.patch.dict(config['database'], available=True, backend='sqlite'):
+            with self.assertRaisesRegex(ValueError, 'sqlite'):
+                AsyncDataBase('', '', '', 'bot')
+
+    async def test_database_unavailable(self):
+        with mock.patch.dict(config['database'], available=False, backend='sqlite'), \
+                mock.patch.object(bot_async_db.aiomysql, 'create_pool') as create_pool:
+            db = AsyncDataBase('', '', '', 'bot')
+            self.assertEqual(await db.execute('SELECT 1'), ())
+            self.assertEqual(await db.update('UPDATE t SET a=1'), 0)
+            async with db.transaction():
+                self.assertEqual(await db.bulk_insert('t', ('a',), [(1,)]), 0)
+        create_pool.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,160 @@
+import gc
+import os
+import time
+import weakref
+import unittest
+from unittest import mock
+from tests import WORKDIR
+from bot_config import config
+import bot_db
+from bot_metrics import metrics
+
+
+class BatchWriterTest(unittest.TestCase):
+
+    def wait_written(self, writer: bot_db.BatchWriter, rows: int, timeout: float) -> float:
+        """
+        等待写入rows行
+        :return: 等待的秒数
+        """
+        start = time.monotonic()
+        while writer.written < rows and time.monotonic() - start < timeout:
+            time.sleep(0.005)
+        return time.monotonic() - start
+
+    def test_single_row_flushed_after_interval(self):
+        writer = bot_db.BatchWriter('message', ('message_id', 'user_id', 'group_id', 'message'), interval=0.1)
+        try:
+            self.assertTrue(writer.put(1, 10000, 100000, 'hello'))
+            elapsed = self.wait_written(writer, 1, 2)
+            self.assertEqual(writer.written, 1)
+            self.assertLess(elapsed, 1)
+        finally:
+            writer.close()
+
+    def test_rows_after_idle_period_are_flushed(self):
+        writer = bot_db.BatchWriter('message', ('message_id', 'user_id', 'group_id', 'message'), interval=0.05)
+        try:
+            writer.put(1, 10000, 100000, 'first')
+            self.wait_written(writer, 1, 2)
+            time.sleep(0.2)
+            writer.put(2, 10000, 100000, 'second')
+            writer.put(3, 10000, 100000, 'third')
+            self.assertLess(self.wait_written(writer, 3, 2), 1)
+            self.assertEqual(writer.written, 3)
+        finally:
+            writer.close()
+
+    def test_full_batch_flushed_immediately(self):
+        writer = bot_db.BatchWriter(
+            'message', ('message_id', 'user_id', 'group_id', 'message'), max_rows=3, interval=60
+        )
+        try:
+            for i in range(3):
+                writer.put(i, 10000, 100000, 'message')
+            self.assertLess(self.wait_written(writer, 3, 2), 1)
+        finally:
+            writer.close()
+
+    def test_remaining_rows_keep_their_age(self):
+        writes = []
+
+        def write(_, rows):
+            writes.append(time.monotonic())
+            if len(writes) == 1:
+                time.sleep(0.5)
+            return True
+
+        with mock.patch.object(bot_db.BatchWriter, '_BatchWriter__write', write):
+            writer = bot_db.BatchWriter(
+                'message', ('message_id', 'user_id', 'group_id', 'message'), max_rows=2, interval=0.3
+            )
+            try:
+                writer.put(1, 10000, 100000, 'first')
+                while not writes:
+                    time.sleep(0.005)
+                for i in range(2, 5):
+                    writer.put(i, 10000, 100000, 'message')
+                self.wait_written(writer, 4, 2)
+            finally:
+                writer.close()
+        # 第一次写入期间放入的3行中, 写入一批后剩余的一行已超过interval, 应立即写入而不是重新计时
+        self.assertEqual(len(writes), 3)
+        self.assertLess(writes[2] - writes[1], 0.15)
+
+    def test_flush_latency_not_reported_as_endpoint(self):
+        writer = bot_db.BatchWriter('message', ('message_id', 'user_id', 'group_id', 'message'), interval=60)
+        writer.put(1, 10000, 100000, 'message')
+        writer.close()
+        exported = metrics.to_dict()
+        self.assertIn('db_message_flush_seconds', exported['gauges'])
+        self.assertGreaterEqual(exported['counters']['db_message_flushes_total'], 1)
+        self.assertNotIn('db.insert', metrics.to_prometheus())
+
+    def test_close_writes_remaining_rows(self):
+        writer = bot_db.BatchWriter('message', ('message_id', 'user_id', 'group_id', 'message'), interval=60)
+        writer.put(1, 10000, 100000, 'message')
+        writer.close()
+        self.assertEqual(writer.written, 1)
+        with self.assertRaises(RuntimeError):
+            writer.put(2, 10000, 100000, 'message')
+
+
+class SQLiteBackendTest(unittest.TestCase):
+
+    def test_translate_placeholders(self):
+        backend = bot_db.SQLiteBackend(os.path.join(WORKDIR, 'translate.sqlite3'))
+        self.assertEqual(backend.translate('SELECT * FROM t WHERE a=%s AND b=%(b)s AND c LIKE "x%%"'),
+                         'SELECT * FROM t WHERE a=? AND b=:b AND c LIKE "x%"')
+
+    def test_translate_cache_does_not_keep_backend(self):
+        backend = bot_db.SQLiteBackend(os.path.join(WORKDIR, 'translate.sqlite3'))
+        backend.translate('SELECT %s')
+        ref = weakref.ref(backend)
+        del backend
+        gc.collect()
+        self.assertIsNone(ref())
+
+
+class TransactionTest(unittest.TestCase):
+
+    def setUp(self):
+        path = os.path.join(WORKDIR, f'{self.id()}.sqlite3')
+        patcher = mock.patch.dict(config['database'], available=True, backend='sqlite', path=path)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.a = bot_db.DataBase('', '', '', 'bot')
+        self.b = bot_db.DataBase('', '', '', 'bot')
+
+    def users(self) -> list[int]:
+        return [row[0] for row in self.a.execute('SELECT user_id FROM `right` ORDER BY user_id')]
+
+    def test_nested_transaction_of_other_object_joins(self):
+        with self.a.transaction():
+            self.a.update('INSERT INTO `right` VALUES (%s, null, 1)', (1,))
+            with self.b.transaction():
+                self.b.update('INSERT INTO `right` VALUES (%s, null, 1)', (2,))
+            self.assertEqual(self.b.execute('SELECT COUNT(*) FROM `right`'), ((0,),))
+        self.assertEqual(self.users(), [1, 2])
+        with self.assertRaises(ZeroDivisionError):
+            with self.a.transaction():
+                with self.b.transaction():
+                    self.b.update('INSERT INTO `right` VALUES (%s, null, 1)', (3,))
+                1 / 0
+        self.assertEqual(self.users(), [1, 2])
+
+    def test_statement_outside_transaction_not_rolled_back_with_it(self):
+        self.b.update('INSERT INTO `right` VALUES (%s, null, 1)', (1,))
+        with self.assertRaises(ZeroDivisionError):
+            with self.a.transaction():
+                self.a.update('INSERT INTO `right` VALUES (%s, null, 1)', (2,))
+                self.assertEqual(self.b.execute('SELECT user_id FROM `right`'), ((1,),))
+                self.assertEqual(self.b.update('INSERT INTO `right` VALUES (%s, null, 1)', (3,)), 0)
+                1 / 0
+        self.assertEqual(self.users(), [1])
+        self.assertEqual(self.b.update('INSERT INTO `right` VALUES (%s, null, 1)', (3,)), 1)
+        self.assertEqual(self.users(), [1, 3])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+import sys
+import json
+import queue
+import types
+import unittest
+import http.client
+from unittest import mock
+from tests import CONFIG  # noqa: F401, 先写入配置文件
+from bot_config import config
+from bot_event import Event, EventServer, MessageEvent, QuickOperation
+
+
+class EventServerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = EventServer(port=0, workers=1, reply_deadline=0)
+        self.events: queue.Queue[Event] = queue.Queue()
+        self.server.add_handler(self.events.put)
+        self.server.start()
+        self.connection = http.client.HTTPConnection(*self.server.address, timeout=5)
+
+    def tearDown(self):
+        self.connection.close()
+        self.server.stop()
+
+    def post(self, body: bytes) -> int:
+        """
+        在同一个keep-alive连接上发送上报
+        :return: 响应状态码
+        """
+        self.connection.request('POST', '/', body, {'Content-Type': 'application/json'})
+        response = self.connection.getresponse()
+        response.read()
+        return response.status
+
+    def test_valid_event(self):
+        body = {'post_type': 'message', 'message_type': 'private', 'user_id': 10000, 'raw_message': 'hi'}
+        self.assertEqual(self.post(json.dumps(body).encode()), 204)
+        event = self.events.get(timeout=5)
+        self.assertIsInstance(event, MessageEvent)
+        self.assertEqual(event.user_id, 10000)
+
+    def test_invalid_payloads_rejected(self):
+        for body in (b'[]', b'"x"', b'1', b'null', b'{bad', b'\xff\xfe', b'{"post_type": []}'):
+            with self.subTest(body=body):
+                self.assertEqual(self.post(body), 400)
+        # 拒绝之后连接仍然可用
+        self.assertEqual(self.post(b'{"post_type": "meta_event"}'), 204)
+        self.assertEqual(self.events.get(timeout=5).post_type, 'meta_event')
+        self.assertTrue(self.events.empty())
+
+
+class Operation(object):
+    commands: tuple[str, ...] = ()
+
+
+class Ping(Operation):
+    help = '--ping'
+    commands = ('--ping',)
+
+    def __init__(self, rev):
+        self.rev = rev
+
+    @classmethod
+    def from_command(cls, command, api, user_id, group_id=None):
+        return Ping(f'pong {user_id}')
+
+
+class InstanceTest(unittest.TestCase):
+
+    def setUp(self):
+        operations = types.ModuleType('bot_operation')
+        operations.Operation = Operation
+        for patcher in (
+                mock.patch.dict(sys.modules, bot_operation=operations),
+                mock.patch.dict(config, event={'port': 0, 'workers': 1, 'reply_deadline': 0}),
+                mock.patch.object(EventServer, '_EventServer__instance', None),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def reply(self, server: EventServer, message: str) -> dict | None:
+        event = Event.parse({'post_type': 'message', 'message_type': 'private', 'user_id': 10000,
+                             'raw_message': message, 'self_id': 1})
+        event.quick = QuickOperation()
+        server.dispatch(event)
+        return event.quick.wait(1)
+
+    def test_commands_answered(self):
+        server = EventServer.instance()
+        self.assertEqual(self.reply(server, '--ping'), {'reply': 'pong 10000'})
+        self.assertIsNone(self.reply(server, 'hello'))
+
+    def test_commands_disabled(self):
+        config['event']['commands'] = False
+        self.assertIsNone(self.reply(EventServer.instance(), '--ping'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+import unittest
+from tests import gocqhttp
+from bot_files import FileCrawler
+
+FORBIDDEN = 3  # 没有群文件权限的群
+
+
+def ok(data) -> dict:
+    return {'status': 'ok', 'retcode': 0, 'data': data}
+
+
+def failed(wording: str) -> dict:
+    return {'status': 'failed', 'retcode': 100, 'msg': 'ERROR', 'wording': wording, 'data': None}
+
+
+def file(name: str, size: int = 1) -> dict:
+    return {'file_id': name, 'file_name': name, 'busid': 102, 'file_size': size, 'modify_time': 0}
+
+
+def file_system_info(params: dict) -> dict:
+    if params['group_id'] == FORBIDDEN:
+        return failed('没有权限')
+    return ok({'file_count': 2, 'limit_count': 10000, 'used_space': 3, 'total_space': 1 << 30})
+
+
+def root_files(params: dict) -> dict:
+    return ok({'files': [file('a.txt', 1)], 'folders': [{'folder_id': 'f1', 'folder_name': 'docs'}]})
+
+
+def files_by_folder(params: dict) -> dict:
+    if params['group_id'] == 2:
+        return failed('文件夹不存在')
+    return ok({'files': [file('b.txt', 2)], 'folders': []})
+
+
+class FileCrawlerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = gocqhttp()
+        self.server.actions.update({
+            'get_group_file_system_info': file_system_info,
+            'get_group_root_files': root_files,
+            'get_group_files_by_folder': files_by_folder,
+        })
+        self.crawler = FileCrawler()
+
+    def tearDown(self):
+        self.server.actions.clear()
+
+    def test_failed_groups_do_not_discard_others(self):
+        rev = self.crawler.crawl_many([1, 2, FORBIDDEN])
+        self.assertIsNone(rev[1].error)
+        self.assertEqual(sorted(f'{file.path}{file.file_name}' for file in rev[1].added), ['/a.txt', '/docs/b.txt'])
+        self.assertIn('文件夹不存在', rev[2].error)
+        self.assertIn('没有权限', rev[FORBIDDEN].error)
+        self.assertFalse(rev[2] or rev[FORBIDDEN])
+        self.assertIsNotNone(self.crawler.tree(1))
+        self.assertIsNone(self.crawler.tree(2))
+        self.assertIsNone(self.crawler.tree(FORBIDDEN))
+
+    def test_crawl_single_group_raises(self):
+        with self.assertRaises(RuntimeError):
+            self.crawler.crawl(FORBIDDEN)
+        self.assertEqual(len(self.crawler.crawl(1).added), 2)
+        self.assertFalse(self.crawler.crawl(1))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+import time
+import unittest
+from bot_limiter import RateLimiter, TokenBucket
+
+
+class TokenBucketTest(unittest.TestCase):
+
+    def test_give_back_and_wait_time(self):
+        bucket = TokenBucket(rate=10, capacity=1)
+        self.assertTrue(bucket.try_acquire())
+        self.assertFalse(bucket.try_acquire())
+        self.assertAlmostEqual(bucket.wait_time(), 0.1, delta=0.02)
+        bucket.give_back()
+        self.assertEqual(bucket.wait_time(), 0)
+        self.assertTrue(bucket.try_acquire())
+
+
+class RateLimiterTest(unittest.TestCase):
+
+    def test_global_limit_does_not_block(self):
+        limiter = RateLimiter(rate=1, per_key_rate=0.01, capacity=1, per_key_capacity=1)
+        self.assertTrue(limiter.try_acquire('a'))
+        start = time.monotonic()
+        self.assertFalse(limiter.try_acquire('b'))
+        self.assertLess(time.monotonic() - start, 0.05)
+        self.assertAlmostEqual(limiter.retry_after('b'), 1, delta=0.05)
+        # 全局令牌不足时归还了b自己的令牌, 全局令牌补充后b不需要再等待自己的令牌
+        time.sleep(limiter.retry_after('b'))
+        self.assertTrue(limiter.try_acquire('b'))
+
+    def test_retry_after_per_key_limit(self):
+        limiter = RateLimiter(rate=100, per_key_rate=2, per_key_capacity=1)
+        self.assertTrue(limiter.try_acquire('a'))
+        self.assertFalse(limiter.try_acquire('a'))
+        self.assertAlmostEqual(limiter.retry_after('a'), 0.5, delta=0.05)
+        self.assertEqual(limiter.retry_after('b'), 0)
+
+    def test_idle_buckets_evicted(self):
+        limiter = RateLimiter(rate=1000, per_key_rate=20, per_key_capacity=1)
+        buckets = limiter._RateLimiter__buckets
+        for key in range(100):
+            self.assertTrue(limiter.try_acquire(key))
+        self.assertEqual(len(buckets), 100)
+        time.sleep(0.1)
+        # 补满所需的0.05秒已过, 新建令牌桶时删除已补满的令牌桶, 未补满的保留
+        self.assertTrue(limiter.try_acquire('a'))
+        self.assertEqual(list(buckets), ['a'])
+        self.assertTrue(limiter.try_acquire('b'))
+        self.assertFalse(limiter.try_acquire('a'))
+        self.assertEqual(len(buckets), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
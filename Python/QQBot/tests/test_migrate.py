@@ -0,0 +1,75 @@
+import os
+import unittest
+from unittest import mock
+from tests import WORKDIR
+import bot_db
+from bot_config import config
+from bot_migrate import INDEXES, AddIndex, Migration, Migrator, MIGRATIONS
+
+
+class FakeMySQL(object):
+    """
+    记录语句的数据库, information_schema.statistics中的索引为existing
+    """
+
+    def __init__(self, existing=()):
+        self.existing = set(existing)
+        self.updates: list[str] = []
+
+    def execute(self, sql: str, params=None):
+        return ((1,),) if params[1] in self.existing else ()
+
+    def update(self, sql: str, params=None) -> int:
+        self.updates.append(sql)
+        return 0
+
+
+class AddIndexTest(unittest.TestCase):
+
+    def test_mysql_skips_existing_index(self):
+        db = FakeMySQL(existing={'right_user_id'})
+        for step in INDEXES[:2]:
+            step(db, 'mysql')
+        self.assertEqual(db.updates, ['ALTER TABLE `right` ADD INDEX `right_group_id` (`group_id`)'])
+
+    def test_sqlite_uses_if_not_exists(self):
+        db = FakeMySQL()
+        AddIndex('event', 'event_group_id_time', ('group_id', 'time'))(db, 'sqlite')
+        self.assertEqual(
+            db.updates, ['CREATE INDEX IF NOT EXISTS `event_group_id_time` ON `event` (`group_id`, `time`)']
+        )
+
+
+class MigratorTest(unittest.TestCase):
+
+    def setUp(self):
+        path = os.path.join(WORKDIR, f'{self.id()}.sqlite3')
+        patcher = mock.patch.dict(config['database'], available=True, backend='sqlite', path=path)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.db = bot_db.DataBase('', '', '', 'bot')
+
+    def indexes(self) -> set[str]:
+        rows = self.db.execute("SELECT name FROM sqlite_master WHERE type='index' AND sql IS NOT NULL")
+        return {row[0] for row in rows}
+
+    def test_migrate_to_latest_once(self):
+        migrator = Migrator(self.db)
+        self.assertEqual([migration.version for migration in migrator.migrate()], [1, 2])
+        self.assertEqual(migrator.current(), MIGRATIONS[-1].version)
+        self.assertEqual(self.indexes(), {index.name for index in INDEXES})
+        self.assertEqual(migrator.migrate(), [])
+
+    def test_failed_migration_can_be_rerun(self):
+        broken = Migration(3, 'broken', mysql=[], sqlite=[INDEXES[0], 'CREATE INDEX `bad` ON `missing` (`x`)'])
+        migrator = Migrator(self.db, MIGRATIONS + [broken])
+        with self.assertRaises(Exception):
+            migrator.migrate()
+        self.assertEqual(migrator.current(), 2)
+        broken.statements['sqlite'] = [INDEXES[0]]
+        self.assertEqual(migrator.migrate(), [broken])
+        self.assertEqual(migrator.current(), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
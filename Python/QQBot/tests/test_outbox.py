@@ -0,0 +1,120 @@
+import os
+import sys
+import time
+import sqlite3
+import tempfile
+import unittest
+import subprocess
+from tests import CONFIG, ROOT, WORKDIR, RecordingGoCqHttp, gocqhttp, write_config
+from bot_outbox import Outbox
+
+# 第一条消息送达后(此时已建立HTTP连接池)带着未发送的消息退出的子进程, 发送失败的消息输出到stderr
+EXIT_SCRIPT = f'''
+import sys
+sys.path.insert(0, {ROOT!r})
+import bot_outbox
+
+def report(future):
+    if not future.cancelled() and future.exception() is not None:
+        print('failed:', repr(future.exception()), file=sys.stderr)
+
+outbox = bot_outbox.Outbox.instance()
+futures = [outbox.send_group_msg(1, f'exit{{i}}') for i in range(6)]
+for future in futures:
+    future.add_done_callback(report)
+futures[0].result(10)
+print(outbox.pending)
+'''
+
+
+class OutboxTest(unittest.TestCase):
+    server: RecordingGoCqHttp
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = gocqhttp()
+
+    def setUp(self):
+        self.server.messages.clear()
+        self.server.jitter = 0.01
+
+    def tearDown(self):
+        self.server.jitter = 0
+
+    def received(self, conversation: int) -> list[str]:
+        return [message for key, message in self.server.messages if key == conversation]
+
+    def test_same_conversation_in_order(self):
+        outbox = Outbox(rate=1000, per_conversation_rate=1000, per_conversation_burst=1000, workers=4)
+        try:
+            futures = [outbox.send_group_msg(group_id, f'part{i}') for i in range(10) for group_id in (1, 2)]
+            for future in futures:
+                future.result(10)
+        finally:
+            outbox.close()
+        for group_id in (1, 2):
+            self.assertEqual(self.received(group_id), [f'part{i}' for i in range(10)])
+
+    def test_cancelled_message_is_skipped(self):
+        outbox = Outbox(rate=1000, per_conversation_rate=1, per_conversation_burst=1)
+        try:
+            first = outbox.send_group_msg(1, 'first')
+            second = outbox.send_group_msg(1, 'second')
+            third = outbox.send_group_msg(1, 'third')
+            self.assertTrue(second.cancel())
+            first.result(10)
+            third.result(10)
+        finally:
+            outbox.close()
+        self.assertEqual(self.received(1), ['first', 'third'])
+
+    def test_close_timeout_cancels_pending(self):
+        outbox = Outbox(rate=1000, per_conversation_rate=0.5, per_conversation_burst=1)
+        futures = [outbox.send_group_msg(1, f'part{i}') for i in range(4)]
+        start = time.monotonic()
+        cancelled = outbox.close(timeout=0.5)
+        self.assertLess(time.monotonic() - start, 3)
+        self.assertEqual(cancelled, 3)
+        self.assertTrue(all(future.cancelled() for future in futures[1:]))
+        self.assertEqual(self.received(1), ['part0'])
+        with self.assertRaises(RuntimeError):
+            outbox.send_group_msg(1, 'closed')
+
+    def run_exit_script(self, directory: str) -> tuple[subprocess.CompletedProcess, float]:
+        start = time.monotonic()
+        process = subprocess.run(
+            [sys.executable, '-c', EXIT_SCRIPT], cwd=directory, capture_output=True, text=True, timeout=30
+        )
+        return process, time.monotonic() - start
+
+    def test_process_exits_with_sends_queued(self):
+        process, _ = self.run_exit_script(WORKDIR)
+        self.assertEqual(process.returncode, 0, process.stderr)
+        self.assertGreater(int(process.stdout), 0)
+        self.assertEqual(process.stderr, '')
+        self.assertEqual(self.received(1), [f'exit{i}' for i in range(6)])
+
+    def test_messages_sent_at_exit_are_saved(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'bot.sqlite3')
+            write_config(directory, database=dict(CONFIG['database'], available=True, backend='sqlite', path=path))
+            process, _ = self.run_exit_script(directory)
+            self.assertEqual(process.returncode, 0, process.stderr)
+            with sqlite3.connect(path) as connection:
+                saved = connection.execute('SELECT message FROM message ORDER BY message_id').fetchall()
+            connection.close()
+        self.assertEqual(process.stderr, '')
+        self.assertEqual([message for message, in saved], [f'exit{i}' for i in range(6)])
+
+    def test_process_exit_is_bounded(self):
+        with tempfile.TemporaryDirectory() as directory:
+            write_config(directory, outbox={'per_conversation_rate': 0.2, 'shutdown_timeout': 0.5})
+            process, elapsed = self.run_exit_script(directory)
+        self.assertEqual(process.returncode, 0, process.stderr)
+        self.assertLess(elapsed, 10)
+        self.assertEqual(process.stderr, '')
+        self.assertEqual(self.received(1), [f'exit{i}' for i in range(3)])
+
+
+if __name__ == '__main__':
+    unittest.main()
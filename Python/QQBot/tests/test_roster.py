@@ -0,0 +1,51 @@
+import unittest
+from tests import gocqhttp
+from bot_event import Event, EventServer, NoticeEvent
+from bot_roster import Roster
+
+
+class RosterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = gocqhttp()
+        self.server.payload = 500
+        self.roster = Roster()
+        self.events = EventServer(port=0, workers=1, reply_deadline=0)
+        self.events.add_handler(self.roster, NoticeEvent)
+        self.events.start()
+
+    def tearDown(self):
+        self.events.stop()
+        self.server.payload = 256
+
+    def notice(self, notice_type: str, user_id: int, **data) -> None:
+        self.events.dispatch(Event.parse(
+            dict(data, post_type='notice', notice_type=notice_type, group_id=1, user_id=user_id, self_id=1)
+        ))
+
+    def test_notices_update_loaded_group(self):
+        group = self.roster.group(1)
+        self.assertEqual(len(group), 5)
+        self.assertIn(10000, group)
+        self.notice('group_decrease', 10000, sub_type='leave')
+        self.assertNotIn(10000, group)
+        self.notice('group_increase', 20000, sub_type='approve')
+        self.assertIn(20000, group)
+        self.notice('group_card', 10001, card_new='Alice')
+        self.assertEqual([member.user_id for member in group.find('ali')], [10001])
+        self.notice('group_admin', 10002, sub_type='set')
+        self.assertEqual([member.user_id for member in group.with_role('admin')], [10002])
+
+    def test_bot_removed_forgets_group(self):
+        self.roster.group(1)
+        self.notice('group_decrease', 1, sub_type='kick_me')
+        self.assertFalse(self.roster.loaded(1))
+
+    def test_unloaded_group_ignored(self):
+        self.assertFalse(self.roster.handle_notice({'post_type': 'notice', 'notice_type': 'group_increase',
+                                                    'group_id': 2, 'user_id': 20000}))
+        self.assertFalse(self.roster.loaded(2))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,149 @@
+import os
+import json
+import unittest
+from types import SimpleNamespace
+from tests import WORKDIR
+from bot_router import Rest, Router, UsageError
+
+
+class Operation(object):
+    help = ''
+    commands: tuple[str, ...] = ()
+
+    def __init__(self, rev):
+        self.rev = rev
+
+    @classmethod
+    def get_help(cls):
+        return cls.help
+
+
+class Draw(Operation):
+    """
+    与bot_operation.Drawer相同的声明
+    """
+    help = '-s 画图'
+    commands = ('-s', '--stablediffusion')
+    choices = ('-e', '-i', '-p', '-t')
+    options = {'-r': ('upscaling_resize', int), '-b': ('batch_size', int), '-j': ('json', Rest)}
+
+    @classmethod
+    def from_command(cls, command, api, user_id, group_id=None):
+        if 'json' in command.args:
+            try:
+                return Draw(json.loads(command.args['json']))
+            except ValueError:
+                raise UsageError('-j的参数不是有效的JSON') from None
+        return Draw((command.choice, command.args, command.text))
+
+
+class Status(Operation):
+    help = '--sys 状态'
+    commands = ('--sys',)
+    flags = {'-d': 'detail'}
+
+    @classmethod
+    def from_command(cls, command, api, user_id, group_id=None):
+        return Status((command.args, command.text))
+
+
+class Picture(Operation):
+    help = '--pic 图片'
+    commands = ('--pic',)
+
+    @classmethod
+    def from_command(cls, command, api, user_id, group_id=None):
+        return Picture([os.path.join(WORKDIR, name) for name in command.text.split()])
+
+
+class RouterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.router = Router([Draw, Status, Picture])
+
+    def test_not_a_command(self):
+        self.assertIsNone(self.router.parse('hello'))
+        self.assertIsNone(self.router.parse('-x'))
+        self.assertIsNone(self.router.parse('--system'))
+
+    def test_options_before_text(self):
+        command = self.router.parse('-s -t -b 2 a cat')
+        self.assertEqual((command.choice, command.args, command.text), ('-t', {'batch_size': 2}, 'a cat'))
+
+    def test_options_after_text(self):
+        command = self.router.parse('-s -i [CQ:image,url=x] -b 2 a  cat -r 3')
+        self.assertEqual(command.choice, '-i')
+        self.assertEqual(command.args, {'batch_size': 2, 'upscaling_resize': 3})
+        self.assertEqual(command.text, '[CQ:image,url=x] a  cat')
+
+    def test_choice_and_help_only_before_text(self):
+        command = self.router.parse('-s -t a -e b -h')
+        self.assertEqual((command.choice, command.help, command.text), ('-t', False, 'a -e b -h'))
+        self.assertTrue(self.router.parse('-s -t -h').help)
+
+    def test_rest_option(self):
+        command = self.router.parse('-s -i [CQ:image,url=x] -j {"prompt": "a -b cat", "batch_size": 2}')
+        self.assertEqual(command.text, '[CQ:image,url=x]')
+        self.assertEqual(json.loads(command.args['json']), {'prompt': 'a -b cat', 'batch_size': 2})
+        self.assertTrue(self.router.parse('-s -t -j -h').help)
+
+    def test_errors(self):
+        self.assertEqual(self.router.parse('-s -t -b x').error, '参数batch_size的值x无效')
+        self.assertEqual(self.router.parse('-s -t cat -b').error, '参数batch_size缺少值')
+        self.assertEqual(self.router.parse('-s cat').error, '缺少子指令')
+
+    def test_dispatch(self):
+        self.assertEqual(self.router.dispatch('--sys -d now', None, 1), ({'detail': True}, 'now'))
+        self.assertEqual(self.router.dispatch('--sys now -d', None, 1), ({'detail': True}, 'now'))
+        self.assertEqual(self.router.dispatch('-s -t -j {"a": 1}', None, 1), {'a': 1})
+        self.assertEqual(self.router.dispatch('-s -t -j {bad', None, 1), '-j的参数不是有效的JSON\n-s 画图')
+        self.assertEqual(self.router.dispatch('-s -t -b', None, 1), '参数batch_size缺少值\n-s 画图')
+        self.assertIsNone(self.router.dispatch('hello', None, 1))
+
+    def test_handler_replies(self):
+        handle = self.router.handler(None)
+        path = os.path.join(WORKDIR, 'picture.png')
+        with open(path, 'wb'):
+            pass
+
+        def reply(message: str):
+            return handle(SimpleNamespace(raw_message=message, user_id=1, group_id=2))
+
+        self.assertEqual(reply('--sys -h'), '--sys 状态')
+        self.assertEqual(reply('--pic picture.png'), f'[CQ:image,file=file:///{path}]')
+        self.assertIsNone(reply('--pic missing.png'))
+        self.assertIsNone(reply('--sys -d'))
+        self.assertIsNone(reply('hello'))
+
+    def test_from_base(self):
+        router = Router.from_base(Operation)
+        self.assertEqual(router.dispatch('--sys -d', None, 1), ({'detail': True}, ''))
+
+        class Base(Operation):
+            @classmethod
+            def from_command(cls, command, api, user_id, group_id=None):
+                raise NotImplementedError
+
+        class Implemented(Base):
+            commands = ('--done',)
+
+            @classmethod
+            def from_command(cls, command, api, user_id, group_id=None):
+                return Implemented('done')
+
+        class Inherited(Implemented):
+            commands = ('--again',)
+
+        class Unfinished(Base):
+            commands = ('--todo',)
+
+        with self.assertRaises(TypeError):
+            Router.from_base(Base)
+        Unfinished.commands = ()
+        router = Router.from_base(Base)
+        self.assertEqual(router.dispatch('--again', None, 1), 'done')
+        self.assertIsNone(router.dispatch('--todo', None, 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
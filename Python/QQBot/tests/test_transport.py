@@ -0,0 +1,30 @@
+import time
+import socket
+import unittest
+from tests import CONFIG  # noqa: F401, 先写入配置文件
+from bot_transport import TransportError, WebSocketTransport
+
+
+class WebSocketTransportTest(unittest.TestCase):
+
+    def setUp(self):
+        # 没有监听的端口, 连接立即失败后等待很久才重连
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            port = sock.getsockname()[1]
+        self.transport = WebSocketTransport(f'ws://127.0.0.1:{port}/api', timeout=1, reconnect_interval=60)
+
+    def tearDown(self):
+        self.transport.close()
+
+    def test_disconnected_after_wait(self):
+        time.sleep(0.2)
+        # 模拟等待连接期间连接建立后又断开: __connected已设置, __ws已被__run置为None
+        loop = self.transport._WebSocketTransport__loop
+        loop.call_soon_threadsafe(self.transport._WebSocketTransport__connected.set)
+        with self.assertRaises(TransportError):
+            self.transport.post('get_status', {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,40 @@
+import os
+import unittest
+from tests import WORKDIR, gocqhttp
+from bot_upload import Uploader
+
+
+class UploaderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = gocqhttp()
+        self.file = os.path.join(WORKDIR, 'upload.txt')
+        with open(self.file, 'wb') as file:
+            file.write(b'x' * 1000)
+        self.uploader = Uploader()
+
+    def tearDown(self):
+        self.uploader.close()
+
+    def test_group_file_uploaded_once(self):
+        first = self.uploader.upload_group_file(self.file, [1, 2, 2])
+        self.assertEqual((first.uploaded, first.skipped, first.errors), ([1, 2], [], {}))
+        second = self.uploader.upload_group_file(self.file, [1, 2, 3])
+        self.assertEqual((second.uploaded, second.skipped), ([3], [1, 2]))
+        self.assertEqual(second.bytes_saved, 2000)
+
+    def test_group_file_force_and_forget(self):
+        self.uploader.upload_group_file(self.file, [1])
+        self.assertEqual(self.uploader.upload_group_file(self.file, [1], force=True).uploaded, [1])
+        self.assertEqual(self.uploader.upload_group_file(self.file, [1]).skipped, [1])
+        self.uploader.forget()
+        self.assertEqual(self.uploader.upload_group_file(self.file, [1]).uploaded, [1])
+
+    def test_private_file_sent_every_time(self):
+        for _ in range(2):
+            result = self.uploader.upload_private_file(self.file, [10000])
+            self.assertEqual((result.uploaded, result.skipped), ([10000], []))
+
+
+if __name__ == '__main__':
+    unittest.main()